@@ -1,6 +1,7 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from .jwt_handler import verify_token
+from .user_cache import principal_cache
 from database.mongodb import DatabaseOperations
 from models.user import User, UserRole
 from typing import Optional
@@ -29,7 +30,24 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
                 headers={"WWW-Authenticate": "Bearer"},
             )
         
-        user_data = await DatabaseOperations.get_document("users", {"id": user_id})
+        # Serve the user document from the principal cache when possible
+        iat = payload.get("iat") if isinstance(payload, dict) else None
+        cached, user_data = principal_cache.get(user_id, iat)
+        if not cached:
+            user_data = await DatabaseOperations.get_document("users", {"id": user_id})
+            if user_data:
+                # Clean up invalid data
+                if user_data.get('status') == 'online':
+                    user_data['status'] = 'active'
+                
+                # Fix invalid datetime strings
+                if user_data.get('last_active') == 'datetime.utcnow()':
+                    user_data['last_active'] = None
+                
+                principal_cache.set(user_id, iat, user_data)
+            else:
+                principal_cache.set_missing(user_id, iat)
+        
         if not user_data:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -46,14 +64,6 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
                 headers={"WWW-Authenticate": "Bearer"},
             )
         
-        # Clean up invalid data
-        if user_data.get('status') == 'online':
-            user_data['status'] = 'active'
-        
-        # Fix invalid datetime strings
-        if user_data.get('last_active') == 'datetime.utcnow()':
-            user_data['last_active'] = None
-        
         # Ensure organization_id exists for backward compatibility
         if not user_data.get('organization_id'):
             # For existing users without organization_id, they need to be migrated
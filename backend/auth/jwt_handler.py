@@ -17,7 +17,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "iat": datetime.utcnow()})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -25,13 +25,30 @@ def verify_token(token: str):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub") or payload.get("user_id")
-        if user_id is None:
+        if user_id is None or payload.get("scope"):
+            # Scoped tokens (e.g. signed upload URLs) never authenticate a user
             return None
         # Return full payload for organization support
         return payload
     except jwt.PyJWTError:
         return None
 
+def create_scoped_token(subject: str, scope: str, expires_delta: timedelta, **claims) -> str:
+    """Short-lived token that only grants ``scope`` on ``subject`` (e.g. one screenshot upload)"""
+    expire = datetime.utcnow() + expires_delta
+    payload = {**claims, "sub": subject, "scope": scope, "exp": expire, "iat": datetime.utcnow()}
+    return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+
+def verify_scoped_token(token: str, scope: str, subject: str) -> Optional[dict]:
+    """Payload of a scoped token, or None when it is invalid, expired or for another scope/subject"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
+        return None
+    if payload.get("scope") != scope or payload.get("sub") != subject:
+        return None
+    return payload
+
 def hash_password(password: str):
     return pwd_context.hash(password)
 
@@ -41,6 +58,6 @@ def verify_password(plain_password: str, hashed_password: str):
 def create_refresh_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(days=7)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "iat": datetime.utcnow()})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
\ No newline at end of file
@@ -0,0 +1,31 @@
+"""
+HMAC-signed URLs for files served from /uploads
+
+A signed URL carries ``exp`` (unix time) and ``sig`` query parameters, so the
+file server can authorize a request without a database lookup. Expiry times
+are rounded up to whole ``ttl`` windows: every URL issued for a file within
+one window is identical, which keeps it cacheable by the browser.
+"""
+import base64
+import hashlib
+import hmac
+import time
+from typing import Optional
+
+from config import settings
+
+def _signature(path: str, expires: int) -> str:
+    digest = hmac.new(settings.SECRET_KEY.encode(), f"{path}\n{expires}".encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+def sign_path(path: str, ttl: Optional[int] = None) -> str:
+    """``path`` with ``exp`` and ``sig`` appended; valid for at least ``ttl`` seconds"""
+    ttl = ttl or settings.UPLOADS_URL_TTL_SECONDS
+    expires = (int(time.time()) // ttl + 2) * ttl
+    return f"{path}?exp={expires}&sig={_signature(path, expires)}"
+
+def verify_path(path: str, expires: Optional[int], signature: Optional[str]) -> bool:
+    """Whether ``signature`` was issued for ``path`` and has not expired"""
+    if expires is None or not signature or expires < time.time():
+        return False
+    return hmac.compare_digest(signature, _signature(path, expires))
@@ -0,0 +1,126 @@
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple, Set
+
+from config import settings
+
+# Sentinel stored for users that were looked up and not found
+_MISSING = object()
+
+class PrincipalCache:
+    """
+    In-process TTL/LRU cache of authenticated user documents
+
+    Entries are keyed by ``(user_id, iat)`` so a freshly issued token always
+    starts from a fresh lookup. Routes that change a user must call
+    ``invalidate(user_id)``; other workers pick the change up once ``ttl``
+    expires, which bounds how long a role change or deletion can lag.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 30.0, negative_ttl: float = 0.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[Tuple[str, Any], Tuple[float, Any]]" = OrderedDict()
+        self._keys_by_user: Dict[str, Set[Tuple[str, Any]]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.maxsize > 0
+
+    def get(self, user_id: str, iat: Any = None) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """
+        Look up a cached user document
+
+        Returns ``(True, document)`` on a hit, ``(True, None)`` on a negative hit
+        and ``(False, None)`` on a miss. Documents are returned as copies.
+        """
+        if not self.enabled:
+            return False, None
+
+        key = (user_id, iat)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return False, None
+
+        self._entries.move_to_end(key)
+        if value is _MISSING:
+            self.negative_hits += 1
+            return True, None
+
+        self.hits += 1
+        return True, dict(value)
+
+    def set(self, user_id: str, iat: Any, user_data: Dict[str, Any]):
+        """Cache a user document for ``ttl`` seconds"""
+        if self.enabled:
+            self._store((user_id, iat), dict(user_data), self.ttl)
+
+    def set_missing(self, user_id: str, iat: Any = None):
+        """Remember that a user does not exist (only when negative caching is enabled)"""
+        if self.enabled and self.negative_ttl > 0:
+            self._store((user_id, iat), _MISSING, self.negative_ttl)
+
+    def invalidate(self, user_id: str):
+        """Drop every cached entry for a user"""
+        keys = self._keys_by_user.pop(user_id, set())
+        for key in keys:
+            self._entries.pop(key, None)
+        if keys:
+            self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_user.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0
+        }
+
+    def _store(self, key: Tuple[str, Any], value: Any, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        self._keys_by_user.setdefault(key[0], set()).add(key)
+
+        while len(self._entries) > self.maxsize:
+            oldest_key, _ = self._entries.popitem(last=False)
+            self._discard_index(oldest_key)
+            self.evictions += 1
+
+    def _remove(self, key: Tuple[str, Any]):
+        self._entries.pop(key, None)
+        self._discard_index(key)
+
+    def _discard_index(self, key: Tuple[str, Any]):
+        keys = self._keys_by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[key[0]]
+
+# Global principal cache instance
+principal_cache = PrincipalCache(
+    maxsize=settings.USER_CACHE_MAX_SIZE,
+    ttl=settings.USER_CACHE_TTL_SECONDS,
+    negative_ttl=settings.USER_CACHE_NEGATIVE_TTL_SECONDS
+)
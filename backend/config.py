@@ -14,6 +14,23 @@ class Settings:
     MONGO_URL: str = os.getenv("MONGO_URL", "mongodb://localhost:27017")
     DB_NAME: str = os.getenv("DB_NAME", "hubstaff_clone")
     
+    # MongoDB connection pool settings (0 leaves the driver default)
+    MONGO_MAX_POOL_SIZE: int = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+    MONGO_MIN_POOL_SIZE: int = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+    MONGO_MAX_IDLE_TIME_MS: int = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "0"))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "0"))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "30000"))
+    MONGO_COMPRESSORS: str = os.getenv("MONGO_COMPRESSORS", "")  # e.g. "zstd,snappy,zlib"
+    MONGO_RETRY_READS: bool = os.getenv("MONGO_RETRY_READS", "true").lower() == "true"
+    MONGO_RETRY_WRITES: bool = os.getenv("MONGO_RETRY_WRITES", "true").lower() == "true"
+    
+    # MongoDB read preference routing
+    # Per-collection defaults, e.g. "productivity_reports=secondaryPreferred,analytics_cache=nearest"
+    MONGO_READ_PREFERENCES: str = os.getenv("MONGO_READ_PREFERENCES", "")
+    # Used by analytics aggregations over write-heavy collections such as time_entries
+    MONGO_ANALYTICS_READ_PREFERENCE: str = os.getenv("MONGO_ANALYTICS_READ_PREFERENCE", "primary")
+    MONGO_MAX_STALENESS_SECONDS: int = int(os.getenv("MONGO_MAX_STALENESS_SECONDS", "-1"))
+    
     # Frontend URL settings
     FRONTEND_URL: str = os.getenv("FRONTEND_URL", "http://localhost:3000")
     ENVIRONMENT: str = os.getenv("ENVIRONMENT", "development")
@@ -23,12 +40,105 @@ class Settings:
     STORAGE_TYPE: str = os.getenv("STORAGE_TYPE", "local")  # local, aws_s3, cloudinary
     UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", str(ROOT_DIR / "uploads"))
     MAX_FILE_SIZE: int = int(os.getenv("MAX_FILE_SIZE", "10485760"))  # 10MB default
+    UPLOADS_REQUIRE_SIGNED_URLS: bool = os.getenv("UPLOADS_REQUIRE_SIGNED_URLS", "true").lower() == "true"
+    UPLOADS_URL_TTL_SECONDS: int = int(os.getenv("UPLOADS_URL_TTL_SECONDS", "86400"))  # signed /uploads URL window
+    UPLOADS_ACCEL_REDIRECT_PREFIX: str = os.getenv("UPLOADS_ACCEL_REDIRECT_PREFIX", "")  # nginx internal location
+    
+    # Activity ingestion settings
+    ACTIVITY_BATCH_MAX_SAMPLES: int = int(os.getenv("ACTIVITY_BATCH_MAX_SAMPLES", "5000"))
+    ACTIVITY_BATCH_MAX_BYTES: int = int(os.getenv("ACTIVITY_BATCH_MAX_BYTES", "5242880"))  # 5MB decompressed
+    
+    # Write-behind buffer for telemetry collections
+    WRITE_BUFFER_ENABLED: bool = os.getenv("WRITE_BUFFER_ENABLED", "true").lower() == "true"
+    WRITE_BUFFER_MAX_BATCH: int = int(os.getenv("WRITE_BUFFER_MAX_BATCH", "500"))
+    WRITE_BUFFER_FLUSH_INTERVAL: float = float(os.getenv("WRITE_BUFFER_FLUSH_INTERVAL", "1.0"))  # seconds
+    WRITE_BUFFER_MAX_PENDING: int = int(os.getenv("WRITE_BUFFER_MAX_PENDING", "5000"))
+
+    # Rebuild time_entry_daily_rollups from history at startup when the collection is empty
+    TIME_ROLLUPS_BACKFILL: bool = os.getenv("TIME_ROLLUPS_BACKFILL", "true").lower() == "true"
+    
+    # Background report jobs
+    REPORT_JOB_WORKERS: int = int(os.getenv("REPORT_JOB_WORKERS", "2"))
+    REPORT_JOB_CHUNK_ROWS: int = int(os.getenv("REPORT_JOB_CHUNK_ROWS", "5000"))
+    REPORT_JOB_TIMEOUT_SECONDS: int = int(os.getenv("REPORT_JOB_TIMEOUT_SECONDS", "600"))
+    REPORT_JOB_TTL_HOURS: int = int(os.getenv("REPORT_JOB_TTL_HOURS", "24"))
+    REPORT_JOB_MAX_QUEUED_PER_ORG: int = int(os.getenv("REPORT_JOB_MAX_QUEUED_PER_ORG", "20"))
+    REPORT_JOB_POLL_INTERVAL: float = float(os.getenv("REPORT_JOB_POLL_INTERVAL", "2.0"))  # seconds
+    REPORT_JOB_CLEANUP_INTERVAL_SECONDS: float = float(os.getenv("REPORT_JOB_CLEANUP_INTERVAL_SECONDS", "300"))
+    
+    # Process pool for screenshot image processing
+    IMAGE_POOL_WORKERS: int = int(os.getenv("IMAGE_POOL_WORKERS", str(min(os.cpu_count() or 1, 4))))
+    IMAGE_POOL_MAX_QUEUED: int = int(os.getenv("IMAGE_POOL_MAX_QUEUED", "32"))
+    IMAGE_POOL_JOB_TIMEOUT_SECONDS: float = float(os.getenv("IMAGE_POOL_JOB_TIMEOUT_SECONDS", "30"))
     
+    # Screenshot processing pipeline
+    SCREENSHOT_SPOOL_DIR: str = os.getenv("SCREENSHOT_SPOOL_DIR", str(ROOT_DIR / "spool" / "screenshots"))
+    SCREENSHOT_STAGE_CONCURRENCY: str = os.getenv("SCREENSHOT_STAGE_CONCURRENCY", "fetch=2,dedup=2,blur=2,thumbnail=2,analysis=2,upload=4")
+    SCREENSHOT_STAGE_MAX_ATTEMPTS: int = int(os.getenv("SCREENSHOT_STAGE_MAX_ATTEMPTS", "5"))
+    SCREENSHOT_STAGE_RETRY_SECONDS: float = float(os.getenv("SCREENSHOT_STAGE_RETRY_SECONDS", "5"))  # doubled per attempt
+    SCREENSHOT_STAGE_LEASE_SECONDS: int = int(os.getenv("SCREENSHOT_STAGE_LEASE_SECONDS", "120"))
+    # A host whose pipeline heartbeat is older than this is gone; its spooled work is taken over
+    SCREENSHOT_HOST_TIMEOUT_SECONDS: float = float(os.getenv("SCREENSHOT_HOST_TIMEOUT_SECONDS", "300"))
+    SCREENSHOT_PIPELINE_POLL_INTERVAL: float = float(os.getenv("SCREENSHOT_PIPELINE_POLL_INTERVAL", "2.0"))  # seconds
+    # Frames at least this similar (perceptual hash) to the previous one are flagged screen_unchanged; > 1 disables
+    SCREENSHOT_NEAR_DUPLICATE_SIMILARITY: float = float(os.getenv("SCREENSHOT_NEAR_DUPLICATE_SIMILARITY", "0.99"))
+    # Lifetime of presigned/signed direct upload URLs; unfinished reservations expire with them
+    SCREENSHOT_UPLOAD_URL_EXPIRY: int = int(os.getenv("SCREENSHOT_UPLOAD_URL_EXPIRY", "300"))  # seconds
+    
+    # Screenshot retention defaults (organization settings override them; 0 disables a phase)
+    RETENTION_SWEEPER_ENABLED: bool = os.getenv("RETENTION_SWEEPER_ENABLED", "true").lower() == "true"
+    RETENTION_SWEEP_INTERVAL_SECONDS: float = float(os.getenv("RETENTION_SWEEP_INTERVAL_SECONDS", "3600"))
+    RETENTION_BATCH_SIZE: int = int(os.getenv("RETENTION_BATCH_SIZE", "500"))
+    SCREENSHOT_ORIGINAL_RETENTION_DAYS: int = int(os.getenv("SCREENSHOT_ORIGINAL_RETENTION_DAYS", "7"))
+    SCREENSHOT_RETENTION_DAYS: int = int(os.getenv("SCREENSHOT_RETENTION_DAYS", "30"))
+    DELETED_SCREENSHOT_GRACE_DAYS: int = int(os.getenv("DELETED_SCREENSHOT_GRACE_DAYS", "1"))
+    
+    # WebSocket fan-out
+    WS_SEND_QUEUE_SIZE: int = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))  # messages per connection
+    WS_SEND_TIMEOUT_SECONDS: float = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "10"))
+    # Cross-worker fan-out and presence: memory (single process), redis or mongo (change streams)
+    WS_BACKPLANE: str = os.getenv("WS_BACKPLANE", "memory")
+    WS_BACKPLANE_CHANNEL_PREFIX: str = os.getenv("WS_BACKPLANE_CHANNEL_PREFIX", "hubstaff:ws")
+    # Workers republish their online users this often; remote users not refreshed for 3 intervals expire
+    WS_PRESENCE_HEARTBEAT_SECONDS: float = float(os.getenv("WS_PRESENCE_HEARTBEAT_SECONDS", "15"))
+    # Agent activity is merged per organization and pushed to managers once per tick
+    WS_ACTIVITY_TICK_SECONDS: float = float(os.getenv("WS_ACTIVITY_TICK_SECONDS", "0.5"))
+    WS_ACTIVITY_STALE_SECONDS: float = float(os.getenv("WS_ACTIVITY_STALE_SECONDS", "300"))
+    REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    
+    # Outbound HTTP (integrations and remote storage)
+    OUTBOUND_HTTP_MAX_CONNECTIONS: int = int(os.getenv("OUTBOUND_HTTP_MAX_CONNECTIONS", "20"))  # per integration
+    OUTBOUND_HTTP_MAX_KEEPALIVE: int = int(os.getenv("OUTBOUND_HTTP_MAX_KEEPALIVE", "10"))
+    OUTBOUND_HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("OUTBOUND_HTTP_KEEPALIVE_EXPIRY", "30"))  # seconds
+    OUTBOUND_HTTP_TIMEOUT: float = float(os.getenv("OUTBOUND_HTTP_TIMEOUT", "30"))  # seconds
+    OUTBOUND_HTTP_CONNECT_TIMEOUT: float = float(os.getenv("OUTBOUND_HTTP_CONNECT_TIMEOUT", "5"))  # seconds
+    OUTBOUND_HTTP_RETRIES: int = int(os.getenv("OUTBOUND_HTTP_RETRIES", "3"))
+    OUTBOUND_HTTP_BACKOFF_BASE: float = float(os.getenv("OUTBOUND_HTTP_BACKOFF_BASE", "0.5"))  # seconds
+    OUTBOUND_HTTP_BACKOFF_MAX: float = float(os.getenv("OUTBOUND_HTTP_BACKOFF_MAX", "10"))  # seconds
+    OUTBOUND_HTTP2: bool = os.getenv("OUTBOUND_HTTP2", "true").lower() == "true"  # needs the h2 package
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5"))
+    CIRCUIT_BREAKER_RESET_SECONDS: float = float(os.getenv("CIRCUIT_BREAKER_RESET_SECONDS", "30"))
+    
+    # Integration API endpoints (overridable to point at a stub server)
+    TRELLO_API_URL: str = os.getenv("TRELLO_API_URL", "https://api.trello.com/1")
+    GITHUB_API_URL: str = os.getenv("GITHUB_API_URL", "https://api.github.com")
+    CLOUDINARY_API_URL: str = os.getenv("CLOUDINARY_API_URL", "https://api.cloudinary.com/v1_1")
+    
+    # Authenticated user cache (per process, 0 disables)
+    USER_CACHE_TTL_SECONDS: float = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+    USER_CACHE_MAX_SIZE: int = int(os.getenv("USER_CACHE_MAX_SIZE", "10000"))
+    USER_CACHE_NEGATIVE_TTL_SECONDS: float = float(os.getenv("USER_CACHE_NEGATIVE_TTL_SECONDS", "5"))
+
     # AWS S3 settings (if using S3)
     AWS_ACCESS_KEY_ID: str = os.getenv("AWS_ACCESS_KEY_ID", "")
     AWS_SECRET_ACCESS_KEY: str = os.getenv("AWS_SECRET_ACCESS_KEY", "")
     AWS_REGION: str = os.getenv("AWS_REGION", "us-east-1")
     S3_BUCKET_NAME: str = os.getenv("S3_BUCKET_NAME", "")
+    S3_ENDPOINT_URL: str = os.getenv("S3_ENDPOINT_URL", "")  # S3-compatible endpoint (MinIO, moto), empty for AWS
+    S3_MULTIPART_THRESHOLD: int = int(os.getenv("S3_MULTIPART_THRESHOLD", str(8 * 1024 * 1024)))  # bytes
+    S3_MULTIPART_PART_SIZE: int = int(os.getenv("S3_MULTIPART_PART_SIZE", str(8 * 1024 * 1024)))  # bytes, min 5 MB
+    S3_MULTIPART_CONCURRENCY: int = int(os.getenv("S3_MULTIPART_CONCURRENCY", "4"))  # parts uploaded in parallel
+    S3_PRESIGNED_URL_EXPIRY: int = int(os.getenv("S3_PRESIGNED_URL_EXPIRY", "3600"))  # seconds
     
     # Cloudinary settings (FREE cloud storage)
     CLOUDINARY_CLOUD_NAME: str = os.getenv("CLOUDINARY_CLOUD_NAME", "")
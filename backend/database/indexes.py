@@ -0,0 +1,233 @@
+import asyncio
+import logging
+from typing import List, Dict, Any, Tuple
+
+from pymongo import IndexModel, ASCENDING, DESCENDING
+
+logger = logging.getLogger(__name__)
+
+def _index(*keys: Tuple[str, int], **options) -> IndexModel:
+    return IndexModel(list(keys), **options)
+
+# Declarative index registry, one entry per query shape used by the routes.
+# Compound indexes lead with the equality fields and end with the range/sort
+# field, so a single index serves both the filter and the sort.
+# `id` lookups are not unique here because legacy documents may lack the field.
+INDEX_REGISTRY: Dict[str, List[IndexModel]] = {
+    "users": [
+        _index(("email", ASCENDING), unique=True),
+        _index(("id", ASCENDING)),
+        _index(("organization_id", ASCENDING), ("role", ASCENDING)),
+    ],
+    "organizations": [
+        _index(("id", ASCENDING)),
+    ],
+    "projects": [
+        _index(("id", ASCENDING), ("organization_id", ASCENDING)),
+        _index(("organization_id", ASCENDING), ("status", ASCENDING)),
+        _index(("created_by", ASCENDING)),
+        _index(("team_members", ASCENDING)),
+    ],
+    "tasks": [
+        _index(("id", ASCENDING), ("organization_id", ASCENDING)),
+        _index(("project_id", ASCENDING), ("organization_id", ASCENDING)),
+        _index(("assignee_id", ASCENDING), ("organization_id", ASCENDING)),
+        _index(("status", ASCENDING)),
+    ],
+    "time_entries": [
+        _index(("id", ASCENDING)),
+        # Personal dashboards and reports: {user_id, organization_id, start_time range}
+        _index(("user_id", ASCENDING), ("organization_id", ASCENDING), ("start_time", DESCENDING)),
+        # Team dashboards and reports: {organization_id, start_time range}
+        _index(("organization_id", ASCENDING), ("start_time", DESCENDING)),
+        # Active timer lookups: {user_id, end_time: None}
+        _index(("user_id", ASCENDING), ("end_time", ASCENDING)),
+        _index(("project_id", ASCENDING)),
+    ],
+    # One document per (organization, user, project, day); dashboards scan by day range
+    "time_entry_daily_rollups": [
+        _index(("organization_id", ASCENDING), ("user_id", ASCENDING), ("day", ASCENDING), ("project_id", ASCENDING), unique=True),
+        _index(("organization_id", ASCENDING), ("day", ASCENDING)),
+    ],
+    "activity_sessions": [
+        _index(("id", ASCENDING)),
+        _index(("user_id", ASCENDING), ("organization_id", ASCENDING), ("time_entry_id", ASCENDING), ("session_end", ASCENDING)),
+    ],
+    "activity_data": [
+        _index(("user_id", ASCENDING)),
+        _index(("time_entry_id", ASCENDING)),
+        _index(("timestamp", ASCENDING)),
+    ],
+    "screenshots": [
+        _index(("id", ASCENDING)),
+        # Gallery listing: {organization_id, is_deleted, timestamp range}
+        _index(("organization_id", ASCENDING), ("is_deleted", ASCENDING), ("timestamp", DESCENDING)),
+        _index(("organization_id", ASCENDING), ("user_id", ASCENDING), ("timestamp", DESCENDING)),
+        _index(("time_entry_id", ASCENDING)),
+        # Screenshot pipeline claims; only in-flight screenshots have a stage
+        _index(("stage", ASCENDING), ("spool_host", ASCENDING), ("next_attempt_at", ASCENDING),
+               partialFilterExpression={"stage": {"$exists": True}}),
+        # Exact duplicate lookup
+        _index(("organization_id", ASCENDING), ("content_hash", ASCENDING),
+               partialFilterExpression={"content_hash": {"$exists": True}}),
+        # Retention: tier range scans, shared-file checks, soft-deleted and expired direct uploads
+        _index(("organization_id", ASCENDING), ("storage_tier", ASCENDING), ("timestamp", ASCENDING)),
+        _index(("organization_id", ASCENDING), ("stored_hash", ASCENDING),
+               partialFilterExpression={"stored_hash": {"$exists": True}}),
+        _index(("organization_id", ASCENDING), ("deleted_at", ASCENDING),
+               partialFilterExpression={"is_deleted": True}),
+        _index(("status", ASCENDING), ("upload_expires_at", ASCENDING),
+               partialFilterExpression={"upload_expires_at": {"$exists": True}}),
+    ],
+    "screenshot_pipeline_hosts": [
+        _index(("host", ASCENDING), unique=True),
+    ],
+    "storage_objects": [
+        _index(("ref", ASCENDING), unique=True),
+    ],
+    # WebSocket backplane messages (WS_BACKPLANE=mongo) only need to outlive the change stream read
+    "ws_backplane": [
+        _index(("created_at", ASCENDING), expireAfterSeconds=300),
+    ],
+    "monitoring_settings": [
+        _index(("id", ASCENDING)),
+        _index(("organization_id", ASCENDING), ("user_id", ASCENDING)),
+    ],
+    "password_reset_tokens": [
+        _index(("email", ASCENDING)),
+        _index(("token", ASCENDING), unique=True),
+        _index(("expires_at", ASCENDING)),
+    ],
+    "real_time_activity": [
+        _index(("organization_id", ASCENDING), ("user_id", ASCENDING)),
+        _index(("organization_id", ASCENDING), ("tracking_status", ASCENDING)),
+        _index(("time_entry_id", ASCENDING)),
+    ],
+    "productivity_reports": [
+        _index(("organization_id", ASCENDING), ("user_id", ASCENDING)),
+        _index(("organization_id", ASCENDING), ("report_date", DESCENDING)),
+    ],
+    "productivity_alerts": [
+        _index(("organization_id", ASCENDING), ("is_read", ASCENDING)),
+        _index(("organization_id", ASCENDING), ("user_id", ASCENDING)),
+        _index(("triggered_at", ASCENDING)),
+    ],
+    "keyboard_activity": [
+        _index(("organization_id", ASCENDING), ("user_id", ASCENDING)),
+        _index(("organization_id", ASCENDING), ("time_entry_id", ASCENDING)),
+        _index(("timestamp", ASCENDING)),
+    ],
+    "mouse_activity": [
+        _index(("organization_id", ASCENDING), ("user_id", ASCENDING)),
+        _index(("organization_id", ASCENDING), ("time_entry_id", ASCENDING)),
+        _index(("timestamp", ASCENDING)),
+    ],
+    "screenshot_analysis": [
+        _index(("organization_id", ASCENDING), ("user_id", ASCENDING)),
+        _index(("screenshot_id", ASCENDING)),
+        _index(("analysis_timestamp", ASCENDING)),
+    ],
+    "report_jobs": [
+        _index(("id", ASCENDING)),
+        # One live job per identical request; failed and expired jobs drop the key
+        _index(("dedup_key", ASCENDING), unique=True, partialFilterExpression={"dedup_key": {"$exists": True}}),
+        _index(("status", ASCENDING), ("created_at", ASCENDING)),
+        _index(("organization_id", ASCENDING), ("status", ASCENDING)),
+        # Chunk cleanup of expired jobs
+        _index(("status", ASCENDING), ("expires_at", ASCENDING)),
+    ],
+    "integrations": [
+        _index(("user_id", ASCENDING), ("type", ASCENDING), ("active", ASCENDING)),
+    ],
+    "invitations": [
+        _index(("token", ASCENDING)),
+        _index(("organization_id", ASCENDING)),
+    ],
+}
+
+def _key(spec) -> Tuple[Tuple[str, Any], ...]:
+    """Normalize an index key (SON, dict or list of pairs) into a tuple of (field, direction)"""
+    items = spec.items() if hasattr(spec, "items") else spec
+    return tuple((field, direction) for field, direction in items)
+
+def _is_prefix(shorter: Tuple, longer: Tuple) -> bool:
+    return len(shorter) < len(longer) and longer[:len(shorter)] == shorter
+
+class IndexAdvisor:
+    """
+    Compares INDEX_REGISTRY with the indexes that exist in MongoDB
+
+    ``plan()`` reports, per collection, the registered indexes that are missing
+    and the existing indexes that are a strict key prefix of another index
+    (and are therefore redundant for queries). ``apply()`` builds the missing
+    indexes; redundant ones are only reported, never dropped automatically.
+    """
+
+    def __init__(self, database, registry: Dict[str, List[IndexModel]] = None):
+        self.database = database
+        self.registry = INDEX_REGISTRY if registry is None else registry
+
+    async def existing_indexes(self, collection: str) -> List[Dict[str, Any]]:
+        cursor = self.database[collection].list_indexes()
+        return [index async for index in cursor]
+
+    async def plan(self) -> Dict[str, Dict[str, Any]]:
+        report = {}
+        for collection, models in self.registry.items():
+            existing = await self.existing_indexes(collection)
+            existing_keys = {_key(index["key"]) for index in existing}
+
+            missing = [model for model in models if _key(model.document["key"]) not in existing_keys]
+
+            # Indexes that will exist once the missing ones are built
+            all_keys = existing_keys | {_key(model.document["key"]) for model in models}
+            redundant = []
+            for index in existing:
+                key = _key(index["key"])
+                if index["name"] == "_id_" or index.get("unique"):
+                    continue
+                covered_by = [other for other in all_keys if _is_prefix(key, other)]
+                if covered_by:
+                    redundant.append({
+                        "name": index["name"],
+                        "key": list(key),
+                        "covered_by": [list(other) for other in covered_by]
+                    })
+
+            if missing or redundant:
+                report[collection] = {"missing": missing, "redundant": redundant}
+        return report
+
+    async def apply(self, report: Dict[str, Dict[str, Any]] = None) -> Dict[str, Dict[str, Any]]:
+        """Build every missing index and log redundant ones, returning the plan"""
+        if report is None:
+            report = await self.plan()
+
+        for collection, entry in report.items():
+            if entry["missing"]:
+                names = [model.document["name"] for model in entry["missing"]]
+                try:
+                    await self.database[collection].create_indexes(entry["missing"])
+                    logger.info(f"Built indexes on {collection}: {names}")
+                except Exception as e:
+                    logger.error(f"Failed to build indexes on {collection} {names}: {e}")
+
+            for index in entry["redundant"]:
+                logger.warning(
+                    f"Index {collection}.{index['name']} is a prefix of {index['covered_by']} "
+                    f"and can be dropped"
+                )
+
+        if not report:
+            logger.info("Database indexes match the registry")
+        return report
+
+    def start(self) -> asyncio.Task:
+        """Run the advisor in the background so startup does not wait on index builds"""
+        return asyncio.create_task(self._run())
+
+    async def _run(self):
+        try:
+            await self.apply()
+        except Exception as e:
+            logger.error(f"Index advisor failed: {e}")
@@ -0,0 +1,52 @@
+from typing import Optional, Dict, Any, Iterable
+
+from database.mongodb import DatabaseOperations
+
+def _get_path(row: Dict[str, Any], path: str) -> Any:
+    """Resolve a dotted path such as "_id.user_id" inside an aggregation row"""
+    value = row
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+async def fetch_related(
+    rows: Iterable[Dict[str, Any]],
+    path: str,
+    collection: str,
+    organization_id: Optional[str] = None,
+    projection: Dict[str, Any] = None,
+    id_field: str = "id"
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Batch-load the documents referenced by ``path`` in ``rows`` with one $in query
+
+    Returns a dict keyed by the referenced id. When ``organization_id`` is given,
+    only documents from that organization are returned.
+    """
+    ids = [_get_path(row, path) for row in rows]
+    query = {"organization_id": organization_id} if organization_id else None
+    return await DatabaseOperations.find_by_ids(
+        collection, ids, id_field=id_field, query=query, projection=projection
+    )
+
+async def fetch_users(
+    rows: Iterable[Dict[str, Any]],
+    path: str = "user_id",
+    organization_id: Optional[str] = None,
+    fields: Iterable[str] = ("name",)
+) -> Dict[str, Dict[str, Any]]:
+    """Batch-load users referenced by ``path`` (never returns password hashes)"""
+    projection = {field: 1 for field in fields if field != "password"} or {"password": 0}
+    return await fetch_related(rows, path, "users", organization_id, projection)
+
+async def fetch_projects(
+    rows: Iterable[Dict[str, Any]],
+    path: str = "project_id",
+    organization_id: Optional[str] = None,
+    fields: Iterable[str] = ("name",)
+) -> Dict[str, Dict[str, Any]]:
+    """Batch-load projects referenced by ``path``"""
+    projection = {field: 1 for field in fields}
+    return await fetch_related(rows, path, "projects", organization_id, projection or None)
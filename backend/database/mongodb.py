@@ -1,28 +1,113 @@
 from motor.motor_asyncio import AsyncIOMotorClient
-from typing import Optional, List, Dict, Any
+from pymongo import InsertOne, UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
+from typing import Optional, List, Dict, Any, Iterable, Sequence
 import os
 from datetime import datetime
 import logging
+from config import settings
+from database.indexes import IndexAdvisor
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of operations or $in values sent to MongoDB in one request
+BULK_CHUNK_SIZE = 1000
+
+# Read preference modes accepted in settings (case-insensitive)
+READ_PREFERENCE_MODES = {
+    "primary": Primary,
+    "primarypreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondarypreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
 class MongoDB:
     client: Optional[AsyncIOMotorClient] = None
     database = None
+    # Per-collection default read preference mode, from MONGO_READ_PREFERENCES
+    read_preferences: Dict[str, str] = {}
+    # Collection handles bound to a non-default read preference
+    routed_collections: Dict[tuple, Any] = {}
+    # Background index advisor run started at connect time
+    index_task = None
 
 db = MongoDB()
 
+def make_read_preference(mode: str):
+    """Build a pymongo read preference from a mode name such as secondaryPreferred"""
+    preference_class = READ_PREFERENCE_MODES.get(mode.strip().lower())
+    if preference_class is None:
+        raise ValueError(f"Unknown MongoDB read preference: {mode}")
+    if preference_class is Primary:
+        return Primary()
+    return preference_class(max_staleness=settings.MONGO_MAX_STALENESS_SECONDS)
+
+def parse_read_preferences(value: str) -> Dict[str, str]:
+    """Parse "collection=mode,collection=mode" into a dict, validating every mode"""
+    preferences = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        collection, _, mode = item.partition("=")
+        make_read_preference(mode)
+        preferences[collection.strip()] = mode.strip()
+    return preferences
+
+def mongo_client_options() -> Dict[str, Any]:
+    """Connection pool and retry options for AsyncIOMotorClient, built from settings"""
+    options = {
+        "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+        "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "retryReads": settings.MONGO_RETRY_READS,
+        "retryWrites": settings.MONGO_RETRY_WRITES,
+    }
+    if settings.MONGO_MAX_IDLE_TIME_MS > 0:
+        options["maxIdleTimeMS"] = settings.MONGO_MAX_IDLE_TIME_MS
+    if settings.MONGO_WAIT_QUEUE_TIMEOUT_MS > 0:
+        options["waitQueueTimeoutMS"] = settings.MONGO_WAIT_QUEUE_TIMEOUT_MS
+    compressors = [c.strip() for c in settings.MONGO_COMPRESSORS.split(",") if c.strip()]
+    if compressors:
+        # zstd and snappy need the zstandard / python-snappy packages installed
+        options["compressors"] = compressors
+    return options
+
+def get_collection(collection: str, read_preference: Optional[str] = None):
+    """
+    Collection handle for reads, routed by read preference
+    
+    ``read_preference`` overrides the per-collection default from
+    MONGO_READ_PREFERENCES. Secondary reads may lag the primary, so only use
+    them where slightly stale results are acceptable (analytics, reports).
+    """
+    mode = read_preference or db.read_preferences.get(collection)
+    if not mode or mode.lower() == "primary":
+        return db.database[collection]
+    
+    key = (collection, mode)
+    handle = db.routed_collections.get(key)
+    if handle is None:
+        handle = db.database.get_collection(collection, read_preference=make_read_preference(mode))
+        db.routed_collections[key] = handle
+    return handle
+
 async def connect_to_mongo():
     """Create database connection"""
     try:
-        db.client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+        options = mongo_client_options()
+        db.read_preferences = parse_read_preferences(settings.MONGO_READ_PREFERENCES)
+        db.routed_collections = {}
+        db.client = AsyncIOMotorClient(os.environ["MONGO_URL"], **options)
         db.database = db.client[os.environ["DB_NAME"]]
+        logger.info(f"MongoDB client options: {options}, read preferences: {db.read_preferences or 'primary'}")
         
         # Test connection
         await db.database.command('ping')
         logger.info("Connected to MongoDB successfully")
         
-        # Create indexes
+        # Build missing indexes without blocking startup
         await create_indexes()
         
     except Exception as e:
@@ -31,81 +116,19 @@ async def connect_to_mongo():
 
 async def close_mongo_connection():
     """Close database connection"""
+    if db.index_task and not db.index_task.done():
+        db.index_task.cancel()
     if db.client:
         db.client.close()
         logger.info("Disconnected from MongoDB")
 
-async def create_indexes():
-    """Create database indexes for better performance"""
-    try:
-        # User indexes
-        await db.database.users.create_index("email", unique=True)
-        await db.database.users.create_index("role")
-        
-        # Project indexes
-        await db.database.projects.create_index("created_by")
-        await db.database.projects.create_index("status")
-        await db.database.projects.create_index("team_members")
-        
-        # Task indexes
-        await db.database.tasks.create_index("project_id")
-        await db.database.tasks.create_index("assignee_id")
-        await db.database.tasks.create_index("status")
-        
-        # Time entry indexes
-        await db.database.time_entries.create_index("user_id")
-        await db.database.time_entries.create_index("project_id")
-        await db.database.time_entries.create_index("start_time")
-        await db.database.time_entries.create_index([("user_id", 1), ("start_time", -1)])
-        
-        # Activity data indexes
-        await db.database.activity_data.create_index("user_id")
-        await db.database.activity_data.create_index("time_entry_id")
-        await db.database.activity_data.create_index("timestamp")
-        
-        # Screenshot indexes
-        await db.database.screenshots.create_index("user_id")
-        await db.database.screenshots.create_index("time_entry_id")
-        await db.database.screenshots.create_index("timestamp")
-        
-        # Password reset token indexes
-        await db.database.password_reset_tokens.create_index("email")
-        await db.database.password_reset_tokens.create_index("token", unique=True)
-        await db.database.password_reset_tokens.create_index("expires_at")
-        
-        # Productivity tracking indexes
-        await db.database.real_time_activity.create_index([("organization_id", 1), ("user_id", 1)])
-        await db.database.real_time_activity.create_index([("organization_id", 1), ("tracking_status", 1)])
-        await db.database.real_time_activity.create_index("time_entry_id")
-        
-        # Productivity reports indexes
-        await db.database.productivity_reports.create_index([("organization_id", 1), ("user_id", 1)])
-        await db.database.productivity_reports.create_index([("organization_id", 1), ("report_date", -1)])
-        
-        # Productivity alerts indexes
-        await db.database.productivity_alerts.create_index([("organization_id", 1), ("is_read", 1)])
-        await db.database.productivity_alerts.create_index([("organization_id", 1), ("user_id", 1)])
-        await db.database.productivity_alerts.create_index("triggered_at")
-        
-        # Keyboard activity indexes
-        await db.database.keyboard_activity.create_index([("organization_id", 1), ("user_id", 1)])
-        await db.database.keyboard_activity.create_index([("organization_id", 1), ("time_entry_id", 1)])
-        await db.database.keyboard_activity.create_index("timestamp")
-        
-        # Mouse activity indexes
-        await db.database.mouse_activity.create_index([("organization_id", 1), ("user_id", 1)])
-        await db.database.mouse_activity.create_index([("organization_id", 1), ("time_entry_id", 1)])
-        await db.database.mouse_activity.create_index("timestamp")
-        
-        # Screenshot analysis indexes
-        await db.database.screenshot_analysis.create_index([("organization_id", 1), ("user_id", 1)])
-        await db.database.screenshot_analysis.create_index("screenshot_id")
-        await db.database.screenshot_analysis.create_index("analysis_timestamp")
-        
-        logger.info("Database indexes created successfully")
-        
-    except Exception as e:
-        logger.error(f"Failed to create indexes: {e}")
+async def create_indexes(background: bool = True):
+    """Diff INDEX_REGISTRY against the database and build missing indexes"""
+    advisor = IndexAdvisor(db.database)
+    if background:
+        db.index_task = advisor.start()
+        return None
+    return await advisor.apply()
 
 # Database operations
 class DatabaseOperations:
@@ -117,9 +140,10 @@ class DatabaseOperations:
         return str(result.inserted_id)
     
     @staticmethod
-    async def get_document(collection: str, query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    async def get_document(collection: str, query: Dict[str, Any],
+                         read_preference: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """Get a single document from the collection"""
-        result = await db.database[collection].find_one(query)
+        result = await get_collection(collection, read_preference).find_one(query)
         if result:
             result["_id"] = str(result["_id"])
         return result
@@ -127,12 +151,13 @@ class DatabaseOperations:
     @staticmethod
     async def get_documents(collection: str, query: Dict[str, Any] = None, 
                           sort: List = None, limit: int = None, skip: int = 0,
-                          projection: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+                          projection: Dict[str, Any] = None,
+                          read_preference: Optional[str] = None) -> List[Dict[str, Any]]:
         """Get multiple documents from the collection"""
         if query is None:
             query = {}
         
-        cursor = db.database[collection].find(query, projection)
+        cursor = get_collection(collection, read_preference).find(query, projection)
         
         if sort:
             cursor = cursor.sort(sort)
@@ -177,6 +202,17 @@ class DatabaseOperations:
         result = await db.database[collection].update_many(query, {"$set": update})
         return result.modified_count
     
+    @staticmethod
+    async def find_one_and_update(collection: str, query: Dict[str, Any], update: Dict[str, Any],
+                                sort: List = None, upsert: bool = False) -> Optional[Dict[str, Any]]:
+        """Atomically update one document and return it as it is after the update"""
+        result = await db.database[collection].find_one_and_update(
+            query, update, sort=sort, upsert=upsert, return_document=ReturnDocument.AFTER
+        )
+        if result:
+            result["_id"] = str(result["_id"])
+        return result
+    
     @staticmethod
     async def delete_document(collection: str, query: Dict[str, Any]) -> bool:
         """Delete a document from the collection"""
@@ -184,22 +220,135 @@ class DatabaseOperations:
         return result.deleted_count > 0
     
     @staticmethod
-    async def count_documents(collection: str, query: Dict[str, Any] = None) -> int:
+    async def bulk_write(collection: str, operations: Sequence[Any], ordered: bool = True,
+                       chunk_size: int = BULK_CHUNK_SIZE) -> Dict[str, Any]:
+        """
+        Run pymongo write operations (InsertOne, UpdateOne, ReplaceOne, DeleteOne, ...)
+        in chunks and report the combined result.
+        
+        Errors are reported per operation with their index in ``operations`` instead
+        of being raised. In ordered mode execution stops at the first failed operation;
+        in unordered mode every chunk is attempted.
+        """
+        result = {
+            "inserted_count": 0,
+            "matched_count": 0,
+            "modified_count": 0,
+            "deleted_count": 0,
+            "upserted_count": 0,
+            "upserted_ids": {},
+            "errors": []
+        }
+        
+        for offset in range(0, len(operations), chunk_size):
+            chunk = list(operations[offset:offset + chunk_size])
+            try:
+                chunk_result = await db.database[collection].bulk_write(chunk, ordered=ordered)
+                details = chunk_result.bulk_api_result
+            except BulkWriteError as e:
+                details = e.details
+            
+            result["inserted_count"] += details.get("nInserted", 0)
+            result["matched_count"] += details.get("nMatched", 0)
+            result["modified_count"] += details.get("nModified", 0)
+            result["deleted_count"] += details.get("nRemoved", 0)
+            result["upserted_count"] += details.get("nUpserted", 0)
+            for upsert in details.get("upserted", []):
+                result["upserted_ids"][offset + upsert["index"]] = str(upsert["_id"])
+            for error in details.get("writeErrors", []):
+                result["errors"].append({
+                    "index": offset + error["index"],
+                    "code": error.get("code"),
+                    "message": error.get("errmsg")
+                })
+            
+            if ordered and details.get("writeErrors"):
+                break
+        
+        if result["errors"]:
+            logger.warning(f"Bulk write on {collection} finished with {len(result['errors'])} errors")
+        
+        return result
+    
+    @staticmethod
+    async def insert_many(collection: str, documents: List[Dict[str, Any]], ordered: bool = False,
+                        chunk_size: int = BULK_CHUNK_SIZE) -> Dict[str, Any]:
+        """Insert documents in chunks, reporting per-document errors instead of raising"""
+        return await DatabaseOperations.bulk_write(
+            collection,
+            [InsertOne(document) for document in documents],
+            ordered=ordered,
+            chunk_size=chunk_size
+        )
+    
+    @staticmethod
+    async def upsert_many(collection: str, documents: List[Dict[str, Any]],
+                        key_fields: Iterable[str] = ("id",), ordered: bool = False,
+                        chunk_size: int = BULK_CHUNK_SIZE) -> Dict[str, Any]:
+        """Insert or update documents matched on ``key_fields`` (``$set`` semantics)"""
+        key_fields = tuple(key_fields)
+        now = datetime.utcnow()
+        operations = []
+        for document in documents:
+            fields = {k: v for k, v in document.items() if k != "_id"}
+            fields["updated_at"] = now
+            operations.append(UpdateOne(
+                {key: document[key] for key in key_fields},
+                {"$set": fields},
+                upsert=True
+            ))
+        return await DatabaseOperations.bulk_write(collection, operations, ordered=ordered, chunk_size=chunk_size)
+    
+    @staticmethod
+    async def find_by_ids(collection: str, ids: Iterable[str], id_field: str = "id",
+                        query: Dict[str, Any] = None, projection: Dict[str, Any] = None,
+                        chunk_size: int = BULK_CHUNK_SIZE,
+                        read_preference: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """Fetch documents whose ``id_field`` is in ``ids`` and return them keyed by that field"""
+        unique_ids = list(dict.fromkeys(i for i in ids if i is not None))
+        if projection and id_field not in projection and all(projection.values()):
+            projection = {**projection, id_field: 1}
+        
+        documents = {}
+        for offset in range(0, len(unique_ids), chunk_size):
+            chunk_query = dict(query or {})
+            chunk_query[id_field] = {"$in": unique_ids[offset:offset + chunk_size]}
+            cursor = get_collection(collection, read_preference).find(chunk_query, projection)
+            async for document in cursor:
+                if "_id" in document:
+                    document["_id"] = str(document["_id"])
+                documents[document[id_field]] = document
+        
+        return documents
+    
+    @staticmethod
+    async def count_documents(collection: str, query: Dict[str, Any] = None,
+                            read_preference: Optional[str] = None) -> int:
         """Count documents in the collection"""
         if query is None:
             query = {}
-        return await db.database[collection].count_documents(query)
+        return await get_collection(collection, read_preference).count_documents(query)
     
     @staticmethod
-    async def aggregate(collection: str, pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Perform aggregation on the collection"""
-        cursor = db.database[collection].aggregate(pipeline)
+    async def aggregate(collection: str, pipeline: List[Dict[str, Any]],
+                      read_preference: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Perform aggregation on the collection (pipelines with $out/$merge must stay on the primary)"""
+        cursor = get_collection(collection, read_preference).aggregate(pipeline)
         results = await cursor.to_list(None)
         for result in results:
             if "_id" in result:
                 result["_id"] = str(result["_id"])
         return results
 
+    @staticmethod
+    def aggregate_cursor(collection: str, pipeline: List[Dict[str, Any]],
+                         read_preference: Optional[str] = None, batch_size: int = BULK_CHUNK_SIZE,
+                         allow_disk_use: bool = False):
+        """Run an aggregation and return the Motor cursor for incremental iteration"""
+        return get_collection(collection, read_preference).aggregate(
+            pipeline, batchSize=batch_size, allowDiskUse=allow_disk_use
+        )
+
 # Get database instance
 def get_database():
     return db.database
\ No newline at end of file
@@ -17,7 +17,6 @@ VULNERABLE_ENDPOINTS = [
     "/api/advanced-analytics/productivity/detailed",
     "/api/advanced-analytics/team/comprehensive",
     "/api/advanced-analytics/goals",
-    "/api/advanced-analytics/reports/generate",
     "/api/advanced-analytics/insights",
     "/api/advanced-analytics/heatmap",
     "/api/advanced-analytics/alerts"
@@ -30,6 +29,7 @@ SECURE_ENDPOINTS = [
     "/api/monitoring/settings",
     "/api/monitoring/screenshot/upload",
     "/api/monitoring/activity/update",
+    "/api/monitoring/activity/batch",
     "/api/monitoring/screenshots"
 ]
 
@@ -16,6 +16,12 @@ class ReportFormat(str, Enum):
     CSV = "csv"
     EXCEL = "excel"
 
+class ReportJobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
 class ProductivityTrend(str, Enum):
     IMPROVING = "improving"
     DECLINING = "declining"
@@ -193,6 +199,28 @@ class ReportGenerate(BaseModel):
     include_charts: bool = True
     include_insights: bool = True
 
+class ReportJob(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    organization_id: str  # CRITICAL: Organization isolation
+    user_id: str
+    request: Dict[str, Any]
+    request_hash: str
+    # Set while the job can be shared by identical requests, removed on failure or expiry
+    dedup_key: Optional[str] = None
+    status: ReportJobStatus = ReportJobStatus.QUEUED
+    progress: float = 0.0  # 0-100
+    row_count: int = 0
+    chunks: List[str] = []  # Storage paths of the result chunks, in order
+    content_type: Optional[str] = None
+    attempts: int = 0
+    error: Optional[str] = None
+    heartbeat_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    expires_at: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
 class AlertSettings(BaseModel):
     low_productivity_threshold: float = 50.0
     idle_time_threshold: int = 1800  # 30 minutes in seconds
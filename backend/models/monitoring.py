@@ -9,6 +9,18 @@ class ScreenshotType(str, Enum):
     ACTIVITY_BASED = "activity_based"
     MANUAL = "manual"
 
+class ScreenshotStatus(str, Enum):
+    AWAITING_UPLOAD = "awaiting_upload"  # Upload URL issued, waiting for the direct upload and completion
+    PENDING = "pending"          # Spooled locally, waiting for the next pipeline stage
+    PROCESSING = "processing"    # A pipeline stage is running
+    READY = "ready"              # Stored remotely, URLs are set
+    FAILED = "failed"            # A stage exhausted its retries
+
+class ScreenshotStorageTier(str, Enum):
+    ORIGINAL = "original"        # Original file and derivatives are stored
+    DERIVATIVES = "derivatives"  # Original deleted by retention; screenshot_url is the largest derivative
+    PURGED = "purged"            # All files deleted; only the metadata remains
+
 class ApplicationCategory(str, Enum):
     PRODUCTIVE = "productive"
     NEUTRAL = "neutral"
@@ -31,14 +43,43 @@ class ScreenshotData(BaseModel):
     user_id: str
     time_entry_id: str
     organization_id: str  # CRITICAL: Organization isolation
-    screenshot_url: str
-    thumbnail_url: Optional[str] = None
+    screenshot_url: Optional[str] = None  # Set once the upload stage has stored the file
+    thumbnail_url: Optional[str] = None  # Smallest WebP derivative
+    derivatives: Dict[str, Dict[str, str]] = {}  # {"webp": {"200": url, "640": url, ...}, "avif": {...}}
     screenshot_type: ScreenshotType = ScreenshotType.PERIODIC
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     activity_level: float = 0.0  # 0-100
     blur_level: float = 0.0  # Privacy blur applied (0-100)
     is_deleted: bool = False
     metadata: Dict[str, Any] = {}
+    
+    # Processing pipeline (services/screenshot_pipeline.py)
+    status: ScreenshotStatus = ScreenshotStatus.READY
+    stages: List[str] = []                 # Planned stages, in order
+    stage: Optional[str] = None            # Stage waiting to run; unset when done
+    stage_attempts: Dict[str, int] = {}
+    next_attempt_at: Optional[datetime] = None
+    lease_until: Optional[datetime] = None
+    processing_error: Optional[str] = None
+    content_type: Optional[str] = None
+    spool_path: Optional[str] = None       # Local spool copy until the upload stage finishes
+    spool_host: Optional[str] = None
+    source_ref: Optional[str] = None       # Directly uploaded object, copied into the spool by the fetch stage
+    upload_expires_at: Optional[datetime] = None  # Direct uploads: when the upload URL stops working
+    
+    # Content addressing and deduplication
+    content_hash: Optional[str] = None     # SHA-256 of the uploaded bytes
+    stored_hash: Optional[str] = None      # SHA-256 of the stored (possibly blurred) file, used as its name
+    perceptual_hash: Optional[str] = None  # 256-bit dHash, hex
+    similarity_to_previous: Optional[float] = None  # 0-1, against the user's previous frame
+    screen_unchanged: Optional[bool] = None  # Idle signal: similarity above the near-duplicate threshold
+    duplicate_of: Optional[str] = None     # Screenshot whose stored files this one reuses
+    dedup: Optional[str] = None            # "exact" when the files of an identical upload are reused
+    
+    # Retention (services/retention.py)
+    storage_tier: ScreenshotStorageTier = ScreenshotStorageTier.ORIGINAL
+    tiered_at: Optional[datetime] = None
+    purged_at: Optional[datetime] = None
 
 class KeystrokeData(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -139,6 +180,14 @@ class ScreenshotUpload(BaseModel):
     activity_level: float
     screenshot_type: ScreenshotType = ScreenshotType.PERIODIC
 
+class ScreenshotUploadUrlRequest(BaseModel):
+    time_entry_id: str
+    content_type: str = "image/png"
+    size_bytes: Optional[int] = None  # Checked against MAX_FILE_SIZE up front when given
+    activity_level: float = 0.0
+    screenshot_type: ScreenshotType = ScreenshotType.PERIODIC
+    timestamp: Optional[datetime] = None
+
 class ActivityUpdate(BaseModel):
     time_entry_id: str
     keystroke_count: int = 0
@@ -147,6 +196,20 @@ class ActivityUpdate(BaseModel):
     active_application: Optional[str] = None
     current_url: Optional[str] = None
 
+class ActivitySample(BaseModel):
+    time_entry_id: str
+    timestamp: datetime
+    keystroke_count: int = 0
+    mouse_clicks: int = 0
+    mouse_movements: int = 0
+    movement_distance: float = 0.0
+    typing_speed: float = 0.0
+    active_application: Optional[str] = None
+    current_url: Optional[str] = None
+
+class ActivityBatch(BaseModel):
+    samples: List[ActivitySample]
+
 class ApplicationSwitch(BaseModel):
     time_entry_id: str
     application_name: str
@@ -30,6 +30,8 @@ class Organization(BaseModel):
         "require_email_verification": True,
         "enforce_2fa": False,
         "screenshot_retention_days": 30,
+        "screenshot_original_retention_days": 7,  # then only derivatives are kept
+        "deleted_screenshot_grace_days": 1,
         "allow_screenshot_deletion": True,
         "working_hours_enforcement": False,
         "timezone": "UTC"
@@ -40,6 +42,7 @@ class Organization(BaseModel):
     current_users: int = 0
     max_projects: int = 10
     storage_limit_gb: int = 5
+    storage_used_bytes: int = 0  # Maintained incrementally as screenshot files are stored and deleted
     
     # Metadata
     created_at: datetime = Field(default_factory=datetime.utcnow)
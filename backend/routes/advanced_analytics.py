@@ -1,4 +1,5 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Query, BackgroundTasks
+from fastapi import APIRouter, HTTPException, status, Depends, Query
+from fastapi.responses import StreamingResponse
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta, date
 import logging
@@ -11,13 +12,20 @@ from models.advanced_analytics import (
     TeamMetrics, UserProductivityReport, ProductivityGoal, ProductivityInsight,
     TimeHeatmap, ProductivityComparison, AdvancedAnalyticsQuery, AnalyticsResponse,
     ProductivityAlert, DashboardConfig, GoalCreate, GoalUpdate, ReportGenerate,
-    AlertSettings, ReportType, ReportFormat, ProductivityTrend
+    AlertSettings, ReportType, ReportFormat, ProductivityTrend, ReportJobStatus
 )
 from auth.dependencies import get_current_user, require_admin_or_manager
 from database.mongodb import DatabaseOperations
+from config import settings
 from services.productivity_calculator import ProductivityCalculator
+from services.time_rollups import ROLLUP_COLLECTION, day_key, rollup_activity
+from services.report_jobs import report_engine, ReportQueueFull
+from services.storage import storage_service
 
 logger = logging.getLogger(__name__)
+
+# Heavy analytics reads may be routed to secondaries (see MONGO_ANALYTICS_READ_PREFERENCE)
+ANALYTICS_READ_PREFERENCE = settings.MONGO_ANALYTICS_READ_PREFERENCE
 router = APIRouter(prefix="/advanced-analytics", tags=["advanced-analytics"])
 
 # Initialize productivity calculator
@@ -96,7 +104,8 @@ async def get_detailed_productivity_analytics(
                 "user_id": current_user.id,
                 "organization_id": current_user.organization_id,
                 "start_time": {"$gte": start_datetime, "$lte": end_datetime}
-            }
+            },
+            read_preference=ANALYTICS_READ_PREFERENCE
         )
         
         # CRITICAL SECURITY: Get monitoring data with organization context
@@ -304,31 +313,56 @@ async def update_productivity_goal(
             detail="Failed to update productivity goal"
         )
 
-@router.post("/reports/generate")
+def _report_job_response(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Public view of a report job"""
+    return {
+        "report_id": job["id"],
+        "status": job["status"],
+        "progress": job.get("progress", 0),
+        "row_count": job.get("row_count", 0),
+        "error": job.get("error"),
+        "created_at": job.get("created_at"),
+        "completed_at": job.get("completed_at"),
+        "expires_at": job.get("expires_at"),
+        "download_url": f"/api/advanced-analytics/reports/{job['id']}/download"
+            if job["status"] == ReportJobStatus.COMPLETED else None
+    }
+
+async def _get_report_job(report_id: str, current_user: User) -> Dict[str, Any]:
+    """Load a report job the current user may see (own jobs, or any in the org for admins/managers)"""
+    job = await report_engine.get_job(report_id, current_user.organization_id)
+    if not job or (job["user_id"] != current_user.id and current_user.role not in ["admin", "manager"]):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Report not found"
+        )
+    return job
+
+@router.post("/reports/generate", status_code=status.HTTP_202_ACCEPTED)
 async def generate_custom_report(
     report_data: ReportGenerate,
-    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user)
 ):
-    """Generate custom productivity report"""
+    """Queue a custom productivity report; identical pending requests share one job"""
     try:
-        # Create report record
-        report_id = str(datetime.utcnow().timestamp())
-        
-        # Add background task for report generation
-        background_tasks.add_task(
-            generate_report_background,
-            report_id,
-            current_user.id,
-            report_data
-        )
+        job, created = await report_engine.submit(current_user.organization_id, current_user.id, report_data)
         
         return {
-            "report_id": report_id,
-            "message": "Report generation started",
-            "estimated_completion": "2-5 minutes"
+            **_report_job_response(job),
+            "message": "Report generation started" if created else "Report already requested",
+            "deduplicated": not created
         }
         
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(e)
+        )
+    except ReportQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many reports are queued for this organization, try again later"
+        )
     except Exception as e:
         logger.error(f"Generate custom report error: {e}")
         raise HTTPException(
@@ -336,6 +370,46 @@ async def generate_custom_report(
             detail="Failed to start report generation"
         )
 
+@router.get("/reports/{report_id}")
+async def get_report_status(
+    report_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Poll the status and progress of a report job"""
+    job = await _get_report_job(report_id, current_user)
+    return _report_job_response(job)
+
+@router.get("/reports/{report_id}/download")
+async def download_report(
+    report_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Stream a completed report by concatenating its stored chunks"""
+    job = await _get_report_job(report_id, current_user)
+    
+    if job["status"] != ReportJobStatus.COMPLETED:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Report is {job['status']}"
+        )
+    if job.get("expires_at") and job["expires_at"] < datetime.utcnow():
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Report has expired, please generate it again"
+        )
+    
+    async def stream_chunks():
+        for chunk_path in job["chunks"]:
+            async for data in storage_service.iter_file(chunk_path):
+                yield data
+    
+    extension = job["chunks"][0].rsplit(".", 1)[-1] if job["chunks"] else "csv"
+    return StreamingResponse(
+        stream_chunks(),
+        media_type=job.get("content_type") or "application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="report-{report_id}.{extension}"'}
+    )
+
 @router.get("/insights")
 async def get_productivity_insights(
     days: int = Query(7, ge=1, le=90),
@@ -441,7 +515,8 @@ async def get_user_productivity_summary(user_id: str, organization_id: str, star
                 "user_id": user_id,
                 "organization_id": organization_id,
                 "start_time": {"$gte": start_date, "$lte": end_date}
-            }
+            },
+            read_preference=ANALYTICS_READ_PREFERENCE
         )
         
         if not time_entries:
@@ -470,31 +545,27 @@ async def get_user_productivity_summary(user_id: str, organization_id: str, star
 async def get_productivity_heatmap_data(user_id: str, organization_id: str, start_date: datetime, end_date: datetime):
     """Generate heatmap data showing productivity patterns"""
     try:
-        # Get daily productivity data
+        # Get daily productivity data from the daily rollups
         pipeline = [
             {
                 "$match": {
-                    "user_id": user_id,
                     "organization_id": organization_id,
-                    "start_time": {"$gte": start_date, "$lte": end_date}
+                    "user_id": user_id,
+                    "day": {"$gte": day_key(start_date), "$lte": day_key(end_date)}
                 }
             },
             {
                 "$group": {
-                    "_id": {
-                        "$dateToString": {
-                            "format": "%Y-%m-%d",
-                            "date": "$start_time"
-                        }
-                    },
+                    "_id": "$day",
                     "hours": {"$sum": "$duration"},
-                    "activity": {"$avg": "$activity_level"}
+                    "activity_sum": {"$sum": "$activity_sum"},
+                    "activity_count": {"$sum": "$activity_count"}
                 }
             },
             {"$sort": {"_id": 1}}
         ]
         
-        daily_data = await DatabaseOperations.aggregate("time_entries", pipeline)
+        daily_data = await DatabaseOperations.aggregate(ROLLUP_COLLECTION, pipeline, read_preference=ANALYTICS_READ_PREFERENCE)
         
         # Format data
         heatmap_data = {
@@ -502,7 +573,7 @@ async def get_productivity_heatmap_data(user_id: str, organization_id: str, star
         }
         
         for day in daily_data:
-            productivity_score = min((day["activity"] or 0) * 1.2, 100)
+            productivity_score = min(rollup_activity(day) * 1.2, 100)
             heatmap_data["daily_data"].append({
                 "date": day["_id"],
                 "productivity_score": round(productivity_score, 1),
@@ -533,10 +604,6 @@ async def update_goal_progress(goal_id: str):
     """Update progress for a specific goal"""
     pass
 
-async def generate_report_background(report_id: str, user_id: str, report_data: ReportGenerate):
-    """Background task for generating reports"""
-    pass
-
 async def get_team_productivity_data(member_ids: List[str], organization_id: str, start_date: datetime, end_date: datetime):
     """Get productivity data for team members"""
     return {"members": []}
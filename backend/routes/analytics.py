@@ -1,12 +1,19 @@
 from fastapi import APIRouter, HTTPException, status, Depends, Query
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, AsyncIterator, Literal
 from datetime import datetime, timedelta, date
 from models.user import User
-from auth.dependencies import get_current_user, require_admin_or_manager
+from auth.dependencies import get_current_user, require_admin, require_admin_or_manager
 from database.mongodb import DatabaseOperations
+from config import settings
+from database.joins import fetch_users, fetch_projects
+from services.time_rollups import ROLLUP_COLLECTION, day_key, rollup_activity, rebuild_rollups
+from services.report_export import EXPORT_MEDIA_TYPES, EXPORT_FLUSH_ROWS, export_response
 import logging
 
 logger = logging.getLogger(__name__)
+
+# Heavy analytics reads may be routed to secondaries (see MONGO_ANALYTICS_READ_PREFERENCE)
+ANALYTICS_READ_PREFERENCE = settings.MONGO_ANALYTICS_READ_PREFERENCE
 router = APIRouter(prefix="/analytics", tags=["analytics"])
 
 @router.get("/dashboard")
@@ -19,62 +26,58 @@ async def get_dashboard_analytics(
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=30)
         
-        # User's time tracking stats
+        # User's time tracking stats (read from the daily rollups)
         user_pipeline = [
             {
                 "$match": {
+                    "organization_id": current_user.organization_id,
                     "user_id": current_user.id,
-                    "start_time": {"$gte": start_date, "$lte": end_date}
+                    "day": {"$gte": day_key(start_date), "$lte": day_key(end_date)}
                 }
             },
             {
                 "$group": {
                     "_id": None,
                     "total_hours": {"$sum": "$duration"},
-                    "total_entries": {"$sum": 1},
-                    "avg_session": {"$avg": "$duration"},
+                    "total_entries": {"$sum": "$entries"},
                     "projects": {"$addToSet": "$project_id"}
                 }
             }
         ]
         
-        user_stats = await DatabaseOperations.aggregate("time_entries", user_pipeline)
+        user_stats = await DatabaseOperations.aggregate(ROLLUP_COLLECTION, user_pipeline, read_preference=ANALYTICS_READ_PREFERENCE)
         user_data = user_stats[0] if user_stats else {
             "total_hours": 0,
             "total_entries": 0,
-            "avg_session": 0,
             "projects": []
         }
         
         # Convert seconds to hours
+        user_data["avg_session"] = user_data["total_hours"] / user_data["total_entries"] / 3600 if user_data["total_entries"] else 0
         user_data["total_hours"] = user_data["total_hours"] / 3600
-        user_data["avg_session"] = user_data["avg_session"] / 3600
         user_data["projects_count"] = len(user_data["projects"])
         
         # Daily productivity trend (last 7 days)
         daily_pipeline = [
             {
                 "$match": {
+                    "organization_id": current_user.organization_id,
                     "user_id": current_user.id,
-                    "start_time": {"$gte": end_date - timedelta(days=7), "$lte": end_date}
+                    "day": {"$gte": day_key(end_date - timedelta(days=7)), "$lte": day_key(end_date)}
                 }
             },
             {
                 "$group": {
-                    "_id": {
-                        "$dateToString": {
-                            "format": "%Y-%m-%d",
-                            "date": "$start_time"
-                        }
-                    },
+                    "_id": "$day",
                     "hours": {"$sum": "$duration"},
-                    "activity": {"$avg": "$activity_level"}
+                    "activity_sum": {"$sum": "$activity_sum"},
+                    "activity_count": {"$sum": "$activity_count"}
                 }
             },
             {"$sort": {"_id": 1}}
         ]
         
-        daily_data = await DatabaseOperations.aggregate("time_entries", daily_pipeline)
+        daily_data = await DatabaseOperations.aggregate(ROLLUP_COLLECTION, daily_pipeline, read_preference=ANALYTICS_READ_PREFERENCE)
         
         # Format daily data
         productivity_trend = []
@@ -82,41 +85,44 @@ async def get_dashboard_analytics(
             productivity_trend.append({
                 "date": day["_id"],
                 "hours": round(day["hours"] / 3600, 2),
-                "activity": round(day["activity"] or 0, 1)
+                "activity": round(rollup_activity(day), 1)
             })
         
         # Project breakdown
         project_pipeline = [
             {
                 "$match": {
+                    "organization_id": current_user.organization_id,
                     "user_id": current_user.id,
-                    "start_time": {"$gte": start_date, "$lte": end_date}
+                    "day": {"$gte": day_key(start_date), "$lte": day_key(end_date)}
                 }
             },
             {
                 "$group": {
                     "_id": "$project_id",
                     "hours": {"$sum": "$duration"},
-                    "entries": {"$sum": 1},
-                    "avg_activity": {"$avg": "$activity_level"}
+                    "entries": {"$sum": "$entries"},
+                    "activity_sum": {"$sum": "$activity_sum"},
+                    "activity_count": {"$sum": "$activity_count"}
                 }
             },
             {"$sort": {"hours": -1}},
             {"$limit": 10}
         ]
         
-        project_data = await DatabaseOperations.aggregate("time_entries", project_pipeline)
+        project_data = await DatabaseOperations.aggregate(ROLLUP_COLLECTION, project_pipeline, read_preference=ANALYTICS_READ_PREFERENCE)
         
         # Get project names and format data
+        projects = await fetch_projects(project_data, "_id", current_user.organization_id)
         project_breakdown = []
         for project in project_data:
-            project_info = await DatabaseOperations.get_document("projects", {"id": project["_id"]})
+            project_info = projects.get(project["_id"])
             project_breakdown.append({
                 "project_id": project["_id"],
                 "project_name": project_info["name"] if project_info else "Unknown",
                 "hours": round(project["hours"] / 3600, 2),
                 "entries": project["entries"],
-                "avg_activity": round(project["avg_activity"] or 0, 1)
+                "avg_activity": round(rollup_activity(project), 1)
             })
         
         return {
@@ -149,33 +155,34 @@ async def get_team_analytics(
         if not end_date:
             end_date = datetime.utcnow().date()
         
-        start_datetime = datetime.combine(start_date, datetime.min.time())
-        end_datetime = datetime.combine(end_date, datetime.max.time())
+        # Team stats are read from the daily rollups
+        rollup_match = {
+            "organization_id": current_user.organization_id,
+            "day": {"$gte": day_key(start_date), "$lte": day_key(end_date)}
+        }
         
         # Team productivity stats
         team_pipeline = [
-            {
-                "$match": {
-                    "start_time": {"$gte": start_datetime, "$lte": end_datetime}
-                }
-            },
+            {"$match": rollup_match},
             {
                 "$group": {
                     "_id": "$user_id",
                     "total_hours": {"$sum": "$duration"},
-                    "total_entries": {"$sum": 1},
-                    "avg_activity": {"$avg": "$activity_level"},
+                    "total_entries": {"$sum": "$entries"},
+                    "activity_sum": {"$sum": "$activity_sum"},
+                    "activity_count": {"$sum": "$activity_count"},
                     "projects": {"$addToSet": "$project_id"}
                 }
             }
         ]
         
-        team_data = await DatabaseOperations.aggregate("time_entries", team_pipeline)
+        team_data = await DatabaseOperations.aggregate(ROLLUP_COLLECTION, team_pipeline, read_preference=ANALYTICS_READ_PREFERENCE)
         
         # Get user details and format data
+        users = await fetch_users(team_data, "_id", current_user.organization_id, fields=("name", "role"))
         team_stats = []
         for member in team_data:
-            user_info = await DatabaseOperations.get_document("users", {"id": member["_id"]})
+            user_info = users.get(member["_id"])
             if user_info:
                 team_stats.append({
                     "user_id": member["_id"],
@@ -183,7 +190,7 @@ async def get_team_analytics(
                     "user_role": user_info["role"],
                     "total_hours": round(member["total_hours"] / 3600, 2),
                     "total_entries": member["total_entries"],
-                    "avg_activity": round(member["avg_activity"] or 0, 1),
+                    "avg_activity": round(rollup_activity(member), 1),
                     "projects_count": len(member["projects"])
                 })
         
@@ -192,69 +199,61 @@ async def get_team_analytics(
         
         # Daily team productivity
         daily_team_pipeline = [
-            {
-                "$match": {
-                    "start_time": {"$gte": start_datetime, "$lte": end_datetime}
-                }
-            },
+            {"$match": rollup_match},
             {
                 "$group": {
-                    "_id": {
-                        "$dateToString": {
-                            "format": "%Y-%m-%d",
-                            "date": "$start_time"
-                        }
-                    },
+                    "_id": "$day",
                     "total_hours": {"$sum": "$duration"},
-                    "avg_activity": {"$avg": "$activity_level"},
+                    "activity_sum": {"$sum": "$activity_sum"},
+                    "activity_count": {"$sum": "$activity_count"},
                     "active_users": {"$addToSet": "$user_id"}
                 }
             },
             {"$sort": {"_id": 1}}
         ]
         
-        daily_team_data = await DatabaseOperations.aggregate("time_entries", daily_team_pipeline)
+        daily_team_data = await DatabaseOperations.aggregate(ROLLUP_COLLECTION, daily_team_pipeline, read_preference=ANALYTICS_READ_PREFERENCE)
         
         daily_productivity = []
         for day in daily_team_data:
             daily_productivity.append({
                 "date": day["_id"],
                 "total_hours": round(day["total_hours"] / 3600, 2),
-                "avg_activity": round(day["avg_activity"] or 0, 1),
+                "avg_activity": round(rollup_activity(day), 1),
                 "active_users": len(day["active_users"])
             })
         
         # Project analytics
         project_analytics_pipeline = [
-            {
-                "$match": {
-                    "start_time": {"$gte": start_datetime, "$lte": end_datetime}
-                }
-            },
+            {"$match": rollup_match},
             {
                 "$group": {
                     "_id": "$project_id",
                     "total_hours": {"$sum": "$duration"},
                     "team_members": {"$addToSet": "$user_id"},
-                    "avg_activity": {"$avg": "$activity_level"}
+                    "activity_sum": {"$sum": "$activity_sum"},
+                    "activity_count": {"$sum": "$activity_count"}
                 }
             },
             {"$sort": {"total_hours": -1}}
         ]
         
-        project_analytics = await DatabaseOperations.aggregate("time_entries", project_analytics_pipeline)
+        project_analytics = await DatabaseOperations.aggregate(ROLLUP_COLLECTION, project_analytics_pipeline, read_preference=ANALYTICS_READ_PREFERENCE)
         
         # Get project details
+        projects = await fetch_projects(
+            project_analytics, "_id", current_user.organization_id, fields=("name", "budget", "spent")
+        )
         project_stats = []
         for project in project_analytics:
-            project_info = await DatabaseOperations.get_document("projects", {"id": project["_id"]})
+            project_info = projects.get(project["_id"])
             if project_info:
                 project_stats.append({
                     "project_id": project["_id"],
                     "project_name": project_info["name"],
                     "total_hours": round(project["total_hours"] / 3600, 2),
                     "team_members": len(project["team_members"]),
-                    "avg_activity": round(project["avg_activity"] or 0, 1),
+                    "avg_activity": round(rollup_activity(project), 1),
                     "budget": project_info.get("budget", 0),
                     "spent": project_info.get("spent", 0)
                 })
@@ -327,7 +326,7 @@ async def get_productivity_analytics(
             {"$sort": {"_id": 1}}
         ]
         
-        productivity_data = await DatabaseOperations.aggregate("time_entries", productivity_pipeline)
+        productivity_data = await DatabaseOperations.aggregate("time_entries", productivity_pipeline, read_preference=ANALYTICS_READ_PREFERENCE)
         
         # Format productivity data
         productivity_chart = []
@@ -390,7 +389,8 @@ async def get_screenshot_stats(
                 "organization_id": current_user.organization_id,
                 "timestamp": {"$gte": start_datetime, "$lte": end_datetime},
                 "is_deleted": {"$ne": True}
-            }
+            },
+            read_preference=ANALYTICS_READ_PREFERENCE
         )
         
         return {
@@ -408,20 +408,87 @@ async def get_screenshot_stats(
             detail="Failed to get screenshot statistics"
         )
 
+# Columns of a custom report row, in CSV order
+CUSTOM_REPORT_FIELDS = ["date", "user_name", "project_name", "hours", "activity_level", "entries"]
+
+async def _custom_report_rows(cursor, organization_id: str) -> AsyncIterator[Dict[str, Any]]:
+    """Format aggregated report groups batch by batch, resolving names with one query per batch"""
+    users: Dict[str, Any] = {}
+    projects: Dict[str, Any] = {}
+    batch = []
+    
+    async def format_batch(entries):
+        new_users = [e for e in entries if e["_id"].get("user_id") not in users]
+        new_projects = [e for e in entries if e["_id"].get("project_id") not in projects]
+        if new_users:
+            users.update({e["_id"].get("user_id"): None for e in new_users})
+            users.update(await fetch_users(new_users, "_id.user_id", organization_id))
+        if new_projects:
+            projects.update({e["_id"].get("project_id"): None for e in new_projects})
+            projects.update(await fetch_projects(new_projects, "_id.project_id", organization_id))
+        
+        rows = []
+        for entry in entries:
+            user_info = users.get(entry["_id"].get("user_id"))
+            project_info = projects.get(entry["_id"].get("project_id"))
+            rows.append({
+                "date": entry["_id"]["date"],
+                "user_name": user_info["name"] if user_info else "Unknown User",
+                "project_name": project_info["name"] if project_info else "Unknown Project",
+                "hours": round((entry["hours"] or 0) / 3600, 2),
+                "activity_level": round(entry["activity"] or 0, 1),
+                "entries": entry["entries"]
+            })
+        return rows
+    
+    async for entry in cursor:
+        batch.append(entry)
+        if len(batch) >= EXPORT_FLUSH_ROWS:
+            for row in await format_batch(batch):
+                yield row
+            batch = []
+    if batch:
+        for row in await format_batch(batch):
+            yield row
+
+@router.post("/rollups/rebuild")
+async def rebuild_organization_rollups(current_user: User = Depends(require_admin)):
+    """Recompute the organization's daily rollups from its time entries (repairs drift after failed updates)"""
+    try:
+        rebuilt = await rebuild_rollups(current_user.organization_id)
+    except Exception as e:
+        logger.error(f"Rollup rebuild error for org {current_user.organization_id}: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to rebuild rollups"
+        )
+    if not rebuilt:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A rollup rebuild is already running"
+        )
+    return {"message": "Rollups rebuilt", "rebuilt_at": datetime.utcnow().isoformat()}
+
 @router.get("/reports/custom")
 async def generate_custom_report(
     start_date: date,
     end_date: date,
     user_ids: Optional[List[str]] = Query(None),
     project_ids: Optional[List[str]] = Query(None),
+    report_format: Literal["json", "csv", "ndjson"] = Query("json", alias="format"),
     current_user: User = Depends(require_admin_or_manager)
 ):
-    """Generate custom analytics report"""
+    """
+    Generate custom analytics report
+    
+    ``format=csv`` or ``format=ndjson`` streams the rows as a download without
+    holding the whole report in memory; ``json`` returns rows and a summary.
+    """
     try:
-        logger.info(f"Generating custom report for user {current_user.id} in org {current_user.organization_id}")
-        logger.info(f"Date range: {start_date} to {end_date}")
-        logger.info(f"User IDs filter: {user_ids}")
-        logger.info(f"Project IDs filter: {project_ids}")
+        logger.info(
+            f"Generating {report_format} custom report for user {current_user.id} in org {current_user.organization_id} "
+            f"({start_date} to {end_date}, users={user_ids}, projects={project_ids})"
+        )
         
         start_datetime = datetime.combine(start_date, datetime.min.time())
         end_datetime = datetime.combine(end_date, datetime.max.time())
@@ -437,15 +504,6 @@ async def generate_custom_report(
         if project_ids:
             match_query["project_id"] = {"$in": project_ids}
         
-        logger.info(f"Match query: {match_query}")
-        
-        # Check if there are any time entries at all for this organization
-        total_entries = await DatabaseOperations.count_documents(
-            "time_entries", 
-            {"organization_id": current_user.organization_id}
-        )
-        logger.info(f"Total time entries for organization: {total_entries}")
-        
         # Comprehensive analytics pipeline
         analytics_pipeline = [
             {"$match": match_query},
@@ -465,38 +523,22 @@ async def generate_custom_report(
                     "activity": {"$avg": "$activity_level"},
                     "entries": {"$sum": 1}
                 }
-            }
+            },
+            {"$sort": {"_id.date": 1, "_id.user_id": 1, "_id.project_id": 1}}
         ]
         
-        logger.info(f"Running aggregation pipeline: {analytics_pipeline}")
-        detailed_data = await DatabaseOperations.aggregate("time_entries", analytics_pipeline)
-        logger.info(f"Aggregation returned {len(detailed_data)} results")
-        
-        # Process and format the data
-        report_data = []
-        
-        if detailed_data:
-            logger.info(f"Processing {len(detailed_data)} aggregated entries")
-            for i, entry in enumerate(detailed_data):
-                logger.info(f"Processing entry {i}: {entry}")
-                try:
-                    user_info = await DatabaseOperations.get_document("users", {"id": entry["_id"]["user_id"], "organization_id": current_user.organization_id})
-                    project_info = await DatabaseOperations.get_document("projects", {"id": entry["_id"]["project_id"], "organization_id": current_user.organization_id})
-                    
-                    report_data.append({
-                        "date": entry["_id"]["date"],
-                        "user_name": user_info["name"] if user_info else "Unknown User",
-                        "project_name": project_info["name"] if project_info else "Unknown Project",
-                        "hours": round(entry["hours"] / 3600, 2),
-                        "activity_level": round(entry["activity"] or 0, 1),
-                        "entries": entry["entries"]
-                    })
-                except Exception as entry_error:
-                    logger.error(f"Error processing entry {i}: {entry_error}", exc_info=True)
-                    # Continue processing other entries
-                    continue
-        else:
-            logger.info("No time entries found for the specified criteria")
+        # Large org-wide ranges can exceed the in-memory $group/$sort limit
+        cursor = DatabaseOperations.aggregate_cursor(
+            "time_entries", analytics_pipeline, read_preference=ANALYTICS_READ_PREFERENCE, allow_disk_use=True
+        )
+        rows = _custom_report_rows(cursor, current_user.organization_id)
+        
+        if report_format in EXPORT_MEDIA_TYPES:
+            return export_response(
+                rows, CUSTOM_REPORT_FIELDS, report_format, f"custom-report-{start_date}-{end_date}"
+            )
+        
+        report_data = [row async for row in rows]
         
         # Calculate summary statistics
         total_hours = sum(entry["hours"] for entry in report_data)
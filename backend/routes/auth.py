@@ -4,6 +4,7 @@ from datetime import timedelta, datetime
 from models.user import UserCreate, UserLogin, UserResponse, User, InviteUser, Invitation, AcceptInvite, ForgotPassword, ResetPassword, PasswordResetToken
 from auth.jwt_handler import create_access_token, create_refresh_token, hash_password, verify_password, ACCESS_TOKEN_EXPIRE_MINUTES
 from auth.dependencies import get_current_user, require_admin_or_manager, validate_same_organization_user
+from auth.user_cache import principal_cache
 from database.mongodb import DatabaseOperations
 from services.email import email_service
 from config import settings
@@ -61,6 +62,7 @@ async def login(user_credentials: UserLogin):
             {"id": user.id, "organization_id": user.organization_id},  # Security: ensure org context
             {"$set": {"status": "active", "last_active": datetime.utcnow()}}
         )
+        principal_cache.invalidate(user.id)
         
         # Create tokens with organization context (CRITICAL for security)
         access_token = create_access_token(
@@ -97,6 +99,7 @@ async def logout(current_user: User = Depends(get_current_user)):
             {"id": current_user.id, "organization_id": current_user.organization_id}, 
             {"$set": {"status": "offline", "last_active": datetime.utcnow()}}
         )
+        principal_cache.invalidate(current_user.id)
         
         return {"message": "Successfully logged out"}
         
@@ -521,6 +524,7 @@ async def reset_password(reset_data: ResetPassword):
             {"email": reset_token.email, "organization_id": user_data['organization_id']},
             {"$set": {"password": hashed_password, "updated_at": datetime.utcnow()}}
         )
+        principal_cache.invalidate(user_data['id'])
         
         # Mark token as used
         await DatabaseOperations.update_document(
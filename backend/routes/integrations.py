@@ -1,11 +1,12 @@
 from fastapi import APIRouter, HTTPException, status, Depends
 from typing import List, Optional, Dict, Any
-import httpx
 import os
 from datetime import datetime
 from models.user import User
 from auth.dependencies import get_current_user, require_admin_or_manager
 from database.mongodb import DatabaseOperations
+from services.http_clients import http_clients, secret_scope
+from config import settings
 import logging
 
 logger = logging.getLogger(__name__)
@@ -26,9 +27,11 @@ class SlackIntegration:
             if channel:
                 payload["channel"] = channel
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(self.webhook_url, json=payload)
-                return response.status_code == 200
+            # Every workspace's webhook is on hooks.slack.com; each gets its own breaker
+            response = await http_clients.request(
+                "slack", "POST", self.webhook_url, breaker_scope=secret_scope(self.webhook_url), json=payload
+            )
+            return response.status_code == 200
         except Exception as e:
             logger.error(f"Slack notification error: {e}")
             return False
@@ -37,7 +40,7 @@ class TrelloIntegration:
     def __init__(self, api_key: str, token: str):
         self.api_key = api_key
         self.token = token
-        self.base_url = "https://api.trello.com/1"
+        self.base_url = settings.TRELLO_API_URL
     
     async def create_card(self, list_id: str, name: str, description: str = None):
         """Create a Trello card"""
@@ -52,9 +55,8 @@ class TrelloIntegration:
             if description:
                 params["desc"] = description
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, params=params)
-                return response.json() if response.status_code == 200 else None
+            response = await http_clients.request("trello", "POST", url, params=params)
+            return response.json() if response.status_code == 200 else None
         except Exception as e:
             logger.error(f"Trello card creation error: {e}")
             return None
@@ -68,9 +70,8 @@ class TrelloIntegration:
                 "token": self.token
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, params=params)
-                return response.json() if response.status_code == 200 else []
+            response = await http_clients.request("trello", "GET", url, params=params)
+            return response.json() if response.status_code == 200 else []
         except Exception as e:
             logger.error(f"Trello boards fetch error: {e}")
             return []
@@ -78,7 +79,7 @@ class TrelloIntegration:
 class GitHubIntegration:
     def __init__(self, token: str):
         self.token = token
-        self.base_url = "https://api.github.com"
+        self.base_url = settings.GITHUB_API_URL
         self.headers = {
             "Authorization": f"token {token}",
             "Accept": "application/vnd.github.v3+json"
@@ -94,9 +95,8 @@ class GitHubIntegration:
                 "labels": labels or []
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=payload, headers=self.headers)
-                return response.json() if response.status_code == 201 else None
+            response = await http_clients.request("github", "POST", url, json=payload, headers=self.headers)
+            return response.json() if response.status_code == 201 else None
         except Exception as e:
             logger.error(f"GitHub issue creation error: {e}")
             return None
@@ -106,9 +106,8 @@ class GitHubIntegration:
         try:
             url = f"{self.base_url}/user/repos"
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, headers=self.headers)
-                return response.json() if response.status_code == 200 else []
+            response = await http_clients.request("github", "GET", url, headers=self.headers)
+            return response.json() if response.status_code == 200 else []
         except Exception as e:
             logger.error(f"GitHub repos fetch error: {e}")
             return []
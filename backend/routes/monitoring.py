@@ -1,32 +1,38 @@
-from fastapi import APIRouter, HTTPException, status, Depends, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, status, Depends, UploadFile, File, Form, Request
 from fastapi.responses import FileResponse
+from pydantic import ValidationError
+from pymongo import UpdateOne
 from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from collections import defaultdict
 import os
-import uuid
+import json
+import zlib
 import logging
-from PIL import Image
-import io
 import base64
 
 from models.user import User
 from models.monitoring import (
-    ScreenshotData, KeystrokeData, ApplicationUsage, WebsiteVisit,
+    KeystrokeData, ApplicationUsage, WebsiteVisit,
     ActivitySession, ProductivityMetrics, MonitoringSettings,
     ScreenshotUpload, ActivityUpdate, ApplicationSwitch, WebsiteNavigation,
-    MonitoringSettingsUpdate, ScreenshotType, ApplicationCategory, WebsiteCategory
+    MonitoringSettingsUpdate, ScreenshotType, ScreenshotStatus, ApplicationCategory, WebsiteCategory,
+    ActivityBatch, ScreenshotUploadUrlRequest
 )
+from models.productivity import KeyboardActivityData, MouseActivityData, TrackingStatus
 from auth.dependencies import get_current_user
 from database.mongodb import DatabaseOperations
-from services.storage import StorageService
+from services.write_buffer import write_buffer
+from services.screenshot_pipeline import screenshot_pipeline, spool_extension, UploadMissing
+from services.storage import FileTooLarge, ChunkReader, storage_service
+from auth.jwt_handler import create_scoped_token, verify_scoped_token
+from utils.productivity_analyzer import ProductivityAnalyzer
+from config import settings as app_settings
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/monitoring", tags=["monitoring"])
 
-# Initialize storage service
-storage = StorageService()
-
-@router.post("/screenshot/upload")
+@router.post("/screenshot/upload", status_code=status.HTTP_202_ACCEPTED)
 async def upload_screenshot(
     file: UploadFile = File(...),
     time_entry_id: str = Form(...),
@@ -36,7 +42,13 @@ async def upload_screenshot(
     timestamp: str = Form(...),
     current_user: User = Depends(get_current_user)
 ):
-    """Upload a screenshot during time tracking (organization-specific)"""
+    """
+    Accept a screenshot during time tracking (organization-specific)
+    
+    The bytes are spooled durably and the request returns 202; blur,
+    thumbnailing and storage upload run in the screenshot pipeline. Poll
+    /screenshots/{screenshot_id}/status for progress.
+    """
     try:
         # Validate file type
         if not file.content_type.startswith('image/'):
@@ -45,22 +57,6 @@ async def upload_screenshot(
                 detail="File must be an image"
             )
         
-        # Read file content
-        file_content = await file.read()
-        
-        # Generate unique filename
-        file_extension = file.filename.split('.')[-1] if '.' in file.filename else 'png'
-        screenshot_id = str(uuid.uuid4())
-        filename = f"screenshots/{current_user.id}/{screenshot_id}.{file_extension}"
-        thumbnail_filename = f"screenshots/{current_user.id}/thumbs/{screenshot_id}_thumb.{file_extension}"
-        
-        # Create thumbnail
-        thumbnail_content = create_thumbnail(file_content)
-        
-        # Upload files to storage
-        screenshot_url = await storage.upload_file(filename, file_content, file.content_type)
-        thumbnail_url = await storage.upload_file(thumbnail_filename, thumbnail_content, file.content_type)
-        
         # CRITICAL SECURITY: Verify time entry belongs to user's organization
         time_entry = await DatabaseOperations.get_document(
             "time_entries",
@@ -72,51 +68,48 @@ async def upload_screenshot(
                 detail="Time entry not found"
             )
         
-        # Get user's monitoring settings with organization context
-        settings = await DatabaseOperations.get_document(
-            "monitoring_settings", 
-            {"user_id": current_user.id, "organization_id": current_user.organization_id}
-        )
+        blur_level = await get_blur_level(current_user)
         
-        blur_level = 0.0
-        if settings and settings.get("blur_screenshots", False):
-            blur_level = 50.0  # Apply moderate blur for privacy
-        
-        # CRITICAL SECURITY: Create screenshot record with organization context
-        screenshot_data = ScreenshotData(
+        # Stream the file into the spool; processing continues in the background
+        screenshot = await screenshot_pipeline.accept(
+            file=file,
+            extension=spool_extension(file.content_type),
             user_id=current_user.id,
-            time_entry_id=time_entry_id,
             organization_id=current_user.organization_id,
-            screenshot_url=screenshot_url,
-            thumbnail_url=thumbnail_url,
-            screenshot_type=ScreenshotType(screenshot_type),
+            time_entry_id=time_entry_id,
             activity_level=activity_level,
+            screenshot_type=ScreenshotType(screenshot_type),
             blur_level=blur_level
         )
         
-        # Save to database
-        await DatabaseOperations.create_document("screenshots", screenshot_data.dict())
-        
         # CRITICAL SECURITY: Update time entry with organization validation
         await DatabaseOperations.update_document(
             "time_entries",
             {"id": time_entry_id, "organization_id": current_user.organization_id},
             {
-                "$push": {"screenshots": screenshot_data.id},
+                "$push": {"screenshots": screenshot["id"]},
                 "$set": {"updated_at": datetime.utcnow()}
             }
         )
         
-        logger.info(f"Screenshot uploaded: {screenshot_id} for user {current_user.id} (folder: screenshots/{current_user.id}/)")
+        logger.info(f"Screenshot accepted: {screenshot['id']} for user {current_user.id} (folder: screenshots/{current_user.id}/)")
         
         return {
-            "screenshot_id": screenshot_data.id,
-            "thumbnail_url": thumbnail_url,
-            "screenshot_url": screenshot_url,
+            "screenshot_id": screenshot["id"],
+            "status": screenshot["status"],
+            "thumbnail_url": None,
+            "screenshot_url": None,
             "user_folder": f"screenshots/{current_user.id}/",
-            "message": f"Screenshot uploaded successfully to user-specific folder"
+            "message": "Screenshot accepted for processing"
         }
         
+    except HTTPException:
+        raise
+    except FileTooLarge:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Screenshot exceeds maximum size of {app_settings.MAX_FILE_SIZE} bytes"
+        )
     except Exception as e:
         logger.error(f"Screenshot upload error: {e}")
         raise HTTPException(
@@ -124,6 +117,205 @@ async def upload_screenshot(
             detail="Failed to upload screenshot"
         )
 
+@router.post("/screenshot/upload-url", status_code=status.HTTP_201_CREATED)
+async def create_screenshot_upload_url(
+    upload: ScreenshotUploadUrlRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Reserve a screenshot and return where the agent uploads its bytes directly
+    
+    With S3 storage this is a presigned PUT URL, so the bytes never pass
+    through the API; otherwise it is a signed one-off upload URL on this API.
+    After the PUT succeeds the agent calls ``complete_url``.
+    """
+    if not upload.content_type.startswith('image/'):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="File must be an image"
+        )
+    if upload.size_bytes is not None and upload.size_bytes > app_settings.MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Screenshot exceeds maximum size of {app_settings.MAX_FILE_SIZE} bytes"
+        )
+    
+    # CRITICAL SECURITY: Verify time entry belongs to user's organization
+    time_entry = await DatabaseOperations.get_document(
+        "time_entries",
+        {"id": upload.time_entry_id, "user_id": current_user.id, "organization_id": current_user.organization_id}
+    )
+    if not time_entry:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Time entry not found"
+        )
+    
+    try:
+        expires_in = app_settings.SCREENSHOT_UPLOAD_URL_EXPIRY
+        screenshot, upload_url = await screenshot_pipeline.reserve(
+            extension=spool_extension(upload.content_type),
+            content_type=upload.content_type,
+            user_id=current_user.id,
+            organization_id=current_user.organization_id,
+            time_entry_id=upload.time_entry_id,
+            activity_level=upload.activity_level,
+            screenshot_type=upload.screenshot_type,
+            blur_level=await get_blur_level(current_user),
+            timestamp=upload.timestamp,
+            expires_in=expires_in
+        )
+        if upload_url is None:
+            token = create_scoped_token(screenshot["id"], "screenshot_upload", timedelta(seconds=expires_in))
+            upload_url = f"/api/monitoring/screenshot/upload/{screenshot['id']}?token={token}"
+        
+        return {
+            "screenshot_id": screenshot["id"],
+            "method": "PUT",
+            "upload_url": upload_url,
+            "headers": {"Content-Type": upload.content_type},
+            "expires_at": screenshot["upload_expires_at"],
+            "complete_url": f"/api/monitoring/screenshot/{screenshot['id']}/complete"
+        }
+    except Exception as e:
+        logger.error(f"Screenshot upload URL error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to create screenshot upload URL"
+        )
+
+@router.put("/screenshot/upload/{screenshot_id}")
+async def put_screenshot_upload(
+    screenshot_id: str,
+    token: str,
+    request: Request
+):
+    """
+    Signed direct upload of a reserved screenshot (storage backends without presigned URLs)
+    
+    Authorized by the token from /screenshot/upload-url instead of a bearer
+    token. The body is streamed into the spool without being decoded.
+    """
+    if not verify_scoped_token(token, "screenshot_upload", screenshot_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid or expired upload token"
+        )
+    screenshot = await DatabaseOperations.get_document(
+        "screenshots", {"id": screenshot_id, "status": ScreenshotStatus.AWAITING_UPLOAD}
+    )
+    if not screenshot or not screenshot.get("spool_path"):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Screenshot is not waiting for an upload"
+        )
+    if not request.headers.get("content-type", "").startswith("image/"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="File must be an image"
+        )
+    
+    content_length = request.headers.get("content-length")
+    body = ChunkReader(request.stream(), int(content_length) if content_length and content_length.isdigit() else None)
+    try:
+        size = await screenshot_pipeline.receive(screenshot, body)
+    except FileTooLarge:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Screenshot exceeds maximum size of {app_settings.MAX_FILE_SIZE} bytes"
+        )
+    except Exception as e:
+        logger.error(f"Screenshot direct upload error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to upload screenshot"
+        )
+    
+    return {"screenshot_id": screenshot_id, "size_bytes": size}
+
+@router.post("/screenshot/{screenshot_id}/complete", status_code=status.HTTP_202_ACCEPTED)
+async def complete_screenshot_upload(
+    screenshot_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Queue a directly uploaded screenshot for processing; poll /screenshots/{screenshot_id}/status"""
+    screenshot = await DatabaseOperations.get_document(
+        "screenshots",
+        {"id": screenshot_id, "user_id": current_user.id, "organization_id": current_user.organization_id}
+    )
+    if not screenshot:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Screenshot not found"
+        )
+    
+    try:
+        was_waiting = screenshot.get("status") == ScreenshotStatus.AWAITING_UPLOAD
+        screenshot = await screenshot_pipeline.complete(screenshot)
+    except UploadMissing:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Screenshot has not been uploaded yet"
+        )
+    except FileTooLarge:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Screenshot exceeds maximum size of {app_settings.MAX_FILE_SIZE} bytes"
+        )
+    except Exception as e:
+        logger.error(f"Screenshot completion error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to complete screenshot upload"
+        )
+    
+    if was_waiting:
+        # CRITICAL SECURITY: Update time entry with organization validation
+        await DatabaseOperations.update_document(
+            "time_entries",
+            {"id": screenshot["time_entry_id"], "organization_id": current_user.organization_id},
+            {
+                "$addToSet": {"screenshots": screenshot_id},
+                "$set": {"updated_at": datetime.utcnow()}
+            }
+        )
+    
+    return {
+        "screenshot_id": screenshot_id,
+        "status": screenshot.get("status"),
+        "message": "Screenshot accepted for processing"
+    }
+
+@router.get("/screenshots/{screenshot_id}/status")
+async def get_screenshot_status(
+    screenshot_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Processing status of a screenshot (owner, or admins and managers of the organization)"""
+    query = {"id": screenshot_id, "organization_id": current_user.organization_id}
+    if current_user.role not in ['admin', 'manager']:
+        query["user_id"] = current_user.id
+    screenshot = await DatabaseOperations.get_document("screenshots", query)
+    if not screenshot:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Screenshot not found"
+        )
+    
+    screenshot = storage_service.resolve_urls(screenshot)
+    return {
+        "screenshot_id": screenshot["id"],
+        "status": screenshot.get("status", ScreenshotStatus.READY),
+        "stage": screenshot.get("stage"),
+        "stage_attempts": screenshot.get("stage_attempts", {}),
+        "error": screenshot.get("processing_error"),
+        "screenshot_url": screenshot.get("screenshot_url"),
+        "thumbnail_url": screenshot.get("thumbnail_url"),
+        "derivatives": screenshot.get("derivatives", {}),
+        "duplicate_of": screenshot.get("duplicate_of"),
+        "similarity_to_previous": screenshot.get("similarity_to_previous")
+    }
+
 @router.post("/activity/update")
 async def update_activity(
     activity_data: ActivityUpdate,
@@ -177,7 +369,7 @@ async def update_activity(
                 keystroke_count=activity_data.keystroke_count,
                 active_application=activity_data.active_application
             )
-            await DatabaseOperations.create_document("keystroke_data", keystroke_data.dict())
+            await write_buffer.add("keystroke_data", keystroke_data.dict())
         
         # Update activity session
         update_data = {
@@ -217,6 +409,194 @@ async def update_activity(
             detail="Failed to update activity"
         )
 
+@router.post("/activity/batch")
+async def ingest_activity_batch(
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """Ingest a batch of activity samples from a desktop agent (organization-specific)
+
+    The body is an ``ActivityBatch`` JSON document, optionally sent with
+    ``Content-Encoding: gzip`` or ``deflate``. Samples may span several time
+    entries; ownership is validated once per batch and every collection is
+    written with a single bulk insert.
+    """
+    batch = await parse_activity_batch(request)
+    
+    if not batch.samples:
+        return {"message": "No activity samples received", "accepted": 0, "time_entries": 0}
+    
+    try:
+        samples_by_entry = defaultdict(list)
+        for sample in batch.samples:
+            samples_by_entry[sample.time_entry_id].append(sample)
+        time_entry_ids = list(samples_by_entry.keys())
+        
+        # CRITICAL SECURITY: Verify every time entry belongs to the user's organization
+        time_entries = await DatabaseOperations.get_documents(
+            "time_entries",
+            {
+                "id": {"$in": time_entry_ids},
+                "user_id": current_user.id,
+                "organization_id": current_user.organization_id
+            },
+            projection={"id": 1}
+        )
+        owned_ids = {entry["id"] for entry in time_entries}
+        if owned_ids != set(time_entry_ids):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Time entry not found"
+            )
+        
+        # Find open activity sessions for all entries in one query
+        open_sessions = await DatabaseOperations.get_documents(
+            "activity_sessions",
+            {
+                "user_id": current_user.id,
+                "time_entry_id": {"$in": time_entry_ids},
+                "organization_id": current_user.organization_id,
+                "session_end": None
+            },
+            projection={"id": 1, "time_entry_id": 1}
+        )
+        session_ids = {session["time_entry_id"]: session["id"] for session in open_sessions}
+        
+        # CRITICAL SECURITY: Build all rows with organization context
+        new_sessions = []
+        keystroke_rows = []
+        keyboard_rows = []
+        mouse_rows = []
+        
+        for time_entry_id, samples in samples_by_entry.items():
+            if time_entry_id not in session_ids:
+                session_data = ActivitySession(
+                    user_id=current_user.id,
+                    time_entry_id=time_entry_id,
+                    organization_id=current_user.organization_id,
+                    session_start=min(sample.timestamp for sample in samples)
+                )
+                new_sessions.append(session_data.dict())
+                session_ids[time_entry_id] = session_data.id
+            
+            for sample in samples:
+                if sample.keystroke_count > 0:
+                    keystroke_rows.append(KeystrokeData(
+                        user_id=current_user.id,
+                        time_entry_id=time_entry_id,
+                        organization_id=current_user.organization_id,
+                        timestamp=sample.timestamp,
+                        keystroke_count=sample.keystroke_count,
+                        active_application=sample.active_application
+                    ).dict())
+                    keyboard_rows.append(KeyboardActivityData(
+                        user_id=current_user.id,
+                        time_entry_id=time_entry_id,
+                        organization_id=current_user.organization_id,
+                        timestamp=sample.timestamp,
+                        keystroke_count=sample.keystroke_count,
+                        typing_speed_wpm=sample.typing_speed,
+                        active_application=sample.active_application
+                    ).dict())
+                
+                if sample.mouse_clicks > 0 or sample.mouse_movements > 0:
+                    mouse_rows.append(MouseActivityData(
+                        user_id=current_user.id,
+                        time_entry_id=time_entry_id,
+                        organization_id=current_user.organization_id,
+                        timestamp=sample.timestamp,
+                        click_count=sample.mouse_clicks,
+                        movement_distance=sample.movement_distance,
+                        active_application=sample.active_application
+                    ).dict())
+        
+        inserted = await DatabaseOperations.insert_many("activity_sessions", new_sessions)
+        if inserted["errors"]:
+            raise RuntimeError(f"Failed to create activity sessions: {inserted['errors'][:3]}")
+        await write_buffer.add_many("keystroke_data", keystroke_rows)
+        await write_buffer.add_many("keyboard_activity", keyboard_rows)
+        await write_buffer.add_many("mouse_activity", mouse_rows)
+        
+        # One session update and one real-time snapshot per time entry, each sent as a single bulk write
+        session_updates = []
+        realtime_updates = []
+        for time_entry_id, samples in samples_by_entry.items():
+            applications = sorted({s.active_application for s in samples if s.active_application})
+            websites = sorted({s.current_url for s in samples if s.current_url})
+            
+            update_data = {
+                "$inc": {
+                    "total_keystrokes": sum(s.keystroke_count for s in samples),
+                    "total_mouse_clicks": sum(s.mouse_clicks for s in samples),
+                    "total_mouse_movements": sum(s.mouse_movements for s in samples)
+                },
+                "$set": {
+                    "updated_at": datetime.utcnow()
+                }
+            }
+            if applications or websites:
+                update_data["$addToSet"] = {}
+            if applications:
+                update_data["$addToSet"]["applications_used"] = {"$each": applications}
+            if websites:
+                update_data["$addToSet"]["websites_visited"] = {"$each": websites}
+            
+            # CRITICAL SECURITY: Update activity session with organization validation
+            session_updates.append(UpdateOne(
+                {"id": session_ids[time_entry_id], "organization_id": current_user.organization_id},
+                update_data
+            ))
+            
+            latest = max(samples, key=lambda s: s.timestamp)
+            activity_level = await ProductivityAnalyzer.calculate_activity_level(
+                latest.keystroke_count,
+                latest.mouse_clicks,
+                latest.mouse_movements
+            )
+            productivity_level = await ProductivityAnalyzer.determine_productivity_level(
+                activity_level,
+                latest.active_application,
+                latest.current_url
+            )
+            
+            realtime_updates.append(UpdateOne(
+                {
+                    "time_entry_id": time_entry_id,
+                    "user_id": current_user.id,
+                    "organization_id": current_user.organization_id,
+                    "tracking_status": TrackingStatus.ACTIVE
+                },
+                {"$set": {
+                    "current_activity_level": activity_level,
+                    "productivity_level": productivity_level,
+                    "recent_keystrokes": latest.keystroke_count,
+                    "recent_mouse_clicks": latest.mouse_clicks,
+                    "recent_mouse_movements": latest.mouse_movements,
+                    "current_application": latest.active_application,
+                    "current_website": latest.current_url,
+                    "timestamp": latest.timestamp,
+                    "updated_at": datetime.utcnow()
+                }}
+            ))
+        
+        await DatabaseOperations.bulk_write("activity_sessions", session_updates, ordered=False)
+        await DatabaseOperations.bulk_write("real_time_activity", realtime_updates, ordered=False)
+        
+        return {
+            "message": "Activity batch recorded successfully",
+            "accepted": len(batch.samples),
+            "time_entries": len(time_entry_ids)
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Activity batch error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to record activity batch"
+        )
+
 @router.post("/application/switch")
 async def record_application_switch(
     app_data: ApplicationSwitch,
@@ -236,21 +616,26 @@ async def record_application_switch(
             )
         
         # CRITICAL SECURITY: End previous application usage with organization validation
-        await DatabaseOperations.update_document(
+        open_usage = await DatabaseOperations.get_document(
             "application_usage",
             {
                 "user_id": current_user.id,
                 "time_entry_id": app_data.time_entry_id,
                 "organization_id": current_user.organization_id,
                 "end_time": None
-            },
-            {
-                "$set": {
-                    "end_time": app_data.switch_time,
-                    "duration_seconds": {"$subtract": [app_data.switch_time, "$start_time"]}
-                }
             }
         )
+        if open_usage:
+            switch_time = app_data.switch_time
+            if switch_time.tzinfo:
+                # Stored datetimes come back as naive UTC
+                switch_time = switch_time.astimezone(timezone.utc).replace(tzinfo=None)
+            duration = (switch_time - open_usage["start_time"]).total_seconds()
+            await DatabaseOperations.update_document(
+                "application_usage",
+                {"id": open_usage["id"], "organization_id": current_user.organization_id, "end_time": None},
+                {"$set": {"end_time": app_data.switch_time, "duration_seconds": max(0, int(duration))}}
+            )
         
         # Determine application category
         category = categorize_application(app_data.application_name)
@@ -266,6 +651,7 @@ async def record_application_switch(
             start_time=app_data.switch_time
         )
         
+        # Written directly: the next switch closes this row, so it must be visible right away
         await DatabaseOperations.create_document("application_usage", app_usage.dict())
         
         return {"message": "Application switch recorded successfully"}
@@ -337,6 +723,7 @@ async def record_website_navigation(
                 visit_time=nav_data.navigation_time
             )
             
+            # Written directly: the next navigation looks this visit up to count page views
             await DatabaseOperations.create_document("website_visits", website_visit.dict())
         
         return {"message": "Website navigation recorded successfully"}
@@ -438,12 +825,13 @@ async def get_screenshots(
                 "user_id": current_user.id,
                 "time_entry_id": time_entry_id,
                 "organization_id": current_user.organization_id,
-                "is_deleted": False
+                "is_deleted": False,
+                "status": {"$nin": PENDING_STATUSES}
             },
             sort=[("timestamp", -1)]
         )
         
-        return {"screenshots": screenshots}
+        return {"screenshots": [screenshot_response(screenshot) for screenshot in screenshots]}
         
     except Exception as e:
         logger.error(f"Get screenshots error: {e}")
@@ -473,7 +861,8 @@ async def get_admin_screenshots(
         # Build query filter
         query_filter = {
             "organization_id": current_user.organization_id,
-            "is_deleted": False
+            "is_deleted": False,
+            "status": {"$nin": PENDING_STATUSES}
         }
         
         # Filter by specific user if provided
@@ -530,7 +919,7 @@ async def get_admin_screenshots(
         for screenshot in screenshots:
             user_info = users.get(screenshot.get("user_id"), {})
             enhanced_screenshots.append({
-                **screenshot,
+                **screenshot_response(screenshot),
                 "user_name": user_info.get("name", "Unknown User"),
                 "user_email": user_info.get("email", "")
             })
@@ -592,23 +981,96 @@ async def delete_screenshot(
         )
 
 # Helper functions
-def create_thumbnail(image_content: bytes, size: tuple = (200, 150)) -> bytes:
-    """Create thumbnail from image content"""
+
+# Screenshots still in the pipeline (or waiting for their upload) are not shown in galleries
+PENDING_STATUSES = [ScreenshotStatus.AWAITING_UPLOAD, ScreenshotStatus.PENDING, ScreenshotStatus.PROCESSING]
+
+# Screenshot fields returned to clients; pipeline internals (spool paths, leases, source objects) stay server-side
+SCREENSHOT_FIELDS = (
+    "id", "user_id", "time_entry_id", "organization_id", "screenshot_url", "thumbnail_url", "derivatives",
+    "screenshot_type", "timestamp", "activity_level", "blur_level", "status", "storage_tier",
+    "similarity_to_previous", "screen_unchanged", "duplicate_of"
+)
+
+def screenshot_response(screenshot: Dict[str, Any]) -> Dict[str, Any]:
+    """Client view of a screenshot document, with signed or presigned URLs"""
+    screenshot = storage_service.resolve_urls(screenshot)
+    response = {field: screenshot.get(field) for field in SCREENSHOT_FIELDS}
+    response["status"] = response["status"] or ScreenshotStatus.READY
+    response["derivatives"] = response["derivatives"] or {}
+    return response
+
+async def get_blur_level(current_user: User) -> float:
+    """Privacy blur to apply to the user's screenshots, from their monitoring settings"""
+    settings = await DatabaseOperations.get_document(
+        "monitoring_settings", 
+        {"user_id": current_user.id, "organization_id": current_user.organization_id}
+    )
+    if settings and settings.get("blur_screenshots", False):
+        return 50.0  # Apply moderate blur for privacy
+    return 0.0
+
+async def parse_activity_batch(request: Request) -> ActivityBatch:
+    """Read, decompress and validate an activity batch request body"""
+    max_bytes = app_settings.ACTIVITY_BATCH_MAX_BYTES
+    too_large = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Activity batch exceeds maximum size of {max_bytes} bytes"
+    )
+    invalid_compression = HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Invalid compressed activity batch"
+    )
+    
+    encoding = request.headers.get("content-encoding", "identity").lower()
+    if encoding in ("gzip", "deflate"):
+        # wbits 47 auto-detects gzip and zlib headers
+        decompressor = zlib.decompressobj(47)
+    elif encoding == "identity":
+        decompressor = None
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Unsupported content encoding: {encoding}"
+        )
+    
+    # Both the bytes received and the decompressed body are capped while streaming
+    body = bytearray()
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > max_bytes:
+            raise too_large
+        if decompressor:
+            try:
+                chunk = decompressor.decompress(chunk, max_bytes + 1 - len(body))
+            except zlib.error:
+                raise invalid_compression
+            if decompressor.unconsumed_tail:
+                raise too_large
+        body += chunk
+        if len(body) > max_bytes:
+            raise too_large
+    
+    if decompressor and not decompressor.eof:
+        # Truncated stream
+        raise invalid_compression
+    
     try:
-        with Image.open(io.BytesIO(image_content)) as img:
-            img.thumbnail(size, Image.Resampling.LANCZOS)
-            
-            # Convert to RGB if necessary
-            if img.mode in ("RGBA", "P"):
-                img = img.convert("RGB")
-            
-            # Save thumbnail to bytes
-            thumbnail_io = io.BytesIO()
-            img.save(thumbnail_io, format="JPEG", quality=85)
-            return thumbnail_io.getvalue()
-    except Exception as e:
-        logger.error(f"Thumbnail creation error: {e}")
-        return image_content  # Return original if thumbnail creation fails
+        batch = ActivityBatch(**json.loads(body))
+    except (ValueError, TypeError, ValidationError):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Invalid activity batch"
+        )
+    
+    if len(batch.samples) > app_settings.ACTIVITY_BATCH_MAX_SAMPLES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Activity batch exceeds maximum of {app_settings.ACTIVITY_BATCH_MAX_SAMPLES} samples"
+        )
+    
+    return batch
 
 def categorize_application(app_name: str) -> ApplicationCategory:
     """Categorize application based on name"""
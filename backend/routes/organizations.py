@@ -237,7 +237,8 @@ async def get_organization_stats(
             active_users=active_users,
             total_projects=total_projects,
             total_time_tracked=round(total_time_hours, 2),
-            storage_used_gb=0.0,  # Calculate actual storage usage
+            # Maintained incrementally by the screenshot pipeline and the retention sweeper
+            storage_used_gb=round(max(organization.get("storage_used_bytes", 0), 0) / 1024 ** 3, 4),
             plan_limits={
                 "max_users": organization.get("max_users", 5),
                 "max_projects": organization.get("max_projects", 10),
@@ -3,8 +3,6 @@ from fastapi.responses import JSONResponse
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timedelta
 import base64
-import os
-import uuid
 import asyncio
 from PIL import Image
 import io
@@ -17,10 +15,14 @@ from models.productivity import (
     StartTrackingRequest, ActivityUpdateRequest, ProductivityReportRequest,
     TrackingStatus, ProductivityLevel, AlertType, ProductivityGoal
 )
-from models.monitoring import ScreenshotData, ScreenshotUpload
+from models.monitoring import ScreenshotUpload
 from database.mongodb import DatabaseOperations
+from database.joins import fetch_users
+from services.write_buffer import write_buffer
 from utils.productivity_analyzer import ProductivityAnalyzer
 from utils.screenshot_processor import ScreenshotProcessor
+from services.screenshot_pipeline import screenshot_pipeline, spool_extension
+from services.storage import FileTooLarge
 from utils.notification_service import NotificationService
 
 router = APIRouter(prefix="/api/productivity", tags=["productivity"])
@@ -119,7 +121,7 @@ async def update_activity_data(
                 typing_speed_wpm=request.typing_speed,
                 active_application=request.active_application
             )
-            await DatabaseOperations.create_document(
+            await write_buffer.add(
                 "keyboard_activity",
                 keyboard_data.dict()
             )
@@ -134,7 +136,7 @@ async def update_activity_data(
                 movement_distance=request.movement_distance,
                 active_application=request.active_application
             )
-            await DatabaseOperations.create_document(
+            await write_buffer.add(
                 "mouse_activity",
                 mouse_data.dict()
             )
@@ -199,14 +201,14 @@ async def update_activity_data(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update activity: {str(e)}")
 
-@router.post("/screenshots/upload")
+@router.post("/screenshots/upload", status_code=202)
 async def upload_screenshot(
     time_entry_id: str = Form(...),
     activity_level: float = Form(...),
     screenshot: UploadFile = File(...),
     current_user: User = Depends(get_current_user)
 ):
-    """Upload and analyze screenshot during tracking"""
+    """Accept a screenshot during tracking; it is thumbnailed and analyzed in the background"""
     try:
         # Verify time entry
         time_entry = await DatabaseOperations.get_document(
@@ -221,55 +223,17 @@ async def upload_screenshot(
         if not time_entry:
             raise HTTPException(status_code=404, detail="Time entry not found")
         
-        # Process screenshot
-        screenshot_id = str(uuid.uuid4())
-        screenshot_data = await screenshot.read()
-        
-        # Save screenshot securely
-        upload_dir = os.getenv("UPLOAD_DIR", "uploads")
-        org_dir = os.path.join(upload_dir, "screenshots", current_user.organization_id)
-        os.makedirs(org_dir, exist_ok=True)
-        
-        screenshot_path = os.path.join(org_dir, f"{screenshot_id}.png")
-        thumbnail_path = os.path.join(org_dir, f"{screenshot_id}_thumb.png")
-        
-        # Save original screenshot
-        with open(screenshot_path, "wb") as f:
-            f.write(screenshot_data)
-        
-        # Create thumbnail
-        await ScreenshotProcessor.create_thumbnail(screenshot_data, thumbnail_path)
-        
-        # Analyze screenshot with AI
-        analysis = await ScreenshotProcessor.analyze_screenshot(
-            screenshot_data,
-            current_user.id,
-            current_user.organization_id
-        )
-        
-        # Store screenshot record
-        screenshot_record = ScreenshotData(
-            id=screenshot_id,
+        # Spool the screenshot; thumbnailing, analysis and storage run in the pipeline
+        screenshot_record = await screenshot_pipeline.accept(
+            file=screenshot,
+            extension=spool_extension(screenshot.content_type),
             user_id=current_user.id,
-            time_entry_id=time_entry_id,
             organization_id=current_user.organization_id,
-            screenshot_url=f"/uploads/screenshots/{current_user.organization_id}/{screenshot_id}.png",
-            thumbnail_url=f"/uploads/screenshots/{current_user.organization_id}/{screenshot_id}_thumb.png",
-            activity_level=activity_level
-        )
-        
-        await DatabaseOperations.create_document(
-            "screenshots",
-            screenshot_record.dict()
+            time_entry_id=time_entry_id,
+            activity_level=activity_level,
+            analyze=True
         )
         
-        # Store analysis
-        if analysis:
-            await DatabaseOperations.create_document(
-                "screenshot_analysis",
-                analysis.dict()
-            )
-        
         # Update real-time tracking
         await DatabaseOperations.update_document(
             "real_time_activity",
@@ -281,13 +245,19 @@ async def upload_screenshot(
             {"last_screenshot_time": datetime.utcnow()}
         )
         
+        # Analysis runs asynchronously and is stored in screenshot_analysis
         return {
             "success": True,
-            "screenshot_id": screenshot_id,
-            "analysis": analysis.dict() if analysis else None,
-            "productivity_score": analysis.productivity_score if analysis else 0.0
+            "screenshot_id": screenshot_record["id"],
+            "status": screenshot_record["status"],
+            "analysis": None,
+            "productivity_score": None
         }
         
+    except HTTPException:
+        raise
+    except FileTooLarge:
+        raise HTTPException(status_code=413, detail="Screenshot exceeds the maximum upload size")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to upload screenshot: {str(e)}")
 
@@ -474,12 +444,10 @@ async def get_currently_active_users(
         )
         
         # Enrich with user data
+        users = await fetch_users(active_sessions, "user_id", current_user.organization_id)
         active_users = []
         for session in active_sessions:
-            user = await DatabaseOperations.get_document(
-                "users",
-                {"id": session["user_id"]}
-            )
+            user = users.get(session["user_id"])
             if user:
                 active_users.append({
                     "user_id": session["user_id"],
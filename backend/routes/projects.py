@@ -19,12 +19,14 @@ async def create_project(
     try:
         # Validate team members belong to same organization
         if project_data.team_members:
+            members = await DatabaseOperations.find_by_ids(
+                "users",
+                project_data.team_members,
+                query={"organization_id": current_user.organization_id},
+                projection={"id": 1}
+            )
             for member_id in project_data.team_members:
-                member = await DatabaseOperations.get_document(
-                    "users", 
-                    {"id": member_id, "organization_id": current_user.organization_id}
-                )
-                if not member:
+                if member_id not in members:
                     raise HTTPException(
                         status_code=status.HTTP_400_BAD_REQUEST,
                         detail=f"Team member {member_id} not found in your organization"
@@ -145,12 +147,14 @@ async def update_project(
         
         # Validate team members belong to same organization
         if "team_members" in update_data and update_data["team_members"]:
+            members = await DatabaseOperations.find_by_ids(
+                "users",
+                update_data["team_members"],
+                query={"organization_id": current_user.organization_id},
+                projection={"id": 1}
+            )
             for member_id in update_data["team_members"]:
-                member = await DatabaseOperations.get_document(
-                    "users", 
-                    {"id": member_id, "organization_id": current_user.organization_id}
-                )
-                if not member:
+                if member_id not in members:
                     raise HTTPException(
                         status_code=status.HTTP_400_BAD_REQUEST,
                         detail=f"Team member {member_id} not found in your organization"
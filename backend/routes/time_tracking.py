@@ -4,8 +4,11 @@ from datetime import datetime, timedelta, date
 from models.time_tracking import TimeEntry, TimeEntryCreate, TimeEntryUpdate, TimeEntryManual, ActivityData, Screenshot
 from models.user import User
 from auth.dependencies import get_current_user, require_admin_or_manager
+from auth.user_cache import principal_cache
 from database.mongodb import DatabaseOperations
+from database.joins import fetch_users, fetch_projects
 from services.storage import storage_service
+from services.time_rollups import apply_entry_change
 import logging
 
 logger = logging.getLogger(__name__)
@@ -73,6 +76,7 @@ async def start_time_tracking(
             {"id": current_user.id, "organization_id": current_user.organization_id},
             {"$set": {"status": "active", "last_active": datetime.utcnow()}}
         )
+        principal_cache.invalidate(current_user.id)
         
         return time_entry
         
@@ -172,17 +176,18 @@ async def stop_time_tracking(
         
         logger.info(f"Updating time entry {entry_id} with duration {duration} seconds")
         
+        # Only an entry that is still running is stopped, so concurrent stops count its time once
         success = await DatabaseOperations.update_document(
             "time_entries",
-            {"id": entry_id},
+            {"id": entry_id, "end_time": None},
             update_data
         )
         
         if not success:
-            logger.error(f"Failed to update time entry {entry_id}")
+            logger.warning(f"Time entry {entry_id} was stopped by a concurrent request")
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to update time entry"
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Time entry already stopped"
             )
         
         # Update project hours safely
@@ -208,6 +213,9 @@ async def stop_time_tracking(
                 detail="Failed to retrieve updated time entry"
             )
         
+        # Add the completed entry to the daily rollups
+        await apply_entry_change(None, updated_entry)
+        
         logger.info(f"Successfully stopped time tracking for entry {entry_id}")
         return TimeEntry(**updated_entry)
         
@@ -520,6 +528,8 @@ async def create_manual_time_entry(
             {"$inc": {"hours_tracked": duration / 3600}}
         )
         
+        await apply_entry_change(None, time_entry.model_dump())
+        
         return time_entry
         
     except HTTPException:
@@ -561,6 +571,8 @@ async def update_time_entry(
         
         # Get updated entry
         updated_entry = await DatabaseOperations.get_document("time_entries", {"id": entry_id})
+        if update_data:
+            await apply_entry_change(entry_data, updated_entry)
         return TimeEntry(**updated_entry)
         
     except HTTPException:
@@ -638,6 +650,7 @@ async def upload_screenshot(
             {"$push": {"screenshots": screenshot_url}}
         )
         
+        screenshot.url = storage_service.client_url(screenshot_url)
         return screenshot
         
     except HTTPException:
@@ -685,6 +698,9 @@ async def get_daily_report(
         
         total_hours = total_duration / 3600 if total_duration > 0 else 0
         
+        # CRITICAL SECURITY: Only get projects from same organization
+        project_docs = await fetch_projects(entries_data, "project_id", current_user.organization_id)
+        
         # Group by project
         projects = {}
         for entry in entries_data:
@@ -694,11 +710,7 @@ async def get_daily_report(
                     continue
                     
                 if project_id not in projects:
-                    # CRITICAL SECURITY: Only get projects from same organization
-                    project_data = await DatabaseOperations.get_document(
-                        "projects", 
-                        {"id": project_id, "organization_id": current_user.organization_id}
-                    )
+                    project_data = project_docs.get(project_id)
                     projects[project_id] = {
                         "project_name": project_data.get("name", "Unknown") if project_data else "Unknown",
                         "hours": 0,
@@ -786,11 +798,9 @@ async def get_team_time_report(
         team_data = await DatabaseOperations.aggregate("time_entries", pipeline)
         
         # CRITICAL SECURITY: Get user details only from same organization
+        users = await fetch_users(team_data, "_id", current_user.organization_id)
         for user_data in team_data:
-            user_info = await DatabaseOperations.get_document(
-                "users", 
-                {"id": user_data["_id"], "organization_id": current_user.organization_id}
-            )
+            user_info = users.get(user_data["_id"])
             user_data["user_name"] = user_info["name"] if user_info else "Unknown"
             user_data["total_hours"] = user_data["total_hours"] / 3600
         
@@ -0,0 +1,195 @@
+"""
+Serving of local uploads (STORAGE_TYPE=local), replacing the StaticFiles mount
+
+- Access is authorized by signed URLs (auth/url_signing.py), not per-file lookups
+- Content-addressed files (named by their SHA-256) get that hash as a strong
+  ETag and an immutable Cache-Control; other files get a cached SHA-256 ETag
+  and must be revalidated
+- Single byte ranges (Range / If-Range) and conditional requests (304)
+- The body is sent with the ASGI zero-copy or path-send extensions when the
+  server offers them, or handed to nginx with X-Accel-Redirect when
+  UPLOADS_ACCEL_REDIRECT_PREFIX is set; otherwise it is streamed in chunks
+"""
+import asyncio
+import hashlib
+import mimetypes
+import os
+import re
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+import aiofiles
+from fastapi import APIRouter, HTTPException, Request, status
+from fastapi.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from auth.url_signing import verify_path
+from config import settings
+
+router = APIRouter(tags=["uploads"])
+
+SEND_CHUNK_SIZE = 256 * 1024
+
+# Stems of content-addressed files: "<sha256>" or "<sha256>_<width>w"
+CONTENT_ADDRESSED = re.compile(r"^([0-9a-f]{64})(?:_\d+w)?$")
+
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+# SHA-256 ETags of files that are not content-addressed, keyed by (path, size, mtime)
+_etag_cache: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+ETAG_CACHE_SIZE = 4096
+
+def _hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+async def file_etag(path: Path, stat: os.stat_result) -> Tuple[str, bool]:
+    """Strong ETag of a file and whether the file is content-addressed (immutable)"""
+    match = CONTENT_ADDRESSED.match(path.stem)
+    if match:
+        # Stored names are the hash of the bytes, derivatives the hash of their source plus the width
+        return f'"{path.stem}"', True
+
+    key = (str(path), stat.st_size, stat.st_mtime_ns)
+    etag = _etag_cache.get(key)
+    if etag is None:
+        etag = f'"{await asyncio.to_thread(_hash_file, path)}"'
+        _etag_cache[key] = etag
+        if len(_etag_cache) > ETAG_CACHE_SIZE:
+            _etag_cache.popitem(last=False)
+    else:
+        _etag_cache.move_to_end(key)
+    return etag, False
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    First-to-last byte (inclusive) of a single ``bytes=`` range
+
+    Returns None for headers this server ignores (other units, several
+    ranges, malformed values) and raises ValueError when the range cannot
+    be satisfied.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start, sep, end = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if start:
+            first = int(start)
+            last = int(end) if end else size - 1
+        elif end:
+            # Suffix range: the last N bytes
+            first = max(size - int(end), 0)
+            last = size - 1
+        else:
+            return None
+    except ValueError:
+        return None
+    if first >= size or first > last or size == 0:
+        raise ValueError("Range not satisfiable")
+    return first, min(last, size - 1)
+
+def _etag_matches(header: str, etag: str) -> bool:
+    return header.strip() == "*" or etag in (tag.strip() for tag in header.split(","))
+
+class UploadFileResponse(Response):
+    """Sends a byte range of a file, zero-copy when the ASGI server supports it"""
+
+    def __init__(self, path: Path, offset: int, count: int, status_code: int, headers: dict, send_body: bool):
+        super().__init__(status_code=status_code, headers=headers)
+        self.path = path
+        self.offset = offset
+        self.count = count
+        self.send_body = send_body
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body or self.count == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        extensions = scope.get("extensions") or {}
+        if "http.response.zerocopysend" in extensions:
+            fd = os.open(self.path, os.O_RDONLY)
+            try:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": fd,
+                    "offset": self.offset,
+                    "count": self.count,
+                    "more_body": False
+                })
+            finally:
+                os.close(fd)
+            return
+        if "http.response.pathsend" in extensions and self.offset == 0 and self.count == self.path.stat().st_size:
+            await send({"type": "http.response.pathsend", "path": str(self.path)})
+            return
+
+        remaining = self.count
+        async with aiofiles.open(self.path, "rb") as f:
+            await f.seek(self.offset)
+            while remaining > 0:
+                chunk = await f.read(min(SEND_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            # The file shrank while sending; end the response rather than hang
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+@router.api_route("/uploads/{file_path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def serve_upload(file_path: str, request: Request, exp: Optional[int] = None, sig: Optional[str] = None):
+    """Serve a file from the uploads directory"""
+    if settings.UPLOADS_REQUIRE_SIGNED_URLS and not verify_path(request.url.path, exp, sig):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid or expired file URL")
+
+    upload_dir = settings.uploads_path.resolve()
+    full_path = (upload_dir / file_path).resolve()
+    if (not full_path.is_relative_to(upload_dir) or full_path.suffix in (".part", ".tmp")
+            or not full_path.is_file()):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+
+    stat = full_path.stat()
+    etag, immutable = await file_etag(full_path, stat)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    headers["Content-Type"] = mimetypes.guess_type(full_path.name)[0] or "application/octet-stream"
+    if settings.UPLOADS_ACCEL_REDIRECT_PREFIX:
+        # nginx serves the file itself (sendfile, ranges) from an internal location
+        headers["X-Accel-Redirect"] = f"{settings.UPLOADS_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{file_path}"
+        return Response(headers=headers)
+
+    size = stat.st_size
+    offset, count, status_code = 0, size, status.HTTP_200_OK
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, headers=headers)
+        if byte_range:
+            first, last = byte_range
+            offset, count, status_code = first, last - first + 1, status.HTTP_206_PARTIAL_CONTENT
+            headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+
+    headers["Content-Length"] = str(count)
+    return UploadFileResponse(full_path, offset, count, status_code, headers, send_body=request.method != "HEAD")
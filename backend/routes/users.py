@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException, status, Depends, Query
 from typing import List, Optional
 from models.user import User, UserUpdate, UserResponse, UserRole
 from auth.dependencies import get_current_user, require_admin_or_manager, validate_same_organization_user
+from auth.user_cache import principal_cache
 from database.mongodb import DatabaseOperations
 import logging
 from datetime import datetime
@@ -105,6 +106,7 @@ async def update_current_user(
                 {"id": current_user.id, "organization_id": current_user.organization_id},
                 {"$set": update_data}
             )
+            principal_cache.invalidate(current_user.id)
         
         # Get updated user with organization validation
         updated_user_data = await DatabaseOperations.get_document(
@@ -181,6 +183,7 @@ async def update_user(
                 {"id": user_id, "organization_id": current_user.organization_id},
                 {"$set": update_data}
             )
+            principal_cache.invalidate(user_id)
         
         # Get updated user with organization validation
         updated_user_data = await DatabaseOperations.get_document(
@@ -249,6 +252,7 @@ async def delete_user(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found"
             )
+        principal_cache.invalidate(user_id)
         
         # Update organization user count
         await DatabaseOperations.update_document(
@@ -1,10 +1,15 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException
 from websocket.manager import manager
+from websocket.activity import activity_aggregator, ACTIVITY_ROOM
+from websocket.protocol import negotiate
 from auth.jwt_handler import verify_token
+from auth.dependencies import get_current_user
+from auth.user_cache import principal_cache
+from models.user import User, UserRole
 from database.mongodb import DatabaseOperations
+from database.joins import fetch_users
 from datetime import datetime
 import logging
-import json
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -30,19 +35,32 @@ async def get_user_from_token(token: str):
     
     return user_data
 
+async def can_join_room(organization_id: str, room: str) -> bool:
+    """Rooms are namespaced per organization; project rooms must name a project of the organization (the activity room is handled separately)"""
+    kind, _, room_id = room.partition(":")
+    if kind == "project" and room_id:
+        return await DatabaseOperations.count_documents(
+            "projects", {"id": room_id, "organization_id": organization_id}
+        ) > 0
+    return False
+
 @router.websocket("/ws/{token}")
 async def websocket_endpoint(websocket: WebSocket, token: str):
     """WebSocket endpoint for real-time communication"""
     user_data = await get_user_from_token(token)
     
-    if not user_data:
+    if not user_data or not user_data.get("organization_id"):
         await websocket.close(code=1000, reason="Invalid token")
         return
     
     user_id = user_data["id"]
+    organization_id = user_data["organization_id"]
+    connection = None
     
     try:
-        await manager.connect(websocket, user_id)
+        connection = await manager.connect(
+            websocket, user_id, organization_id, codec=negotiate(websocket.scope.get("subprotocols", []))
+        )
         
         # Update user status to online in database
         await DatabaseOperations.update_document(
@@ -50,66 +68,93 @@ async def websocket_endpoint(websocket: WebSocket, token: str):
             {"id": user_id},
             {"status": "active", "last_active": datetime.utcnow()}
         )
+        principal_cache.invalidate(user_id)
         
         # Send initial data
-        await manager.send_personal_message({
+        await manager.send_to_connection({
             "type": "connection_established",
             "data": {
                 "user_id": user_id,
-                "online_users": manager.get_online_users()
+                "connection_id": connection.id,
+                "online_users": manager.get_online_users(organization_id)
             }
-        }, user_id)
+        }, connection)
         
         while True:
             # Listen for incoming messages
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            data = frame["bytes"] if frame.get("bytes") is not None else frame.get("text")
+            message = connection.codec.decode(data)
             
             # Handle different message types
             if message.get("type") == "ping":
-                await manager.send_personal_message({
+                await manager.send_to_connection({
                     "type": "pong",
-                    "data": {"timestamp": datetime.utcnow().isoformat()}
-                }, user_id)
+                    "data": {"timestamp": datetime.utcnow()}
+                }, connection)
             
             elif message.get("type") == "activity_update":
-                # Broadcast activity update to team
-                await manager.broadcast_team_activity({
-                    "user_id": user_id,
-                    "activity": message.get("data", {})
-                })
+                # Merged into the organization's activity snapshot; managers get it with the next tick
+                data = message.get("data")
+                if isinstance(data, dict):
+                    activity_aggregator.record(organization_id, user_id, data)
             
             elif message.get("type") == "time_entry_update":
                 # Broadcast time entry update
                 await manager.broadcast_time_entry_update(
-                    user_id, 
+                    user_id,
+                    organization_id,
                     message.get("data", {})
                 )
             
+            elif message.get("type") == "subscribe":
+                room = str((message.get("data") or {}).get("room", ""))
+                if room == ACTIVITY_ROOM and user_data.get("role") in (UserRole.ADMIN, UserRole.MANAGER):
+                    await activity_aggregator.subscribe(connection)
+                    reply = "subscribed"
+                elif await can_join_room(organization_id, room):
+                    manager.join_room(connection, room)
+                    reply = "subscribed"
+                else:
+                    reply = "subscribe_rejected"
+                await manager.send_to_connection({"type": reply, "data": {"room": room}}, connection)
+            
+            elif message.get("type") == "unsubscribe":
+                room = str((message.get("data") or {}).get("room", ""))
+                manager.leave_room(connection, room)
+                await manager.send_to_connection({"type": "unsubscribed", "data": {"room": room}}, connection)
+            
     except WebSocketDisconnect:
-        await manager.disconnect(user_id)
+        if connection:
+            await manager.disconnect(connection)
         
         # Update user status to offline in database
-        await DatabaseOperations.update_document(
-            "users",
-            {"id": user_id},
-            {"status": "offline"}
-        )
+        if not manager.is_user_online(user_id):
+            await DatabaseOperations.update_document(
+                "users",
+                {"id": user_id},
+                {"status": "offline"}
+            )
+            principal_cache.invalidate(user_id)
         
     except Exception as e:
         logger.error(f"WebSocket error for user {user_id}: {e}")
-        await manager.disconnect(user_id)
+        if connection:
+            await manager.disconnect(connection)
 
 @router.get("/online-users")
-async def get_online_users():
-    """Get list of online users"""
+async def get_online_users(current_user: User = Depends(get_current_user)):
+    """Get list of online users of the current user's organization"""
     try:
-        online_user_ids = manager.get_online_users()
+        online_user_ids = manager.get_online_users(current_user.organization_id)
         
         # Get user details
+        users = await fetch_users([{"user_id": user_id} for user_id in online_user_ids])
         users_data = []
         for user_id in online_user_ids:
-            user_data = await DatabaseOperations.get_document("users", {"id": user_id})
+            user_data = users.get(user_id)
             if user_data:
                 users_data.append({
                     "id": user_data["id"],
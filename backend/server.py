@@ -1,18 +1,28 @@
 from fastapi import FastAPI, APIRouter
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 import os
+import asyncio
 import logging
 from pathlib import Path
 from contextlib import asynccontextmanager
 
 # Import database connection
 from database.mongodb import connect_to_mongo, close_mongo_connection
+from services.write_buffer import write_buffer
+from auth.user_cache import principal_cache
+from services.time_rollups import backfill_rollups_if_empty
+from services.report_jobs import report_engine
+from services.image_pool import image_pool
+from services.screenshot_pipeline import screenshot_pipeline
+from services.http_clients import http_clients
+from services.retention import retention_sweeper
+from websocket.manager import manager as ws_manager
+from websocket.activity import activity_aggregator
 
 # Import routes
 from routes import auth, users, projects, time_tracking, analytics, integrations, websocket, monitoring, advanced_analytics
-from routes import organizations, productivity
+from routes import organizations, productivity, uploads
 
 # Import configuration
 from config import settings
@@ -35,9 +45,30 @@ async def lifespan(app: FastAPI):
     """Application lifespan management"""
     # Startup
     await connect_to_mongo()
+    await http_clients.start()
+    await ws_manager.start()
+    await activity_aggregator.start()
+    if settings.WRITE_BUFFER_ENABLED:
+        await write_buffer.start()
+    rollup_backfill = asyncio.create_task(backfill_rollups_if_empty())
+    await report_engine.start()
+    await image_pool.start()
+    await screenshot_pipeline.start()
+    if settings.RETENTION_SWEEPER_ENABLED:
+        await retention_sweeper.start()
     logger.info("Hubstaff Clone API started successfully")
     yield
     # Shutdown
+    await activity_aggregator.stop()
+    await ws_manager.stop()
+    await retention_sweeper.stop()
+    await screenshot_pipeline.stop()
+    await image_pool.stop()
+    await report_engine.stop()
+    if not rollup_backfill.done():
+        rollup_backfill.cancel()
+    await write_buffer.stop()
+    await http_clients.stop()
     await close_mongo_connection()
     logger.info("Hubstaff Clone API shutdown complete")
 
@@ -94,11 +125,9 @@ app.include_router(websocket.router)
 # Include the API router in the main app
 app.include_router(api_router)
 
-# Mount static files for uploads (if storage type is local)
-if settings.STORAGE_TYPE == "local":
-    uploads_path = settings.uploads_path
-    if uploads_path.exists():
-        app.mount("/uploads", StaticFiles(directory=str(uploads_path)), name="uploads")
+# Serve local uploads (signed URLs, ETag/Range/caching); files stored before a
+# switch to remote storage stay reachable
+app.include_router(uploads.router)
 
 # Health check endpoint
 @app.get("/health")
@@ -116,7 +145,12 @@ async def api_health_check():
         "status": "healthy",
         "service": "Hubstaff Clone API",
         "version": "1.0.0",
-        "api_path": "/api"
+        "api_path": "/api",
+        "user_cache": principal_cache.stats(),
+        "image_pool": image_pool.snapshot(),
+        "outbound_http": http_clients.snapshot(),
+        "websocket": ws_manager.snapshot(),
+        "activity": activity_aggregator.snapshot()
     }
 
 # Root endpoint
@@ -0,0 +1,264 @@
+import asyncio
+import hashlib
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Methods that may be repeated after the server has seen the request
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+# Responses that are retried for idempotent requests (429 is retried for every method:
+# the server rejected the request without processing it)
+RETRY_STATUSES = {429, 502, 503, 504}
+
+# Failures where the request never reached the server, safe to retry for any method
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# Failures after the request may have been sent
+TRANSIENT_ERRORS = (httpx.ReadTimeout, httpx.WriteTimeout, httpx.RemoteProtocolError, httpx.ReadError)
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def breaker_name(integration: str, url: str, scope: Optional[str] = None) -> str:
+    """Breaker key of a request: per integration and host, and per ``scope`` within a host"""
+    parsed = httpx.URL(url)
+    name = f"{integration}:{parsed.host}:{parsed.port}" if parsed.port else f"{integration}:{parsed.host}"
+    return f"{name}/{scope}" if scope else name
+
+def secret_scope(secret: str) -> str:
+    """Breaker scope for a secret such as a webhook URL, without exposing it in logs or health output"""
+    return hashlib.sha256(secret.encode()).hexdigest()[:12]
+
+class CircuitOpen(Exception):
+    """Raised when an integration's circuit breaker is rejecting calls"""
+    pass
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker
+
+    After ``failure_threshold`` failed calls in a row the breaker opens and
+    rejects calls for ``reset_timeout`` seconds. It then lets a single trial
+    call through (half-open): success closes it, failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_started: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        state = self.state
+        if state == "closed":
+            return
+        # One trial call at a time while half-open; a trial that never reported back
+        # (e.g. a cancelled request) stops blocking after another reset_timeout
+        now = time.monotonic()
+        trial_pending = self._trial_started is not None and now - self._trial_started < self.reset_timeout
+        if state == "open" or trial_pending:
+            raise CircuitOpen(f"Circuit for {self.name} is open")
+        self._trial_started = now
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_started is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+        self._trial_started = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self.failures}
+
+class OutboundClients:
+    """
+    Application-scoped outbound HTTP clients, one per integration
+
+    Each integration ("slack", "trello", "github", "storage", ...) gets its own
+    pooled httpx.AsyncClient, so connections and TLS sessions are reused and
+    one slow host cannot exhaust the connections of another. HTTP/2 is used
+    when the ``h2`` package is installed.
+
+    ``request`` and ``stream`` add retries with full-jitter exponential
+    backoff and a circuit breaker per integration and host, so one failing
+    host does not block the integration's other hosts. Callers whose
+    tenants share a host (e.g. Slack webhooks) pass a ``breaker_scope`` to
+    keep one tenant's broken endpoint from opening the circuit for all.
+    Requests that never reached the server are retried for any method;
+    timeouts and 502/503/504 responses only for idempotent methods. A
+    response still failing with 5xx after the retries counts as one breaker
+    failure.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 30.0,
+        connect_timeout: float = 5.0,
+        retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 10.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        http2: bool = True
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.http2 = http2 and _http2_available()
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    async def start(self):
+        """Nothing to open up front; clients are created on first use (kept for lifespan symmetry)"""
+        logger.info(f"Outbound HTTP clients ready (http2={self.http2}, retries={self.retries})")
+
+    async def stop(self):
+        """Close every pooled connection"""
+        clients, self._clients = self._clients, {}
+        await asyncio.gather(*(client.aclose() for client in clients.values()), return_exceptions=True)
+
+    def client(self, integration: str) -> httpx.AsyncClient:
+        """Pooled client for an integration (use ``request`` to get retries and the breaker)"""
+        client = self._clients.get(integration)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout, http2=self.http2)
+            self._clients[integration] = client
+        return client
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        """Breaker for a ``breaker_name`` key"""
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name, self.failure_threshold, self.reset_timeout)
+            self._breakers[name] = breaker
+        return breaker
+
+    def backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Delay before retry ``attempt`` (0-based): full jitter, or the server's Retry-After"""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def request(self, integration: str, method: str, url: str,
+                      breaker_scope: Optional[str] = None, **kwargs: Any) -> httpx.Response:
+        """
+        Send a request through an integration's pooled client
+
+        Raises CircuitOpen without sending anything while the breaker is open,
+        and the last httpx error when every attempt failed.
+        """
+        return await self._send(integration, method, url, breaker_scope, False, kwargs)
+
+    @asynccontextmanager
+    async def stream(self, integration: str, method: str, url: str,
+                     breaker_scope: Optional[str] = None, **kwargs: Any) -> AsyncIterator[httpx.Response]:
+        """
+        Like ``request``, but the response body is read by the caller
+
+        Retries only happen until the response headers arrive; an error while
+        reading the body counts as a breaker failure and is raised.
+        """
+        response = await self._send(integration, method, url, breaker_scope, True, kwargs)
+        try:
+            yield response
+        except httpx.TransportError:
+            self.breaker(breaker_name(integration, url, breaker_scope)).record_failure()
+            raise
+        finally:
+            await response.aclose()
+
+    async def _send(self, integration: str, method: str, url: str, breaker_scope: Optional[str],
+                    stream: bool, kwargs: Dict[str, Any]) -> httpx.Response:
+        breaker = self.breaker(breaker_name(integration, url, breaker_scope))
+        breaker.before_call()
+        method = method.upper()
+        idempotent = method in IDEMPOTENT_METHODS
+
+        attempt = 0
+        while True:
+            try:
+                client = self.client(integration)
+                response = await client.send(client.build_request(method, url, **kwargs), stream=stream)
+            except CONNECT_ERRORS + TRANSIENT_ERRORS as e:
+                retryable = isinstance(e, CONNECT_ERRORS) or idempotent
+                if not retryable or attempt >= self.retries:
+                    breaker.record_failure()
+                    raise
+                logger.warning(f"{integration} {method} {url} failed ({type(e).__name__}), retrying")
+            else:
+                retryable = response.status_code == 429 or (idempotent and response.status_code in RETRY_STATUSES)
+                if not retryable or attempt >= self.retries:
+                    if response.status_code >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    return response
+                retry_after = response.headers.get("Retry-After")
+                await response.aclose()
+                await asyncio.sleep(self.backoff(attempt, retry_after))
+                attempt += 1
+                continue
+
+            await asyncio.sleep(self.backoff(attempt))
+            attempt += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Breaker states for the health endpoint"""
+        return {name: breaker.stats() for name, breaker in self._breakers.items()}
+
+# Global outbound client registry
+http_clients = OutboundClients(
+    max_connections=settings.OUTBOUND_HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=settings.OUTBOUND_HTTP_MAX_KEEPALIVE,
+    keepalive_expiry=settings.OUTBOUND_HTTP_KEEPALIVE_EXPIRY,
+    timeout=settings.OUTBOUND_HTTP_TIMEOUT,
+    connect_timeout=settings.OUTBOUND_HTTP_CONNECT_TIMEOUT,
+    retries=settings.OUTBOUND_HTTP_RETRIES,
+    backoff_base=settings.OUTBOUND_HTTP_BACKOFF_BASE,
+    backoff_max=settings.OUTBOUND_HTTP_BACKOFF_MAX,
+    failure_threshold=settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=settings.CIRCUIT_BREAKER_RESET_SECONDS,
+    http2=settings.OUTBOUND_HTTP2
+)
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Forking the running server would copy its event loop, threads and open connections into the workers
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+class ImagePoolBusy(Exception):
+    """Raised when the image processing queue is full"""
+    pass
+
+class ImageProcessingPool:
+    """
+    Bounded process pool for CPU-heavy screenshot processing
+
+    PIL decode/resize/encode holds the GIL for the whole operation, so running
+    it in a thread still starves the event loop. Jobs are sent to a
+    ProcessPoolExecutor with ``max_workers`` processes instead. At most
+    ``max_queued`` jobs may wait behind the running ones; beyond that ``run``
+    raises ImagePoolBusy immediately so uploads can shed load rather than
+    pile up in memory.
+
+    A job that exceeds ``job_timeout`` raises asyncio.TimeoutError to the
+    caller. The worker process cannot be interrupted, so the job keeps its
+    queue slot until it actually finishes.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queued: int = 32, job_timeout: float = 30.0):
+        self.max_workers = max(max_workers, 1)
+        self.max_queued = max(max_queued, 0)
+        self.job_timeout = job_timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+        self.stats = {"completed": 0, "failed": 0, "rejected": 0, "timed_out": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._executor is not None
+
+    @property
+    def capacity(self) -> int:
+        """Jobs that may be running or waiting at once"""
+        return self.max_workers + self.max_queued
+
+    async def start(self):
+        """Create the worker processes (called from the application lifespan)"""
+        if self.running:
+            return
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers, mp_context=multiprocessing.get_context(START_METHOD)
+        )
+        logger.info(
+            f"Image processing pool started with {self.max_workers} processes "
+            f"(queue={self.max_queued}, timeout={self.job_timeout}s)"
+        )
+
+    async def stop(self):
+        """Shut the pool down, dropping jobs that have not started"""
+        executor, self._executor = self._executor, None
+        if executor:
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+
+    async def run(self, func: Callable[..., Any], *args: Any, timeout: Optional[float] = None) -> Any:
+        """
+        Run a picklable module-level function in a worker process
+
+        Raises ImagePoolBusy when the queue is full and asyncio.TimeoutError
+        when the job takes longer than ``timeout`` (default ``job_timeout``).
+        """
+        if self._in_flight >= self.capacity:
+            self.stats["rejected"] += 1
+            raise ImagePoolBusy(f"Image processing queue is full ({self._in_flight} jobs)")
+        if not self.running:
+            await self.start()
+
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self._executor, func, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM on a huge image); replace the pool once
+            logger.error("Image processing pool was broken, restarting it")
+            self._executor = None
+            await self.start()
+            future = loop.run_in_executor(self._executor, func, *args)
+
+        self._in_flight += 1
+        future.add_done_callback(self._release)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), timeout or self.job_timeout)
+        except asyncio.TimeoutError:
+            self.stats["timed_out"] += 1
+            raise
+        except BrokenProcessPool:
+            self.stats["failed"] += 1
+            self._executor = None
+            raise
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        self.stats["completed"] += 1
+        return result
+
+    def _release(self, future: asyncio.Future):
+        self._in_flight -= 1
+        if not future.cancelled():
+            # Retrieve the exception of abandoned (timed out) jobs so it is not logged as unhandled
+            future.exception()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Pool state for the health endpoint"""
+        return {
+            "running": self.running,
+            "workers": self.max_workers,
+            "in_flight": self._in_flight,
+            "capacity": self.capacity,
+            **self.stats
+        }
+
+# Global image processing pool instance
+image_pool = ImageProcessingPool(
+    max_workers=settings.IMAGE_POOL_WORKERS,
+    max_queued=settings.IMAGE_POOL_MAX_QUEUED,
+    job_timeout=settings.IMAGE_POOL_JOB_TIMEOUT_SECONDS
+)
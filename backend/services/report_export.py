@@ -0,0 +1,58 @@
+import csv
+import io
+import json
+from typing import AsyncIterator, Dict, Any, Sequence
+
+from fastapi.responses import StreamingResponse
+
+# Formats that are streamed row by row instead of returned as one JSON body
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+# Rows are encoded and flushed to the client in batches of this size
+EXPORT_FLUSH_ROWS = 500
+
+async def csv_stream(rows: AsyncIterator[Dict[str, Any]], fieldnames: Sequence[str],
+                     flush_rows: int = EXPORT_FLUSH_ROWS) -> AsyncIterator[bytes]:
+    """Encode rows as CSV with a header line, yielding one chunk per ``flush_rows`` rows"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames, extrasaction="ignore")
+    writer.writeheader()
+    pending = 0
+    async for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= flush_rows:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+async def ndjson_stream(rows: AsyncIterator[Dict[str, Any]],
+                        flush_rows: int = EXPORT_FLUSH_ROWS) -> AsyncIterator[bytes]:
+    """Encode rows as newline-delimited JSON, yielding one chunk per ``flush_rows`` rows"""
+    lines = []
+    async for row in rows:
+        lines.append(json.dumps(row, default=str))
+        if len(lines) >= flush_rows:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+def export_response(rows: AsyncIterator[Dict[str, Any]], fieldnames: Sequence[str],
+                    export_format: str, filename: str) -> StreamingResponse:
+    """StreamingResponse for a csv or ndjson export; memory stays bounded by the flush size"""
+    if export_format == "csv":
+        body = csv_stream(rows, fieldnames)
+    else:
+        body = ndjson_stream(rows)
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'}
+    )
@@ -0,0 +1,363 @@
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any, Tuple
+
+from pymongo.errors import DuplicateKeyError
+from config import settings
+from database.mongodb import DatabaseOperations
+from database.joins import fetch_projects
+from models.advanced_analytics import ReportGenerate, ReportJob, ReportJobStatus, ReportFormat, ReportType
+from services.storage import storage_service
+
+logger = logging.getLogger(__name__)
+
+JOB_COLLECTION = "report_jobs"
+
+# A job reclaimed after this many interrupted runs is marked failed
+MAX_ATTEMPTS = 3
+
+# Columns of a report row, in CSV order
+REPORT_FIELDS = ["period", "project_id", "project_name", "hours", "activity_level", "entries"]
+
+# How rows are bucketed for each report type
+PERIOD_FORMATS = {
+    ReportType.DAILY: "%Y-%m-%d",
+    ReportType.WEEKLY: "%G-W%V",
+    ReportType.MONTHLY: "%Y-%m",
+    ReportType.CUSTOM: "%Y-%m-%d",
+}
+
+# Result formats the engine can produce; JSON reports are written as NDJSON
+REPORT_CONTENT_TYPES = {
+    ReportFormat.CSV: ("csv", "text/csv; charset=utf-8"),
+    ReportFormat.JSON: ("ndjson", "application/x-ndjson"),
+}
+
+class ReportQueueFull(Exception):
+    """Raised when an organization already has too many queued report jobs"""
+    pass
+
+# Request fields that do not change the generated rows
+PRESENTATION_FIELDS = {"include_charts", "include_insights"}
+
+def request_hash(organization_id: str, user_id: str, report: ReportGenerate) -> str:
+    """Stable hash of everything that determines a report's content"""
+    payload = json.dumps(
+        {"organization_id": organization_id, "user_id": user_id, **report.model_dump(mode="json", exclude=PRESENTATION_FIELDS)},
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _encode_chunk(rows: List[Dict[str, Any]], report_format: ReportFormat, header: bool) -> bytes:
+    if report_format == ReportFormat.CSV:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=REPORT_FIELDS, extrasaction="ignore")
+        if header:
+            writer.writeheader()
+        writer.writerows(rows)
+        return buffer.getvalue().encode("utf-8")
+    return "".join(json.dumps(row, default=str) + "\n" for row in rows).encode("utf-8")
+
+class ReportJobEngine:
+    """
+    Persistent background report generation
+
+    Jobs live in the ``report_jobs`` collection, so any worker process can
+    pick them up and they survive restarts. A fixed number of worker tasks
+    claim queued jobs with an atomic find_one_and_update; CSV/NDJSON encoding
+    runs in a thread so large chunks do not stall the event loop. Results are
+    written to storage as numbered chunks of ``chunk_rows`` rows.
+
+    Identical requests (same user, organization and parameters) share one job
+    through the unique ``dedup_key`` until the job fails or expires. The
+    stored chunks of failed and expired jobs are deleted by a cleanup task.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 2,
+        chunk_rows: int = 5000,
+        job_timeout: float = 600,
+        ttl: timedelta = timedelta(hours=24),
+        max_queued_per_org: int = 20,
+        poll_interval: float = 2.0,
+        cleanup_interval: float = 300
+    ):
+        self.max_workers = max_workers
+        self.chunk_rows = chunk_rows
+        self.job_timeout = job_timeout
+        self.ttl = ttl
+        self.max_queued_per_org = max_queued_per_org
+        self.poll_interval = poll_interval
+        self.cleanup_interval = cleanup_interval
+        self._workers: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+
+    @property
+    def running(self) -> bool:
+        return any(not worker.done() for worker in self._workers)
+
+    async def start(self):
+        """Start the worker pool (called from the application lifespan)"""
+        if self.running:
+            return
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.max_workers)]
+        self._workers.append(asyncio.create_task(self._cleanup_loop()))
+        logger.info(f"Report job engine started with {self.max_workers} workers")
+
+    async def stop(self):
+        """Cancel the workers; interrupted jobs are reclaimed once their heartbeat goes stale"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, organization_id: str, user_id: str, report: ReportGenerate) -> Tuple[Dict[str, Any], bool]:
+        """Queue a report job, or return the live job for an identical request. Returns (job, created)."""
+        if report.format not in REPORT_CONTENT_TYPES:
+            raise ValueError(f"Report format {report.format.value} is not supported")
+        if report.end_date < report.start_date:
+            raise ValueError("end_date must not be before start_date")
+
+        key = request_hash(organization_id, user_id, report)
+        now = datetime.utcnow()
+
+        # Release the dedup key of an expired job so the request is recomputed
+        await DatabaseOperations.update_document(
+            JOB_COLLECTION,
+            {"dedup_key": key, "expires_at": {"$lt": now}},
+            {"$unset": {"dedup_key": ""}}
+        )
+
+        existing = await DatabaseOperations.get_document(JOB_COLLECTION, {"dedup_key": key})
+        if existing:
+            return existing, False
+
+        queued = await DatabaseOperations.count_documents(
+            JOB_COLLECTION, {"organization_id": organization_id, "status": ReportJobStatus.QUEUED}
+        )
+        if queued >= self.max_queued_per_org:
+            raise ReportQueueFull(f"Organization has {queued} queued reports")
+
+        job = ReportJob(
+            organization_id=organization_id,
+            user_id=user_id,
+            request=report.model_dump(mode="json"),
+            request_hash=key,
+            dedup_key=key,
+            content_type=REPORT_CONTENT_TYPES[report.format][1]
+        )
+        try:
+            await DatabaseOperations.create_document(JOB_COLLECTION, job.model_dump())
+        except DuplicateKeyError:
+            # An identical request was queued concurrently
+            existing = await DatabaseOperations.get_document(JOB_COLLECTION, {"dedup_key": key})
+            if existing:
+                return existing, False
+            raise
+
+        self._wakeup.set()
+        return job.model_dump(), True
+
+    async def get_job(self, job_id: str, organization_id: str) -> Optional[Dict[str, Any]]:
+        return await DatabaseOperations.get_document(JOB_COLLECTION, {"id": job_id, "organization_id": organization_id})
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        """Atomically take the oldest queued job, or a running job whose worker stopped heartbeating"""
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=self.job_timeout + 60)
+        return await DatabaseOperations.find_one_and_update(
+            JOB_COLLECTION,
+            {"$or": [
+                {"status": ReportJobStatus.QUEUED},
+                {"status": ReportJobStatus.RUNNING, "heartbeat_at": {"$lt": stale_before}}
+            ]},
+            {
+                "$set": {"status": ReportJobStatus.RUNNING, "started_at": now, "heartbeat_at": now, "updated_at": now},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", 1)]
+        )
+
+    async def _cleanup_loop(self):
+        while True:
+            try:
+                await self.cleanup()
+            except Exception as e:
+                logger.error(f"Report chunk cleanup failed: {e}")
+            await asyncio.sleep(self.cleanup_interval)
+
+    async def cleanup(self, now: Optional[datetime] = None) -> int:
+        """Delete the stored chunks of failed and expired jobs; returns how many jobs were cleaned"""
+        now = now or datetime.utcnow()
+        jobs = await DatabaseOperations.get_documents(
+            JOB_COLLECTION,
+            {
+                "chunks.0": {"$exists": True},
+                "$or": [
+                    {"status": ReportJobStatus.FAILED},
+                    {"status": ReportJobStatus.COMPLETED, "expires_at": {"$lt": now}}
+                ]
+            },
+            projection={"id": 1, "chunks": 1},
+            limit=100
+        )
+        for job in jobs:
+            await self._delete_chunks(job)
+        return len(jobs)
+
+    async def _delete_chunks(self, job: Dict[str, Any]):
+        for chunk in job.get("chunks") or []:
+            await storage_service.delete_file(chunk)
+        await DatabaseOperations.update_document(
+            JOB_COLLECTION,
+            {"id": job["id"]},
+            {"$set": {"chunks": [], "updated_at": datetime.utcnow()}}
+        )
+
+    async def _worker(self, index: int):
+        while True:
+            try:
+                job = await self._claim()
+            except Exception as e:
+                logger.error(f"Report worker {index} failed to claim a job: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                if job.get("attempts", 0) > MAX_ATTEMPTS:
+                    raise RuntimeError(f"Report generation abandoned after {MAX_ATTEMPTS} attempts")
+                await asyncio.wait_for(self._run(job), timeout=self.job_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = "Report generation timed out" if isinstance(e, asyncio.TimeoutError) else str(e)
+                logger.error(f"Report job {job['id']} failed: {error}")
+                await DatabaseOperations.update_document(
+                    JOB_COLLECTION,
+                    {"id": job["id"]},
+                    {"$set": {"status": ReportJobStatus.FAILED, "error": error}, "$unset": {"dedup_key": ""}}
+                )
+                failed = await DatabaseOperations.get_document(JOB_COLLECTION, {"id": job["id"]})
+                if failed and failed.get("chunks"):
+                    await self._delete_chunks(failed)
+
+    async def _run(self, job: Dict[str, Any]):
+        report = ReportGenerate(**job["request"])
+        start = datetime.combine(report.start_date, datetime.min.time())
+        end = datetime.combine(report.end_date, datetime.max.time())
+        extension = REPORT_CONTENT_TYPES[report.format][0]
+
+        pipeline = [
+            {"$match": {
+                "organization_id": job["organization_id"],
+                "user_id": job["user_id"],
+                "start_time": {"$gte": start, "$lte": end}
+            }},
+            {"$group": {
+                "_id": {
+                    "period": {"$dateToString": {"format": PERIOD_FORMATS[report.report_type], "date": "$start_time"}},
+                    "project_id": "$project_id"
+                },
+                "hours": {"$sum": "$duration"},
+                "activity": {"$avg": "$activity_level"},
+                "entries": {"$sum": 1},
+                "first_start": {"$min": "$start_time"}
+            }},
+            {"$sort": {"_id.period": 1, "_id.project_id": 1}}
+        ]
+        cursor = DatabaseOperations.aggregate_cursor(
+            "time_entries", pipeline, read_preference=settings.MONGO_ANALYTICS_READ_PREFERENCE, allow_disk_use=True
+        )
+
+        projects: Dict[str, Any] = {}
+        chunks: List[str] = []
+        row_count = 0
+        batch: List[Dict[str, Any]] = []
+
+        async def write_chunk(groups: List[Dict[str, Any]]):
+            nonlocal row_count
+            new_projects = [g for g in groups if g["_id"].get("project_id") not in projects]
+            if new_projects:
+                projects.update({g["_id"].get("project_id"): None for g in new_projects})
+                projects.update(await fetch_projects(new_projects, "_id.project_id", job["organization_id"]))
+
+            rows = []
+            for group in groups:
+                project_info = projects.get(group["_id"].get("project_id"))
+                rows.append({
+                    "period": group["_id"]["period"],
+                    "project_id": group["_id"].get("project_id"),
+                    "project_name": project_info["name"] if project_info else "Unknown Project",
+                    "hours": round((group["hours"] or 0) / 3600, 2),
+                    "activity_level": round(group["activity"] or 0, 1),
+                    "entries": group["entries"]
+                })
+
+            content = await asyncio.to_thread(_encode_chunk, rows, report.format, not chunks)
+            path = f"reports/{job['organization_id']}/{job['id']}/part-{len(chunks):05d}.{extension}"
+            chunks.append(await storage_service.upload_file(path, content, REPORT_CONTENT_TYPES[report.format][1]))
+            row_count += len(rows)
+
+            # Progress follows the position of the last group within the requested range
+            covered = 1.0
+            if groups:
+                covered = (groups[-1]["first_start"] - start).total_seconds() / max((end - start).total_seconds(), 1)
+            now = datetime.utcnow()
+            await DatabaseOperations.update_document(
+                JOB_COLLECTION,
+                {"id": job["id"]},
+                {"$set": {
+                    "chunks": chunks,
+                    "row_count": row_count,
+                    "progress": round(min(max(covered, 0), 0.99) * 100, 1),
+                    "heartbeat_at": now
+                }}
+            )
+
+        async for group in cursor:
+            batch.append(group)
+            if len(batch) >= self.chunk_rows:
+                await write_chunk(batch)
+                batch = []
+        # An empty report still gets one (header-only) chunk so downloads work
+        if batch or not chunks:
+            await write_chunk(batch)
+
+        now = datetime.utcnow()
+        await DatabaseOperations.update_document(
+            JOB_COLLECTION,
+            {"id": job["id"]},
+            {"$set": {
+                "status": ReportJobStatus.COMPLETED,
+                "progress": 100.0,
+                "chunks": chunks,
+                "row_count": row_count,
+                "completed_at": now,
+                "expires_at": now + self.ttl
+            }}
+        )
+        logger.info(f"Report job {job['id']} completed with {row_count} rows in {len(chunks)} chunks")
+
+# Global report job engine instance
+report_engine = ReportJobEngine(
+    max_workers=settings.REPORT_JOB_WORKERS,
+    chunk_rows=settings.REPORT_JOB_CHUNK_ROWS,
+    job_timeout=settings.REPORT_JOB_TIMEOUT_SECONDS,
+    ttl=timedelta(hours=settings.REPORT_JOB_TTL_HOURS),
+    max_queued_per_org=settings.REPORT_JOB_MAX_QUEUED_PER_ORG,
+    poll_interval=settings.REPORT_JOB_POLL_INTERVAL,
+    cleanup_interval=settings.REPORT_JOB_CLEANUP_INTERVAL_SECONDS
+)
@@ -0,0 +1,292 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional, List, Dict, Any
+
+from pymongo.errors import DuplicateKeyError
+from config import settings
+from database.mongodb import DatabaseOperations
+from models.monitoring import ScreenshotStatus, ScreenshotStorageTier
+from services.storage import storage_service
+
+logger = logging.getLogger(__name__)
+
+SCREENSHOT_COLLECTION = "screenshots"
+OBJECT_COLLECTION = "storage_objects"
+
+# Derivative kept as the full-size image once the original is dropped
+TIERED_FORMAT = "webp"
+
+# Tiers whose screenshots still hold the original file (None: stored before tiering existed)
+ORIGINAL_TIERS = [None, ScreenshotStorageTier.ORIGINAL]
+LIVE_TIERS = ORIGINAL_TIERS + [ScreenshotStorageTier.DERIVATIVES]
+
+async def record_stored_object(organization_id: str, ref: str, size: int):
+    """
+    Count a stored file towards the organization's storage usage
+
+    ``storage_objects`` has one document per stored reference (unique), so
+    content-addressed files stored again by another screenshot are counted once.
+    """
+    try:
+        await DatabaseOperations.create_document(OBJECT_COLLECTION, {
+            "ref": ref,
+            "organization_id": organization_id,
+            "size_bytes": size,
+            "created_at": datetime.utcnow()
+        })
+    except DuplicateKeyError:
+        return
+    await DatabaseOperations.update_document(
+        "organizations", {"id": organization_id}, {"$inc": {"storage_used_bytes": size}}
+    )
+
+async def release_stored_object(ref: str) -> bool:
+    """Delete a stored file and take it off its organization's storage usage"""
+    await storage_service.delete_file(ref)
+    stored = await DatabaseOperations.get_document(OBJECT_COLLECTION, {"ref": ref})
+    if not stored or not await DatabaseOperations.delete_document(OBJECT_COLLECTION, {"ref": ref}):
+        return False
+    await DatabaseOperations.update_document(
+        "organizations", {"id": stored["organization_id"]}, {"$inc": {"storage_used_bytes": -stored["size_bytes"]}}
+    )
+    return True
+
+def _derivative_refs(screenshot: Dict[str, Any]) -> List[str]:
+    return [ref for widths in (screenshot.get("derivatives") or {}).values() for ref in widths.values() if ref]
+
+class RetentionSweeper:
+    """
+    Background screenshot retention and tiering
+
+    Per organization (``settings`` of the organization document, falling
+    back to the global defaults):
+
+    - ``screenshot_original_retention_days``: after this the original file is
+      deleted and the largest WebP derivative becomes ``screenshot_url``
+      (tier ``derivatives``)
+    - ``screenshot_retention_days``: after this every file is deleted and the
+      document keeps only its metadata (tier ``purged``)
+    - ``deleted_screenshot_grace_days``: soft-deleted screenshots are purged
+      this long after ``deleted_at``
+
+    Each phase is a range scan over an index on (organization_id,
+    storage_tier, timestamp) in batches of ``batch_size``. Files are shared
+    between screenshots through content addressing and deduplication, so a
+    file is only deleted when no other screenshot of the organization with
+    the same ``stored_hash`` still needs it. Files are deleted before the
+    document is updated; a crash in between only repeats the deletion.
+    Reservations for direct uploads that were never completed are removed
+    once their upload URL has expired.
+    """
+
+    def __init__(
+        self,
+        interval: float = 3600,
+        batch_size: int = 500,
+        original_retention_days: int = 7,
+        retention_days: int = 30,
+        deleted_grace_days: int = 1
+    ):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.defaults = {
+            "screenshot_original_retention_days": original_retention_days,
+            "screenshot_retention_days": retention_days,
+            "deleted_screenshot_grace_days": deleted_grace_days,
+        }
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Start the sweep loop (called from the application lifespan)"""
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._loop())
+        logger.info(f"Retention sweeper started (every {self.interval}s)")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Retention sweep failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def policy(self, organization: Dict[str, Any]) -> Dict[str, Optional[int]]:
+        """Retention days per phase for an organization (0 or None disables a phase)"""
+        org_settings = organization.get("settings") or {}
+        return {key: org_settings.get(key, default) for key, default in self.defaults.items()}
+
+    async def sweep(self, now: Optional[datetime] = None, organization_id: Optional[str] = None) -> Dict[str, int]:
+        """Run every phase once (for every organization, or one); returns how many screenshots each phase handled"""
+        now = now or datetime.utcnow()
+        totals = {"tiered": 0, "purged": 0, "deleted": 0, "expired_uploads": 0}
+        totals["expired_uploads"] = await self._expire_reservations(now, organization_id)
+
+        organizations = await DatabaseOperations.get_documents(
+            "organizations", {"id": organization_id} if organization_id else {}, projection={"id": 1, "settings": 1}
+        )
+        for organization in organizations:
+            policy = self.policy(organization)
+            org_id = organization["id"]
+
+            days = policy["screenshot_original_retention_days"]
+            if days:
+                totals["tiered"] += await self._run_phase(
+                    {
+                        "organization_id": org_id,
+                        "storage_tier": {"$in": ORIGINAL_TIERS},
+                        "timestamp": {"$lt": now - timedelta(days=days)},
+                        "status": ScreenshotStatus.READY
+                    },
+                    self._tier
+                )
+
+            days = policy["screenshot_retention_days"]
+            if days:
+                totals["purged"] += await self._run_phase(
+                    {
+                        "organization_id": org_id,
+                        "storage_tier": {"$in": LIVE_TIERS},
+                        "timestamp": {"$lt": now - timedelta(days=days)},
+                        "status": {"$in": [ScreenshotStatus.READY, ScreenshotStatus.FAILED]}
+                    },
+                    self._purge
+                )
+
+            days = policy["deleted_screenshot_grace_days"]
+            if days:
+                totals["deleted"] += await self._run_phase(
+                    {
+                        "organization_id": org_id,
+                        "is_deleted": True,
+                        "deleted_at": {"$lt": now - timedelta(days=days)},
+                        "storage_tier": {"$in": LIVE_TIERS},
+                        "status": {"$in": [ScreenshotStatus.READY, ScreenshotStatus.FAILED]}
+                    },
+                    self._purge
+                )
+
+        if any(totals.values()):
+            logger.info(f"Retention sweep: {totals}")
+        return totals
+
+    async def _run_phase(self, query: Dict[str, Any], handler) -> int:
+        """Apply ``handler`` to every matching screenshot, a batch at a time, oldest first"""
+        handled = 0
+        while True:
+            batch = await DatabaseOperations.get_documents(
+                SCREENSHOT_COLLECTION, query, sort=[("timestamp", 1)], limit=self.batch_size
+            )
+            if not batch:
+                return handled
+            progressed = 0
+            for screenshot in batch:
+                try:
+                    if await handler(screenshot):
+                        progressed += 1
+                except Exception as e:
+                    logger.error(f"Retention of screenshot {screenshot['id']} failed: {e}")
+            handled += progressed
+            if progressed == 0 or len(batch) < self.batch_size:
+                # Nothing in this batch could be handled; retry on the next sweep
+                return handled
+
+    async def _still_needed(self, screenshot: Dict[str, Any], tiers: List[Any]) -> bool:
+        """Whether another screenshot in one of ``tiers`` shares this screenshot's stored files"""
+        if not screenshot.get("stored_hash"):
+            return False
+        return await DatabaseOperations.count_documents(SCREENSHOT_COLLECTION, {
+            "organization_id": screenshot["organization_id"],
+            "stored_hash": screenshot["stored_hash"],
+            "storage_tier": {"$in": tiers},
+            "id": {"$ne": screenshot["id"]}
+        }) > 0
+
+    async def _tier(self, screenshot: Dict[str, Any]) -> bool:
+        """Drop the original file and serve the largest derivative in its place"""
+        derivatives = (screenshot.get("derivatives") or {}).get(TIERED_FORMAT) or {}
+        if not derivatives:
+            # Nothing smaller to fall back to; the file is kept until it is purged
+            replacement = screenshot.get("screenshot_url")
+        else:
+            replacement = derivatives[max(derivatives, key=int)]
+            original = screenshot.get("screenshot_url")
+            if original and original != replacement and not await self._still_needed(screenshot, ORIGINAL_TIERS):
+                await release_stored_object(original)
+
+        return await DatabaseOperations.update_document(
+            SCREENSHOT_COLLECTION,
+            {"id": screenshot["id"], "storage_tier": screenshot.get("storage_tier")},
+            {"$set": {
+                "storage_tier": ScreenshotStorageTier.DERIVATIVES,
+                "screenshot_url": replacement,
+                "tiered_at": datetime.utcnow()
+            }}
+        )
+
+    async def _purge(self, screenshot: Dict[str, Any]) -> bool:
+        """Delete every file of a screenshot, including a failed one's upload and spool copy; the document stays as a metadata record"""
+        refs = set()
+        if not await self._still_needed(screenshot, LIVE_TIERS):
+            refs.update(_derivative_refs(screenshot))
+            if screenshot.get("thumbnail_url"):
+                refs.add(screenshot["thumbnail_url"])
+        if (screenshot.get("storage_tier") in ORIGINAL_TIERS and screenshot.get("screenshot_url")
+                and not await self._still_needed(screenshot, ORIGINAL_TIERS)):
+            refs.add(screenshot["screenshot_url"])
+        for ref in refs:
+            await release_stored_object(ref)
+        # Left behind by screenshots that failed before the pipeline finished with them
+        if screenshot.get("source_ref"):
+            await storage_service.delete_file(screenshot["source_ref"])
+        if screenshot.get("spool_path"):
+            Path(screenshot["spool_path"]).unlink(missing_ok=True)
+
+        return await DatabaseOperations.update_document(
+            SCREENSHOT_COLLECTION,
+            {"id": screenshot["id"], "storage_tier": screenshot.get("storage_tier")},
+            {"$set": {
+                "storage_tier": ScreenshotStorageTier.PURGED,
+                "screenshot_url": None,
+                "thumbnail_url": None,
+                "derivatives": {},
+                "source_ref": None,
+                "spool_path": None,
+                "purged_at": datetime.utcnow()
+            }}
+        )
+
+    async def _expire_reservations(self, now: datetime, organization_id: Optional[str] = None) -> int:
+        """Remove direct-upload reservations whose upload URL expired before completion"""
+        query: Dict[str, Any] = {"status": ScreenshotStatus.AWAITING_UPLOAD, "upload_expires_at": {"$lt": now}}
+        if organization_id:
+            query["organization_id"] = organization_id
+        expired = await DatabaseOperations.get_documents(SCREENSHOT_COLLECTION, query, limit=self.batch_size)
+        for screenshot in expired:
+            if screenshot.get("source_ref"):
+                await storage_service.delete_file(screenshot["source_ref"])
+            if screenshot.get("spool_path"):
+                Path(screenshot["spool_path"]).unlink(missing_ok=True)
+            await DatabaseOperations.delete_document(
+                SCREENSHOT_COLLECTION, {"id": screenshot["id"], "status": ScreenshotStatus.AWAITING_UPLOAD}
+            )
+        return len(expired)
+
+# Global retention sweeper instance
+retention_sweeper = RetentionSweeper(
+    interval=settings.RETENTION_SWEEP_INTERVAL_SECONDS,
+    batch_size=settings.RETENTION_BATCH_SIZE,
+    original_retention_days=settings.SCREENSHOT_ORIGINAL_RETENTION_DAYS,
+    retention_days=settings.SCREENSHOT_RETENTION_DAYS,
+    deleted_grace_days=settings.DELETED_SCREENSHOT_GRACE_DAYS
+)
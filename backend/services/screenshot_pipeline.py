@@ -0,0 +1,660 @@
+import asyncio
+import hashlib
+import logging
+import mimetypes
+import os
+import socket
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional, List, Dict, Any, Tuple
+
+import aiofiles
+from fastapi import UploadFile
+from config import settings
+from database.mongodb import DatabaseOperations
+from models.monitoring import ScreenshotData, ScreenshotStatus, ScreenshotStorageTier, ScreenshotType
+from services.image_pool import image_pool, ImagePoolBusy
+from services.storage import storage_service, ChunkReader, FileTooLarge
+from services.retention import record_stored_object
+from utils import image_ops
+from utils.screenshot_processor import ScreenshotProcessor
+
+logger = logging.getLogger(__name__)
+
+SCREENSHOT_COLLECTION = "screenshots"
+# Heartbeats of the hosts running the pipeline, used to find orphaned spool work
+HOST_COLLECTION = "screenshot_pipeline_hosts"
+
+# Every stage the pipeline knows, in execution order. Fetch copies a direct
+# upload from object storage into the spool. Dedup compares the raw frame
+# before anything else; blur runs next so no unblurred derivative
+# (thumbnail, analysis input) is ever produced.
+STAGES = ("fetch", "dedup", "blur", "thumbnail", "analysis", "upload")
+
+# Fields copied from the screenshot a duplicate refers to
+REFERENCE_FIELDS = ("screenshot_url", "thumbnail_url", "derivatives", "stored_hash")
+
+def parse_stage_concurrency(value: str) -> Dict[str, int]:
+    """Parse "stage=workers,..." into worker counts (unknown stages are ignored)"""
+    limits = {stage: 1 for stage in STAGES}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        stage, count = (part.strip() for part in item.split("=", 1))
+        if stage in limits:
+            limits[stage] = max(int(count), 1)
+    return limits
+
+def blur_radius(blur_level: float) -> int:
+    """Gaussian blur radius for a 0-100 blur level"""
+    return max(1, round(blur_level / 5))
+
+# Derivative used as the legacy single thumbnail_url
+THUMBNAIL_FORMAT = "webp"
+THUMBNAIL_WIDTH = min(image_ops.DERIVATIVE_WIDTHS)
+
+DERIVATIVE_CONTENT_TYPES = {"webp": "image/webp", "avif": "image/avif"}
+
+# Extensions a spooled upload may carry; the extension is part of the spool path
+SPOOL_EXTENSIONS = {"png", "jpg", "jpeg", "webp"}
+
+def spool_extension(content_type: Optional[str]) -> str:
+    """Spool file extension for an upload's content type (never the client filename)"""
+    extension = (mimetypes.guess_extension(content_type or "") or "").lstrip(".")
+    return extension if extension in SPOOL_EXTENSIONS else "png"
+
+def derivative_spool_path(spool_path: str, width: int, image_format: str) -> Path:
+    path = Path(spool_path)
+    return path.with_name(f"{path.stem}_{width}w.{image_format}")
+
+def spooled_derivatives(spool_path: str) -> List[Tuple[str, int, Path]]:
+    """(format, width, path) of every derivative spooled next to a screenshot"""
+    path = Path(spool_path)
+    found = []
+    for derivative in path.parent.glob(f"{path.stem}_*w.*"):
+        width, _, image_format = derivative.name[len(path.stem) + 1:].partition("w.")
+        if width.isdigit() and image_format in DERIVATIVE_CONTENT_TYPES:
+            found.append((image_format, int(width), derivative))
+    return found
+
+def _durable_write(path: Path, content: bytes):
+    """Write a file so it survives a crash once this returns (temp file, fsync, rename)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(path.name + ".tmp")
+    with open(temp_path, "wb") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    dir_fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+def plan_stages(blur_level: float, analyze: bool) -> List[str]:
+    """Stages a spooled screenshot goes through (``complete`` adds fetch for direct uploads)"""
+    return [
+        stage for stage in STAGES
+        if stage != "fetch" and (stage != "blur" or blur_level > 0) and (stage != "analysis" or analyze)
+    ]
+
+class UploadMissing(Exception):
+    """Raised when a direct upload is completed before its bytes arrived"""
+    pass
+
+async def _read_spool(path: Path) -> bytes:
+    async with aiofiles.open(path, "rb") as f:
+        return await f.read()
+
+class ScreenshotPipeline:
+    """
+    Staged, durable screenshot processing
+
+    ``accept`` is the only part that runs in the upload request: it writes the
+    bytes to a local spool directory with fsync, inserts the ``screenshots``
+    document with ``status=pending`` and returns. The remaining stages
+    (blur, thumbnail, analysis, upload) run in background worker tasks.
+
+    The screenshot document is the queue: ``stage`` names the next stage to
+    run and workers claim documents for their stage with an atomic
+    find_one_and_update that sets a lease. Each stage has its own number of
+    workers, so a slow remote upload cannot starve thumbnailing. A failed
+    stage is retried with exponential backoff; ``stage_attempts`` and
+    ``processing_error`` record what happened, and the document becomes
+    ``failed`` after ``max_attempts``. Spool files only exist on the host
+    that accepted the upload, so workers only claim their own host's work.
+    Hosts heartbeat; work left on a host that stopped heartbeating (a
+    replaced pod) is taken over by ``recover_orphans``.
+
+    Agents can also upload directly: ``reserve`` records a screenshot waiting
+    for its bytes and returns a presigned PUT URL when the storage backend
+    supports it. ``complete`` queues it once the bytes are there, starting
+    with a fetch stage (any host) that copies the object into the spool.
+
+    Stored files are content-addressed (named by the SHA-256 of the stored
+    bytes). The dedup stage goes further and stores no bytes at all for a
+    frame whose upload hash matches a stored screenshot in the organization;
+    such screenshots reference the original through ``duplicate_of`` and
+    reuse its URLs. A frame whose perceptual hash is at least
+    ``near_duplicate_similarity`` similar to the user's previous frame is only
+    flagged ``screen_unchanged`` (an idle signal): the perceptual hash ignores
+    small text changes and color, so its bytes are always kept.
+    """
+
+    def __init__(
+        self,
+        spool_dir: str,
+        concurrency: Dict[str, int],
+        max_attempts: int = 5,
+        retry_delay: float = 5.0,
+        lease_seconds: int = 120,
+        poll_interval: float = 2.0,
+        near_duplicate_similarity: float = 0.99,
+        host_timeout: float = 300
+    ):
+        self.spool_dir = Path(spool_dir)
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease = timedelta(seconds=lease_seconds)
+        self.poll_interval = poll_interval
+        self.near_duplicate_similarity = near_duplicate_similarity
+        self.host_timeout = timedelta(seconds=host_timeout)
+        self.host = socket.gethostname()
+        self._workers: List[asyncio.Task] = []
+        self._wakeups: Dict[str, asyncio.Event] = {stage: asyncio.Event() for stage in STAGES}
+        self._handlers = {
+            "fetch": self._run_fetch,
+            "dedup": self._run_dedup,
+            "blur": self._run_blur,
+            "thumbnail": self._run_thumbnail,
+            "analysis": self._run_analysis,
+            "upload": self._run_upload,
+        }
+
+    @property
+    def running(self) -> bool:
+        return any(not worker.done() for worker in self._workers)
+
+    async def start(self):
+        """Start the stage workers (called from the application lifespan)"""
+        if self.running:
+            return
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        self._workers = [
+            asyncio.create_task(self._worker(stage, i))
+            for stage in STAGES
+            for i in range(self.concurrency.get(stage, 1))
+        ]
+        self._workers.append(asyncio.create_task(self._host_loop()))
+        logger.info(f"Screenshot pipeline started with workers {self.concurrency}")
+
+    async def stop(self):
+        """Cancel the workers; leased screenshots are picked up again after a restart"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def accept(
+        self,
+        file: UploadFile,
+        extension: str,
+        user_id: str,
+        organization_id: str,
+        time_entry_id: str,
+        activity_level: float = 0.0,
+        screenshot_type: ScreenshotType = ScreenshotType.PERIODIC,
+        blur_level: float = 0.0,
+        analyze: bool = False,
+        screenshot_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Stream an upload into the spool durably and queue its processing stages
+
+        Raises FileTooLarge (from the storage service) when the upload exceeds
+        MAX_FILE_SIZE; nothing is spooled or recorded in that case.
+        """
+        stages = plan_stages(blur_level, analyze)
+        screenshot = ScreenshotData(
+            user_id=user_id,
+            time_entry_id=time_entry_id,
+            organization_id=organization_id,
+            screenshot_type=screenshot_type,
+            activity_level=activity_level,
+            blur_level=blur_level,
+            status=ScreenshotStatus.PENDING,
+            stages=stages,
+            stage=stages[0],
+            next_attempt_at=datetime.utcnow(),
+            content_type=file.content_type or "image/png",
+            spool_host=self.host
+        )
+        if screenshot_id:
+            screenshot.id = screenshot_id
+        spool_path = self.spool_dir / organization_id / f"{screenshot.id}.{extension}"
+        screenshot.spool_path = str(spool_path)
+
+        size, screenshot.content_hash = await storage_service.stream_to_file(file, spool_path, durable=True)
+        screenshot.metadata["size_bytes"] = size
+        await DatabaseOperations.create_document(SCREENSHOT_COLLECTION, screenshot.model_dump())
+        self._wakeups[stages[0]].set()
+        return screenshot.model_dump()
+
+    async def reserve(
+        self,
+        extension: str,
+        content_type: str,
+        user_id: str,
+        organization_id: str,
+        time_entry_id: str,
+        activity_level: float = 0.0,
+        screenshot_type: ScreenshotType = ScreenshotType.PERIODIC,
+        blur_level: float = 0.0,
+        analyze: bool = False,
+        timestamp: Optional[datetime] = None,
+        expires_in: int = 300
+    ) -> Tuple[Dict[str, Any], Optional[str]]:
+        """
+        Record a screenshot whose bytes the agent uploads directly
+
+        Returns the screenshot document and a presigned PUT URL, or None when
+        the storage backend takes no direct uploads; the bytes must then be
+        sent to this host with ``receive``.
+        """
+        screenshot = ScreenshotData(
+            user_id=user_id,
+            time_entry_id=time_entry_id,
+            organization_id=organization_id,
+            screenshot_type=screenshot_type,
+            activity_level=activity_level,
+            blur_level=blur_level,
+            status=ScreenshotStatus.AWAITING_UPLOAD,
+            stages=plan_stages(blur_level, analyze),
+            content_type=content_type,
+            upload_expires_at=datetime.utcnow() + timedelta(seconds=expires_in)
+        )
+        if timestamp:
+            screenshot.timestamp = timestamp
+        presigned = storage_service.presigned_upload(
+            f"incoming/{organization_id}/{screenshot.id}.{extension}", content_type, expires_in
+        )
+        upload_url = None
+        if presigned:
+            upload_url, screenshot.source_ref = presigned
+        else:
+            screenshot.spool_path = str(self.spool_dir / organization_id / f"{screenshot.id}.{extension}")
+        await DatabaseOperations.create_document(SCREENSHOT_COLLECTION, screenshot.model_dump())
+        return screenshot.model_dump(), upload_url
+
+    async def receive(self, screenshot: Dict[str, Any], body: ChunkReader) -> int:
+        """
+        Stream a reserved screenshot's bytes into this host's spool
+
+        Raises FileTooLarge when the body exceeds MAX_FILE_SIZE.
+        """
+        size, content_hash = await storage_service.stream_to_file(body, Path(screenshot["spool_path"]), durable=True)
+        await DatabaseOperations.update_document(
+            SCREENSHOT_COLLECTION,
+            {"id": screenshot["id"], "status": ScreenshotStatus.AWAITING_UPLOAD},
+            {"$set": {"spool_host": self.host, "content_hash": content_hash, "metadata.size_bytes": size}}
+        )
+        return size
+
+    async def complete(self, screenshot: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Queue a directly uploaded screenshot for processing (repeated calls are no-ops)
+
+        Raises UploadMissing when the bytes have not arrived and FileTooLarge
+        when the stored object exceeds MAX_FILE_SIZE (a presigned PUT cannot
+        limit the size, so the object is checked and deleted here).
+        """
+        if screenshot.get("status") != ScreenshotStatus.AWAITING_UPLOAD:
+            return screenshot
+
+        stages = list(screenshot.get("stages") or plan_stages(0, False))
+        updates: Dict[str, Any] = {}
+        if screenshot.get("source_ref"):
+            size = await storage_service.file_size(screenshot["source_ref"])
+            if size is None:
+                raise UploadMissing(f"Screenshot {screenshot['id']} has not been uploaded")
+            if size > settings.MAX_FILE_SIZE:
+                await storage_service.delete_file(screenshot["source_ref"])
+                await DatabaseOperations.update_document(
+                    SCREENSHOT_COLLECTION, {"id": screenshot["id"]},
+                    {"$set": {"status": ScreenshotStatus.FAILED, "processing_error": "Upload too large"}}
+                )
+                raise FileTooLarge(f"Upload of {size} bytes exceeds {settings.MAX_FILE_SIZE} bytes")
+            stages = ["fetch"] + stages
+            updates["metadata.size_bytes"] = size
+        elif not screenshot.get("content_hash"):
+            raise UploadMissing(f"Screenshot {screenshot['id']} has not been uploaded")
+
+        updates.update({
+            "status": ScreenshotStatus.PENDING,
+            "stages": stages,
+            "stage": stages[0],
+            "next_attempt_at": datetime.utcnow()
+        })
+        updated = await DatabaseOperations.find_one_and_update(
+            SCREENSHOT_COLLECTION,
+            {"id": screenshot["id"], "status": ScreenshotStatus.AWAITING_UPLOAD},
+            {"$set": updates, "$unset": {"upload_expires_at": ""}}
+        )
+        self._wakeups[stages[0]].set()
+        return updated or screenshot
+
+    async def _claim(self, stage: str) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        query: Dict[str, Any] = {
+            "stage": stage,
+            "next_attempt_at": {"$lte": now},
+            "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]
+        }
+        update: Dict[str, Any] = {"status": ScreenshotStatus.PROCESSING, "lease_until": now + self.lease}
+        if stage == "fetch":
+            # Any host can fetch; the spool copy then pins the remaining stages to it
+            update["spool_host"] = self.host
+        else:
+            query["spool_host"] = self.host
+        return await DatabaseOperations.find_one_and_update(
+            SCREENSHOT_COLLECTION, query, {"$set": update}, sort=[("next_attempt_at", 1)]
+        )
+
+    async def _host_loop(self):
+        """Heartbeat this host and take over the work of hosts that stopped heartbeating"""
+        interval = max(self.lease.total_seconds() / 4, self.poll_interval)
+        while True:
+            try:
+                await DatabaseOperations.find_one_and_update(
+                    HOST_COLLECTION, {"host": self.host}, {"$set": {"host": self.host, "seen_at": datetime.utcnow()}},
+                    upsert=True
+                )
+                await self.recover_orphans()
+            except Exception as e:
+                logger.error(f"Screenshot pipeline host heartbeat failed: {e}")
+            await asyncio.sleep(interval)
+
+    async def recover_orphans(self, now: Optional[datetime] = None) -> int:
+        """
+        Take over in-flight screenshots spooled on hosts that are gone (e.g. a replaced pod)
+
+        The spool copy is used if this host can read it (shared spool volume);
+        direct uploads are fetched again from ``source_ref``; anything else has
+        lost its only copy and is marked failed.
+        """
+        now = now or datetime.utcnow()
+        live_hosts = [
+            host["host"] for host in await DatabaseOperations.get_documents(
+                HOST_COLLECTION, {"seen_at": {"$gte": now - self.host_timeout}}, projection={"host": 1}
+            )
+        ]
+        recovered = 0
+        while True:
+            screenshot = await DatabaseOperations.find_one_and_update(
+                SCREENSHOT_COLLECTION,
+                {
+                    "stage": {"$exists": True, "$ne": "fetch"},
+                    "status": {"$in": [ScreenshotStatus.PENDING, ScreenshotStatus.PROCESSING]},
+                    "spool_host": {"$nin": live_hosts + [self.host]},
+                    "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]
+                },
+                {"$set": {"lease_until": now + self.lease}}
+            )
+            if screenshot is None:
+                return recovered
+            recovered += 1
+            previous_host = screenshot.get("spool_host")
+            update: Dict[str, Any] = {"spool_host": self.host, "lease_until": None, "next_attempt_at": datetime.utcnow()}
+            spool_path = screenshot.get("spool_path")
+            if spool_path and await asyncio.to_thread(Path(spool_path).exists):
+                update["status"] = ScreenshotStatus.PENDING
+                stage = screenshot["stage"]
+            elif screenshot.get("source_ref"):
+                stages = ["fetch"] + [stage for stage in screenshot.get("stages") or [] if stage != "fetch"]
+                update.update({"status": ScreenshotStatus.PENDING, "stages": stages, "stage": "fetch", "spool_path": None})
+                stage = "fetch"
+            else:
+                update.update({
+                    "status": ScreenshotStatus.FAILED,
+                    "next_attempt_at": None,
+                    "processing_error": f"Spool copy lost with host {previous_host}"
+                })
+                stage = None
+            await DatabaseOperations.update_document(
+                SCREENSHOT_COLLECTION, {"id": screenshot["id"], "spool_host": previous_host}, {"$set": update}
+            )
+            logger.warning(f"Screenshot {screenshot['id']} taken over from host {previous_host} ({stage or 'failed'})")
+            if stage:
+                self._wakeups[stage].set()
+
+    async def _worker(self, stage: str, index: int):
+        wakeup = self._wakeups[stage]
+        while True:
+            try:
+                screenshot = await self._claim(stage)
+            except Exception as e:
+                logger.error(f"Screenshot {stage} worker {index} failed to claim work: {e}")
+                screenshot = None
+
+            if screenshot is None:
+                wakeup.clear()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                updates = await self._handlers[stage](screenshot)
+            except asyncio.CancelledError:
+                raise
+            except ImagePoolBusy:
+                # Back off without using up an attempt; the pool is shedding load
+                await self._reschedule(screenshot, stage, "Image processing pool busy", count_attempt=False)
+            except Exception as e:
+                logger.error(f"Screenshot {screenshot['id']} {stage} stage failed: {e}")
+                await self._reschedule(screenshot, stage, f"{stage}: {e}")
+            else:
+                await self._advance(screenshot, stage, updates)
+
+    async def _advance(self, screenshot: Dict[str, Any], stage: str, updates: Dict[str, Any]):
+        """Record a finished stage and queue the next one (or mark the screenshot ready)"""
+        stages = screenshot.get("stages") or list(STAGES)
+        position = stages.index(stage) if stage in stages else len(stages) - 1
+        if updates.get("duplicate_of"):
+            # A duplicate reuses the original's files, so the remaining stages are skipped
+            position = len(stages) - 1
+        query = {"id": screenshot["id"], "stage": stage}
+
+        if position + 1 < len(stages):
+            next_stage = stages[position + 1]
+            await DatabaseOperations.update_document(SCREENSHOT_COLLECTION, query, {"$set": {
+                **updates,
+                "status": ScreenshotStatus.PENDING,
+                "stage": next_stage,
+                "next_attempt_at": datetime.utcnow(),
+                "lease_until": None,
+                "processing_error": None
+            }})
+            self._wakeups[next_stage].set()
+            return
+
+        await DatabaseOperations.update_document(SCREENSHOT_COLLECTION, query, {
+            "$set": {**updates, "status": ScreenshotStatus.READY, "processing_error": None},
+            "$unset": {"stage": "", "next_attempt_at": "", "lease_until": "", "spool_path": "", "spool_host": "",
+                       "source_ref": ""}
+        })
+        spool_path = updates.get("spool_path") or screenshot["spool_path"]
+        spooled = [Path(spool_path)] + [path for _, _, path in spooled_derivatives(spool_path)]
+        for path in spooled:
+            path.unlink(missing_ok=True)
+        if screenshot.get("source_ref"):
+            # The direct upload has been stored under its content-addressed name
+            await storage_service.delete_file(screenshot["source_ref"])
+
+    async def _reschedule(self, screenshot: Dict[str, Any], stage: str, error: str, count_attempt: bool = True):
+        attempts = screenshot.get("stage_attempts", {}).get(stage, 0) + (1 if count_attempt else 0)
+        update: Dict[str, Any] = {
+            "stage_attempts": {**screenshot.get("stage_attempts", {}), stage: attempts},
+            "processing_error": error,
+            "lease_until": None
+        }
+        failed = attempts >= self.max_attempts
+        if failed:
+            update["status"] = ScreenshotStatus.FAILED
+            update["next_attempt_at"] = None
+            update["spool_path"] = None
+            logger.error(f"Screenshot {screenshot['id']} failed after {attempts} {stage} attempts")
+        else:
+            update["status"] = ScreenshotStatus.PENDING
+            update["next_attempt_at"] = datetime.utcnow() + timedelta(seconds=self.retry_delay * 2 ** attempts)
+        await DatabaseOperations.update_document(
+            SCREENSHOT_COLLECTION, {"id": screenshot["id"], "stage": stage}, {"$set": update}
+        )
+        if failed and screenshot.get("spool_path"):
+            # Nothing will read the spool copy again
+            spool_path = screenshot["spool_path"]
+            for path in [Path(spool_path)] + [path for _, _, path in spooled_derivatives(spool_path)]:
+                path.unlink(missing_ok=True)
+
+    async def _run_fetch(self, screenshot: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy a direct upload from object storage into this host's spool"""
+        source_ref = screenshot["source_ref"]
+        spool_path = self.spool_dir / screenshot["organization_id"] / f"{screenshot['id']}{Path(source_ref).suffix}"
+        size, content_hash = await storage_service.stream_to_file(
+            ChunkReader(storage_service.iter_file(source_ref)), spool_path, durable=True
+        )
+        return {
+            "spool_path": str(spool_path),
+            "spool_host": self.host,
+            "content_hash": content_hash,
+            "metadata.size_bytes": size
+        }
+
+    async def _run_dedup(self, screenshot: Dict[str, Any]) -> Dict[str, Any]:
+        """Record the perceptual hash and idle signal, and reference an identical stored frame"""
+        exact = await DatabaseOperations.get_document(SCREENSHOT_COLLECTION, {
+            "organization_id": screenshot["organization_id"],
+            "content_hash": screenshot["content_hash"],
+            "blur_level": screenshot.get("blur_level", 0),
+            "status": ScreenshotStatus.READY,
+            "storage_tier": {"$in": [None, ScreenshotStorageTier.ORIGINAL]},
+            "is_deleted": False,
+            "id": {"$ne": screenshot["id"]}
+        })
+
+        perceptual_hash = await image_pool.run(
+            image_ops.perceptual_hash, await _read_spool(Path(screenshot["spool_path"]))
+        )
+        updates: Dict[str, Any] = {"perceptual_hash": perceptual_hash}
+
+        previous = await DatabaseOperations.get_documents(
+            SCREENSHOT_COLLECTION,
+            {
+                "organization_id": screenshot["organization_id"],
+                "user_id": screenshot["user_id"],
+                "timestamp": {"$lt": screenshot["timestamp"]},
+                "perceptual_hash": {"$exists": True}
+            },
+            sort=[("timestamp", -1)],
+            limit=1
+        )
+        if previous:
+            similarity = image_ops.hash_similarity(perceptual_hash, previous[0]["perceptual_hash"])
+            updates["similarity_to_previous"] = round(similarity, 4)
+            updates["screen_unchanged"] = similarity >= self.near_duplicate_similarity
+
+        if exact:
+            updates.update({field: exact.get(field) for field in REFERENCE_FIELDS})
+            updates["duplicate_of"] = exact.get("duplicate_of") or exact["id"]
+            updates["dedup"] = "exact"
+        return updates
+
+    async def _run_blur(self, screenshot: Dict[str, Any]) -> Dict[str, Any]:
+        source = Path(screenshot["spool_path"])
+        blurred = await image_pool.run(
+            image_ops.blur, await _read_spool(source), blur_radius(screenshot.get("blur_level", 0))
+        )
+        # The blurred image replaces the original, so nothing unblurred is ever stored remotely
+        target = source.with_suffix(".png")
+        await asyncio.to_thread(_durable_write, target, blurred)
+        if target != source:
+            source.unlink(missing_ok=True)
+        return {
+            "spool_path": str(target),
+            "content_type": "image/png",
+            "stored_hash": await asyncio.to_thread(lambda: hashlib.sha256(blurred).hexdigest())
+        }
+
+    async def _run_thumbnail(self, screenshot: Dict[str, Any]) -> Dict[str, Any]:
+        """Spool the gallery derivatives (every width in WebP, and AVIF when available)"""
+        content = await _read_spool(Path(screenshot["spool_path"]))
+        derivatives = await image_pool.run(image_ops.make_derivatives, content)
+        for image_format, widths in derivatives.items():
+            for width, data in widths.items():
+                await asyncio.to_thread(
+                    _durable_write, derivative_spool_path(screenshot["spool_path"], width, image_format), data
+                )
+        return {}
+
+    async def _run_analysis(self, screenshot: Dict[str, Any]) -> Dict[str, Any]:
+        content = await _read_spool(Path(screenshot["spool_path"]))
+        analysis = await ScreenshotProcessor.analyze_screenshot(
+            content, screenshot["user_id"], screenshot["organization_id"]
+        )
+        if analysis is None:
+            raise RuntimeError("Screenshot analysis returned no result")
+        analysis.screenshot_id = screenshot["id"]
+        # Keyed by screenshot so a retried stage does not store a second analysis
+        await DatabaseOperations.find_one_and_update(
+            "screenshot_analysis",
+            {"screenshot_id": screenshot["id"]},
+            {"$setOnInsert": analysis.model_dump()},
+            upsert=True
+        )
+        return {"metadata.productivity_score": analysis.productivity_score}
+
+    async def _run_upload(self, screenshot: Dict[str, Any]) -> Dict[str, Any]:
+        """Store the (possibly blurred) screenshot and its derivatives under content-addressed names"""
+        spool_path = Path(screenshot["spool_path"])
+        # The blur stage hashes the file it writes; otherwise the spool holds the uploaded bytes
+        stored_hash = screenshot.get("stored_hash") or screenshot["content_hash"]
+        folder = f"screenshots/{screenshot['user_id']}"
+        updates = {
+            "stored_hash": stored_hash,
+            "screenshot_url": await storage_service.upload_path(
+                f"{folder}/{stored_hash}{spool_path.suffix}",
+                spool_path,
+                screenshot.get("content_type") or "image/png"
+            )
+        }
+        organization_id = screenshot["organization_id"]
+        await record_stored_object(organization_id, updates["screenshot_url"], spool_path.stat().st_size)
+        derivatives: Dict[str, Dict[str, str]] = {}
+        for image_format, width, path in spooled_derivatives(screenshot["spool_path"]):
+            content = await _read_spool(path)
+            ref = await storage_service.upload_file(
+                f"{folder}/derivatives/{stored_hash}_{width}w.{image_format}",
+                content,
+                DERIVATIVE_CONTENT_TYPES[image_format]
+            )
+            await record_stored_object(organization_id, ref, len(content))
+            derivatives.setdefault(image_format, {})[str(width)] = ref
+        if derivatives:
+            updates["derivatives"] = derivatives
+            updates["thumbnail_url"] = derivatives.get(THUMBNAIL_FORMAT, {}).get(str(THUMBNAIL_WIDTH))
+        return updates
+
+# Global screenshot pipeline instance
+screenshot_pipeline = ScreenshotPipeline(
+    spool_dir=settings.SCREENSHOT_SPOOL_DIR,
+    concurrency=parse_stage_concurrency(settings.SCREENSHOT_STAGE_CONCURRENCY),
+    max_attempts=settings.SCREENSHOT_STAGE_MAX_ATTEMPTS,
+    retry_delay=settings.SCREENSHOT_STAGE_RETRY_SECONDS,
+    lease_seconds=settings.SCREENSHOT_STAGE_LEASE_SECONDS,
+    poll_interval=settings.SCREENSHOT_PIPELINE_POLL_INTERVAL,
+    near_duplicate_similarity=settings.SCREENSHOT_NEAR_DUPLICATE_SIMILARITY,
+    host_timeout=settings.SCREENSHOT_HOST_TIMEOUT_SECONDS
+)
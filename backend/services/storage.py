@@ -1,26 +1,47 @@
 import os
 import uuid
+import asyncio
+import hashlib
+import tempfile
 import aiofiles
 from pathlib import Path
-from typing import Optional, BinaryIO
+from typing import Optional, AsyncIterator, Tuple, Dict, Any
 from fastapi import UploadFile, HTTPException, status
 from config import settings
 import logging
-import base64
-import httpx
+from auth.url_signing import sign_path
+from services.storage_backends import StorageError, LocalBackend, create_backend, stream_url
 
 logger = logging.getLogger(__name__)
 
-class StorageError(Exception):
-    """Custom exception for storage operations"""
+# Uploads are copied in chunks of this size, so memory per upload stays bounded
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+class FileTooLarge(StorageError):
+    """Raised when an upload stream exceeds the allowed number of bytes"""
     pass
 
+class ChunkReader:
+    """Adapts an async iterator of chunks (request body, stored file) to the ``read(size)`` of stream_to_file"""
+    
+    def __init__(self, chunks: AsyncIterator[bytes], size: Optional[int] = None):
+        self._chunks = chunks.__aiter__()
+        self.size = size  # Declared size, lets stream_to_file reject oversized bodies up front
+    
+    async def read(self, size: int = -1) -> bytes:
+        try:
+            return await self._chunks.__anext__()
+        except StopAsyncIteration:
+            return b""
+
 class StorageService:
-    """File storage service with support for local and cloud storage"""
+    """File storage service delegating to the configured backend (local, aws_s3, cloudinary)"""
     
     def __init__(self):
         self.storage_type = settings.STORAGE_TYPE
         self.upload_dir = settings.uploads_path
+        self.local = LocalBackend(self.upload_dir)
+        self.backend = create_backend(self.storage_type, self.local)
         
     async def save_file(self, file: UploadFile, subfolder: str = "", user_id: str = "") -> str:
         """
@@ -35,26 +56,31 @@ class StorageService:
             str: URL or path to the saved file
         """
         try:
-            # Validate file size
-            if file.size and file.size > settings.MAX_FILE_SIZE:
-                raise HTTPException(
-                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,  
-                    detail=f"File size exceeds maximum limit of {settings.MAX_FILE_SIZE} bytes"
-                )
-            
             # Generate unique filename
             file_extension = self._get_file_extension(file.filename)
             unique_filename = f"{uuid.uuid4()}{file_extension}"
+            key = "/".join(part for part in (subfolder, user_id, unique_filename) if part)
+            
+            if self.backend is self.local:
+                # Stream the upload to disk chunk by chunk
+                await self.stream_to_file(file, self.local.path_for(key))
+                return self.local.ref(key)
             
-            if self.storage_type == "local":
-                return await self._save_local(file, subfolder, user_id, unique_filename)
-            elif self.storage_type == "aws_s3":
-                return await self._save_s3(file, subfolder, user_id, unique_filename)
-            elif self.storage_type == "cloudinary":
-                return await self._save_cloudinary(file, subfolder, user_id, unique_filename)
-            else:
-                raise StorageError(f"Unsupported storage type: {self.storage_type}")
-                
+            # Stream the upload to a temporary file first; this enforces the size
+            # limit and lets the backend read the body from disk
+            temp_path = Path(tempfile.gettempdir()) / f"upload-{uuid.uuid4()}"
+            await self.stream_to_file(file, temp_path)
+            try:
+                return await self.backend.put_path(key, temp_path, file.content_type or "application/octet-stream")
+            finally:
+                temp_path.unlink(missing_ok=True)
+        
+        except FileTooLarge:
+            # The size is enforced while streaming, so this holds even without a Content-Length
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"File size exceeds maximum limit of {settings.MAX_FILE_SIZE} bytes"
+            )
         except Exception as e:
             logger.error(f"Error saving file: {e}")
             raise HTTPException(
@@ -62,88 +88,56 @@ class StorageService:
                 detail="Failed to save file"
             )
     
-    async def _save_local(self, file: UploadFile, subfolder: str, user_id: str, filename: str) -> str:
-        """Save file to local filesystem"""
-        # Create file path
-        file_path = self.upload_dir / subfolder
-        if user_id:
-            file_path = file_path / user_id
-        file_path.mkdir(parents=True, exist_ok=True)
-        
-        full_path = file_path / filename
+    async def stream_to_file(self, file: UploadFile, destination: Path, max_bytes: Optional[int] = None,
+                             durable: bool = False, chunk_size: int = UPLOAD_CHUNK_SIZE) -> Tuple[int, str]:
+        """
+        Copy an upload to ``destination`` in chunks, enforcing a hard size limit
         
-        # Save file
-        async with aiofiles.open(full_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
+        The file is written to a ``.part`` sibling and renamed into place, so a
+        rejected or interrupted upload never leaves a partial file behind.
+        With ``durable`` the data and the directory entry are fsynced.
         
-        # Return relative URL path
-        relative_path = full_path.relative_to(self.upload_dir)
-        return f"/uploads/{relative_path}"
-    
-    async def _save_s3(self, file: UploadFile, subfolder: str, user_id: str, filename: str) -> str:
-        """Save file to AWS S3 (placeholder implementation)"""
-        # This would require boto3 implementation
-        # For now, fall back to local storage
-        logger.warning("S3 storage not implemented, falling back to local storage")
-        return await self._save_local(file, subfolder, user_id, filename)
-    
-    async def _save_cloudinary(self, file: UploadFile, subfolder: str, user_id: str, filename: str) -> str:
-        """Save file to Cloudinary (FREE cloud storage)"""
-        try:
-            # Read file content
-            content = await file.read()
-            
-            # Prepare folder structure for organization
-            folder = f"{subfolder}/{user_id}" if user_id else subfolder
-            
-            # Create public_id (filename without extension)
-            public_id = f"{folder}/{filename.split('.')[0]}"
-            
-            # Encode file content to base64
-            file_b64 = base64.b64encode(content).decode('utf-8')
-            data_uri = f"data:{file.content_type};base64,{file_b64}"
-            
-            # Cloudinary upload URL
-            upload_url = f"https://api.cloudinary.com/v1_1/{settings.CLOUDINARY_CLOUD_NAME}/image/upload"
-            
-            # Prepare upload data
-            upload_data = {
-                "file": data_uri,
-                "public_id": public_id,
-                "folder": folder,
-                "resource_type": "auto",
-                "api_key": settings.CLOUDINARY_API_KEY
-            }
-            
-            # Generate signature (simplified - in production, use cloudinary SDK)
-            import hashlib
-            import time
-            timestamp = int(time.time())
-            upload_data["timestamp"] = timestamp
+        Args:
+            file: Upload to read (anything with an async ``read(size)``)
+            destination: Final path of the file
+            max_bytes: Maximum accepted size (defaults to MAX_FILE_SIZE)
             
-            # Create signature string
-            sig_params = [f"{k}={v}" for k, v in sorted(upload_data.items()) if k != "file" and k != "api_key"]
-            sig_string = "&".join(sig_params) + settings.CLOUDINARY_API_SECRET
-            signature = hashlib.sha1(sig_string.encode()).hexdigest()
-            upload_data["signature"] = signature
+        Returns:
+            Tuple[int, str]: Number of bytes written and their SHA-256 hex digest
             
-            # Upload to Cloudinary
-            async with httpx.AsyncClient() as client:
-                response = await client.post(upload_url, data=upload_data)
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    return result["secure_url"]
-                else:
-                    logger.error(f"Cloudinary upload failed: {response.status_code} - {response.text}")
-                    raise StorageError(f"Cloudinary upload failed: {response.status_code}")
-                    
-        except Exception as e:
-            logger.error(f"Cloudinary upload error: {e}")
-            # Fall back to local storage
-            logger.warning("Cloudinary upload failed, falling back to local storage")
-            return await self._save_local(file, subfolder, user_id, filename)
+        Raises:
+            FileTooLarge: As soon as more than ``max_bytes`` have been read
+        """
+        max_bytes = settings.MAX_FILE_SIZE if max_bytes is None else max_bytes
+        if getattr(file, "size", None) and file.size > max_bytes:
+            raise FileTooLarge(f"Upload of {file.size} bytes exceeds {max_bytes} bytes")
+        
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = destination.with_name(destination.name + ".part")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(temp_path, 'wb') as f:
+                while True:
+                    chunk = await file.read(chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise FileTooLarge(f"Upload exceeds {max_bytes} bytes")
+                    digest.update(chunk)
+                    await f.write(chunk)
+                if durable:
+                    await f.flush()
+                    await asyncio.to_thread(os.fsync, f.fileno())
+            os.replace(temp_path, destination)
+            if durable:
+                await asyncio.to_thread(_fsync_directory, destination.parent)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+        
+        return size, digest.hexdigest()
     
     def _get_file_extension(self, filename: Optional[str]) -> str:
         """Extract file extension from filename"""
@@ -151,6 +145,14 @@ class StorageService:
             return ""
         return Path(filename).suffix.lower()
     
+    def _backend_for(self, file_path: str):
+        """Backend that stored a reference (files saved before a storage switch stay readable)"""
+        if self.backend.owns(file_path):
+            return self.backend
+        if self.local.owns(file_path):
+            return self.local
+        raise StorageError(f"No storage backend for {file_path}")
+    
     async def delete_file(self, file_path: str) -> bool:
         """
         Delete a file from storage
@@ -162,13 +164,7 @@ class StorageService:
             bool: True if file was deleted successfully
         """
         try:
-            if self.storage_type == "local":
-                full_path = self.upload_dir / file_path.lstrip("/uploads/")
-                if full_path.exists():
-                    full_path.unlink()
-                    return True
-            # Add S3 deletion logic here if needed
-            return False
+            return await self._backend_for(file_path).delete(file_path)
         except Exception as e:
             logger.error(f"Error deleting file {file_path}: {e}")
             return False
@@ -186,110 +182,106 @@ class StorageService:
             str: URL to the uploaded file
         """
         try:
-            if self.storage_type == "local":
-                # Ensure directory exists
-                file_path = self.upload_dir / filename
-                file_path.parent.mkdir(parents=True, exist_ok=True)
-                
-                # Write content to file
-                async with aiofiles.open(file_path, 'wb') as f:
-                    await f.write(content)
-                
-                # Return URL
-                return f"/uploads/{filename}"
-                
-            elif self.storage_type == "aws_s3":
-                # S3 implementation would go here
-                logger.warning("S3 upload not implemented, falling back to local storage")
-                return await self.upload_file(filename, content, content_type)
-                
-            elif self.storage_type == "cloudinary":
-                return await self._upload_cloudinary_direct(filename, content, content_type)
+            return await self.backend.put_bytes(filename, content, content_type)
+        except Exception as e:
+            logger.error(f"Error uploading file {filename}: {e}")
+            raise StorageError(f"Failed to upload file: {e}")
+    
+    async def upload_path(self, filename: str, source: Path, content_type: str) -> str:
+        """
+        Upload a local file without reading it into memory (for spooled uploads)
+        
+        Args:
+            filename: Destination filename with path
+            source: Local file to upload
+            content_type: MIME type of the file
             
+        Returns:
+            str: URL to the uploaded file
+        """
+        try:
+            return await self.backend.put_path(filename, source, content_type)
         except Exception as e:
             logger.error(f"Error uploading file {filename}: {e}")
             raise StorageError(f"Failed to upload file: {e}")
     
-    def get_file_url(self, file_path: str) -> str:
+    async def iter_file(self, file_path: str, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+        """
+        Stream a stored file back in chunks
+        
+        Args:
+            file_path: Path or URL returned by upload_file/save_file
+            chunk_size: Maximum size of each yielded chunk
+        """
+        if file_path.startswith("http"):
+            chunks = stream_url(file_path, chunk_size)
+        else:
+            chunks = self._backend_for(file_path).iter_bytes(file_path, chunk_size)
+        async for chunk in chunks:
+            yield chunk
+    
+    def get_file_url(self, file_path: str, expires_in: Optional[int] = None) -> str:
         """
         Get the full URL for a file
         
         Args:
-            file_path: Relative file path
+            file_path: Stored path or reference
+            expires_in: Lifetime in seconds of presigned URLs (S3)
             
         Returns:
             str: Full URL to the file
         """
         if file_path.startswith("http"):
             return file_path  # Already a full URL
+        return self._backend_for(file_path).url(file_path, expires_in)
+    
+    def presigned_upload(self, key: str, content_type: str, expires_in: int) -> Optional[Tuple[str, str]]:
+        """
+        URL for uploading an object straight to the storage backend, and its future reference
         
-        if self.storage_type == "local":
-            return f"{settings.FRONTEND_URL}{file_path}"
-        elif self.storage_type == "aws_s3":
-            # Return S3 URL
-            return f"https://{settings.S3_BUCKET_NAME}.s3.{settings.AWS_REGION}.amazonaws.com{file_path}"
+        Returns None when the backend does not take direct uploads (local disk,
+        Cloudinary); callers then fall back to a signed upload through the API.
+        """
+        return self.backend.upload_url(key, content_type, expires_in)
+    
+    async def file_size(self, file_path: str) -> Optional[int]:
+        """Size of a stored file in bytes, None when it does not exist"""
+        return await self._backend_for(file_path).size(file_path)
+    
+    def client_url(self, ref: Optional[str]) -> Optional[str]:
+        """
+        URL the frontend uses for a stored reference
         
-        return file_path
+        Local paths become signed /uploads paths (relative, as before);
+        object storage references become presigned URLs.
+        """
+        if not ref or ref.startswith("http"):
+            return ref
+        if self.local.owns(ref):
+            return sign_path(ref)
+        return self.get_file_url(ref)
     
-    async def _upload_cloudinary_direct(self, filename: str, content: bytes, content_type: str) -> str:
-        """Upload content directly to Cloudinary"""
-        try:
-            # Extract folder and user info from filename
-            path_parts = filename.split('/')
-            folder = '/'.join(path_parts[:-1]) if len(path_parts) > 1 else 'screenshots'
-            file_basename = path_parts[-1].split('.')[0]
-            
-            public_id = f"{folder}/{file_basename}"
-            
-            # Encode content to base64
-            file_b64 = base64.b64encode(content).decode('utf-8')
-            data_uri = f"data:{content_type};base64,{file_b64}"
-            
-            # Cloudinary upload URL
-            upload_url = f"https://api.cloudinary.com/v1_1/{settings.CLOUDINARY_CLOUD_NAME}/image/upload"
-            
-            # Prepare upload data
-            import hashlib
-            import time
-            timestamp = int(time.time())
-            
-            upload_data = {
-                "file": data_uri,
-                "public_id": public_id,
-                "folder": folder,
-                "resource_type": "auto",
-                "api_key": settings.CLOUDINARY_API_KEY,
-                "timestamp": timestamp
+    def resolve_urls(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy of a screenshot document whose stored references are client URLs"""
+        resolve = self.client_url
+        resolved = dict(document)
+        for field in ("screenshot_url", "thumbnail_url"):
+            if field in resolved:
+                resolved[field] = resolve(resolved[field])
+        if resolved.get("derivatives"):
+            resolved["derivatives"] = {
+                image_format: {width: resolve(ref) for width, ref in widths.items()}
+                for image_format, widths in resolved["derivatives"].items()
             }
-            
-            # Create signature
-            sig_params = [f"{k}={v}" for k, v in sorted(upload_data.items()) if k != "file" and k != "api_key"]
-            sig_string = "&".join(sig_params) + settings.CLOUDINARY_API_SECRET
-            signature = hashlib.sha1(sig_string.encode()).hexdigest()
-            upload_data["signature"] = signature
-            
-            # Upload to Cloudinary
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(upload_url, data=upload_data)
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    logger.info(f"Successfully uploaded to Cloudinary: {result['secure_url']}")
-                    return result["secure_url"]
-                else:
-                    logger.error(f"Cloudinary upload failed: {response.status_code} - {response.text}")
-                    raise StorageError(f"Cloudinary upload failed: {response.status_code}")
-                    
-        except Exception as e:
-            logger.error(f"Cloudinary direct upload error: {e}")
-            # Fall back to local storage for screenshots
-            file_path = self.upload_dir / filename
-            file_path.parent.mkdir(parents=True, exist_ok=True)
-            
-            async with aiofiles.open(file_path, 'wb') as f:
-                await f.write(content)
-            
-            return f"/uploads/{filename}"
+        return resolved
+
+def _fsync_directory(path: Path):
+    """Persist a directory entry (a rename) to disk"""
+    dir_fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
 
 # Global storage service instance
 storage_service = StorageService()
\ No newline at end of file
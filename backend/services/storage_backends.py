@@ -0,0 +1,433 @@
+"""
+Storage backends used by StorageService
+
+A backend stores objects under a key (e.g. ``screenshots/<user>/<hash>.png``)
+and returns a reference that is saved in the database: ``/uploads/<key>`` for
+local disk, ``s3://<bucket>/<key>`` for S3-compatible object storage and the
+secure URL for Cloudinary. References are turned into client URLs with
+``url()`` when they are returned by the API.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, Optional, Tuple
+
+import aiofiles
+from auth.url_signing import sign_path
+from config import settings
+from services.http_clients import http_clients
+
+logger = logging.getLogger(__name__)
+
+# S3 rejects multipart parts smaller than 5 MB (except the last) and more than 10,000 parts
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+S3_MAX_PARTS = 10000
+
+class StorageError(Exception):
+    """Custom exception for storage operations"""
+    pass
+
+async def stream_url(url: str, chunk_size: int) -> AsyncIterator[bytes]:
+    """Stream a remote file through the shared storage HTTP client, with its retries and breaker"""
+    async with http_clients.stream("storage", "GET", url) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes(chunk_size):
+            yield chunk
+
+class StorageBackend:
+    """Interface implemented by every storage backend"""
+
+    name = ""
+
+    def owns(self, ref: str) -> bool:
+        """Whether a stored reference belongs to this backend"""
+        raise NotImplementedError
+
+    async def put_path(self, key: str, source: Path, content_type: str) -> str:
+        """Store a local file under ``key`` without reading it into memory; returns the reference"""
+        raise NotImplementedError
+
+    async def put_bytes(self, key: str, content: bytes, content_type: str) -> str:
+        """Store ``content`` under ``key``; returns the reference"""
+        raise NotImplementedError
+
+    async def delete(self, ref: str) -> bool:
+        """Delete a stored object; returns False when nothing was deleted"""
+        raise NotImplementedError
+
+    def iter_bytes(self, ref: str, chunk_size: int) -> AsyncIterator[bytes]:
+        """Stream a stored object back in chunks"""
+        raise NotImplementedError
+
+    def url(self, ref: str, expires_in: Optional[int] = None) -> str:
+        """URL a client can fetch the object from"""
+        raise NotImplementedError
+
+    async def size(self, ref: str) -> Optional[int]:
+        """Size in bytes of a stored object, None when it does not exist"""
+        raise NotImplementedError
+
+    def upload_url(self, key: str, content_type: str, expires_in: int) -> Optional[Tuple[str, str]]:
+        """
+        Presigned URL a client can PUT an object to directly, and the reference it will have
+
+        None when the backend does not accept direct uploads.
+        """
+        return None
+
+class LocalBackend(StorageBackend):
+    """Files under the uploads directory, served at /uploads"""
+
+    name = "local"
+
+    def __init__(self, upload_dir: Path):
+        self.upload_dir = upload_dir
+
+    def ref(self, key: str) -> str:
+        return f"/uploads/{key}"
+
+    def path_for(self, key: str) -> Path:
+        return self.upload_dir / key
+
+    def path_of(self, ref: str) -> Path:
+        return self.upload_dir / ref.replace("/uploads/", "", 1).lstrip("/")
+
+    def owns(self, ref: str) -> bool:
+        return ref.startswith("/uploads/")
+
+    async def put_path(self, key: str, source: Path, content_type: str) -> str:
+        """Copy a local file into the uploads directory (sendfile where the OS supports it)"""
+        file_path = self.path_for(key)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = file_path.with_name(file_path.name + ".part")
+        await asyncio.to_thread(shutil.copyfile, source, temp_path)
+        os.replace(temp_path, file_path)
+        return self.ref(key)
+
+    async def put_bytes(self, key: str, content: bytes, content_type: str) -> str:
+        file_path = self.path_for(key)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = file_path.with_name(file_path.name + ".part")
+        async with aiofiles.open(temp_path, 'wb') as f:
+            await f.write(content)
+        os.replace(temp_path, file_path)
+        return self.ref(key)
+
+    async def delete(self, ref: str) -> bool:
+        full_path = self.path_of(ref)
+        if full_path.exists():
+            full_path.unlink()
+            return True
+        return False
+
+    async def iter_bytes(self, ref: str, chunk_size: int) -> AsyncIterator[bytes]:
+        async with aiofiles.open(self.path_of(ref), 'rb') as f:
+            while True:
+                chunk = await f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def url(self, ref: str, expires_in: Optional[int] = None) -> str:
+        return f"{settings.FRONTEND_URL}{sign_path(ref, expires_in)}"
+
+    async def size(self, ref: str) -> Optional[int]:
+        try:
+            return (await asyncio.to_thread(self.path_of(ref).stat)).st_size
+        except FileNotFoundError:
+            return None
+
+class S3Backend(StorageBackend):
+    """
+    S3-compatible object storage (AWS S3, MinIO, moto)
+
+    Objects above ``multipart_threshold`` are sent as a multipart upload whose
+    parts are read from disk and uploaded ``concurrency`` at a time; a failed
+    upload is aborted so no orphaned parts are billed. Reads go through
+    presigned GET URLs, so the bucket can stay private.
+    """
+
+    name = "aws_s3"
+    scheme = "s3://"
+
+    def __init__(
+        self,
+        bucket: str,
+        region: str,
+        endpoint_url: Optional[str] = None,
+        access_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        multipart_threshold: int = 8 * 1024 * 1024,
+        part_size: int = 8 * 1024 * 1024,
+        concurrency: int = 4,
+        presign_expiry: int = 3600
+    ):
+        # boto3 is only imported when S3 storage is configured
+        import boto3
+        from botocore.config import Config
+
+        if not bucket:
+            raise StorageError("S3_BUCKET_NAME must be set for aws_s3 storage")
+
+        config = {
+            "max_pool_connections": max(10, concurrency * 2),
+            "retries": {"mode": "standard", "max_attempts": 5},
+            "signature_version": "s3v4"
+        }
+        if endpoint_url:
+            # MinIO and moto serve buckets by path, not by virtual host
+            config["s3"] = {"addressing_style": "path"}
+
+        self.bucket = bucket
+        self.multipart_threshold = multipart_threshold
+        self.part_size = max(part_size, S3_MIN_PART_SIZE)
+        self.concurrency = max(1, concurrency)
+        self.presign_expiry = presign_expiry
+        self.client = boto3.client(
+            "s3",
+            region_name=region,
+            endpoint_url=endpoint_url or None,
+            aws_access_key_id=access_key or None,
+            aws_secret_access_key=secret_key or None,
+            config=Config(**config)
+        )
+
+    def ref(self, key: str) -> str:
+        return f"{self.scheme}{self.bucket}/{key}"
+
+    def split(self, ref: str) -> Tuple[str, str]:
+        """Bucket and key of an ``s3://`` reference"""
+        bucket, _, key = ref[len(self.scheme):].partition("/")
+        return bucket, key
+
+    def owns(self, ref: str) -> bool:
+        return ref.startswith(self.scheme)
+
+    async def put_path(self, key: str, source: Path, content_type: str) -> str:
+        def read_part(offset: int, length: int) -> bytes:
+            with open(source, "rb") as f:
+                f.seek(offset)
+                return f.read(length)
+
+        size = (await asyncio.to_thread(source.stat)).st_size
+        return await self._put(key, size, read_part, content_type)
+
+    async def put_bytes(self, key: str, content: bytes, content_type: str) -> str:
+        view = memoryview(content)
+        return await self._put(key, len(content), lambda offset, length: view[offset:offset + length], content_type)
+
+    async def _put(self, key: str, size: int, read_part: Callable[[int, int], bytes], content_type: str) -> str:
+        if size <= self.multipart_threshold:
+            body = await asyncio.to_thread(read_part, 0, size)
+            await asyncio.to_thread(
+                self.client.put_object, Bucket=self.bucket, Key=key, Body=bytes(body), ContentType=content_type
+            )
+            return self.ref(key)
+
+        part_size = max(self.part_size, math.ceil(size / S3_MAX_PARTS))
+        upload = await asyncio.to_thread(
+            self.client.create_multipart_upload, Bucket=self.bucket, Key=key, ContentType=content_type
+        )
+        upload_id = upload["UploadId"]
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        def upload_part(number: int, offset: int) -> Dict[str, object]:
+            body = read_part(offset, min(part_size, size - offset))
+            response = self.client.upload_part(
+                Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=bytes(body)
+            )
+            return {"PartNumber": number, "ETag": response["ETag"]}
+
+        async def send(number: int, offset: int) -> Dict[str, object]:
+            async with semaphore:
+                return await asyncio.to_thread(upload_part, number, offset)
+
+        tasks = [
+            asyncio.create_task(send(index + 1, offset))
+            for index, offset in enumerate(range(0, size, part_size))
+        ]
+        try:
+            parts = await asyncio.gather(*tasks)
+            await asyncio.to_thread(
+                self.client.complete_multipart_upload,
+                Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": list(parts)}
+            )
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            try:
+                await asyncio.to_thread(
+                    self.client.abort_multipart_upload, Bucket=self.bucket, Key=key, UploadId=upload_id
+                )
+            except Exception as e:
+                logger.error(f"Failed to abort multipart upload of {key}: {e}")
+            raise
+
+        logger.info(f"Uploaded {key} to S3 in {len(tasks)} parts")
+        return self.ref(key)
+
+    async def delete(self, ref: str) -> bool:
+        bucket, key = self.split(ref)
+        await asyncio.to_thread(self.client.delete_object, Bucket=bucket, Key=key)
+        return True
+
+    async def iter_bytes(self, ref: str, chunk_size: int) -> AsyncIterator[bytes]:
+        bucket, key = self.split(ref)
+        response = await asyncio.to_thread(self.client.get_object, Bucket=bucket, Key=key)
+        body = response["Body"]
+        try:
+            while True:
+                chunk = await asyncio.to_thread(body.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+    def url(self, ref: str, expires_in: Optional[int] = None) -> str:
+        """Presigned GET URL (signed locally, no request to S3)"""
+        bucket, key = self.split(ref)
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": bucket, "Key": key},
+            ExpiresIn=expires_in or self.presign_expiry
+        )
+
+    async def size(self, ref: str) -> Optional[int]:
+        from botocore.exceptions import ClientError
+
+        bucket, key = self.split(ref)
+        try:
+            head = await asyncio.to_thread(self.client.head_object, Bucket=bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return head["ContentLength"]
+
+    def upload_url(self, key: str, content_type: str, expires_in: int) -> Optional[Tuple[str, str]]:
+        """Presigned PUT; the client must send the same Content-Type header"""
+        url = self.client.generate_presigned_url(
+            "put_object",
+            Params={"Bucket": self.bucket, "Key": key, "ContentType": content_type},
+            ExpiresIn=expires_in
+        )
+        return url, self.ref(key)
+
+class CloudinaryBackend(StorageBackend):
+    """Cloudinary (FREE cloud storage), falling back to local disk when an upload fails"""
+
+    name = "cloudinary"
+
+    def __init__(self, fallback: LocalBackend):
+        self.fallback = fallback
+
+    def owns(self, ref: str) -> bool:
+        return ref.startswith("http")
+
+    def _folder(self, key: str) -> str:
+        path_parts = key.split('/')
+        return '/'.join(path_parts[:-1]) if len(path_parts) > 1 else 'screenshots'
+
+    def _public_id(self, key: str) -> str:
+        return f"{self._folder(key)}/{key.split('/')[-1].split('.')[0]}"
+
+    async def put_path(self, key: str, source: Path, content_type: str) -> str:
+        try:
+            return await self._post(source, key, content_type)
+        except Exception as e:
+            logger.error(f"Cloudinary upload error: {e}, falling back to local storage")
+            return await self.fallback.put_path(key, source, content_type)
+
+    async def put_bytes(self, key: str, content: bytes, content_type: str) -> str:
+        try:
+            return await self._post(content, key, content_type)
+        except Exception as e:
+            logger.error(f"Cloudinary direct upload error: {e}, falling back to local storage")
+            return await self.fallback.put_bytes(key, content, content_type)
+
+    async def _post(self, source, key: str, content_type: Optional[str]) -> str:
+        """Upload to Cloudinary as a streamed multipart file (no base64 data URI)"""
+        public_id = self._public_id(key)
+        timestamp = int(time.time())
+
+        # Cloudinary upload URL
+        upload_url = f"{settings.CLOUDINARY_API_URL}/{settings.CLOUDINARY_CLOUD_NAME}/image/upload"
+
+        upload_data = {
+            "public_id": public_id,
+            "folder": self._folder(key),
+            "resource_type": "auto",
+            "api_key": settings.CLOUDINARY_API_KEY,
+            "timestamp": timestamp
+        }
+
+        # Create signature
+        sig_params = [f"{k}={v}" for k, v in sorted(upload_data.items()) if k != "file" and k != "api_key"]
+        sig_string = "&".join(sig_params) + settings.CLOUDINARY_API_SECRET
+        upload_data["signature"] = hashlib.sha1(sig_string.encode()).hexdigest()
+
+        content_type = content_type or "application/octet-stream"
+        # POSTs are only retried when the connection failed before the body was sent
+        if isinstance(source, Path):
+            # httpx reads the file object in chunks while sending the request body
+            with open(source, "rb") as f:
+                response = await http_clients.request(
+                    "storage", "POST", upload_url,
+                    data=upload_data, files={"file": (source.name, f, content_type)}
+                )
+        else:
+            response = await http_clients.request(
+                "storage", "POST", upload_url,
+                data=upload_data, files={"file": (public_id.split("/")[-1], source, content_type)}
+            )
+
+        if response.status_code == 200:
+            result = response.json()
+            logger.info(f"Successfully uploaded to Cloudinary: {result['secure_url']}")
+            return result["secure_url"]
+
+        logger.error(f"Cloudinary upload failed: {response.status_code} - {response.text}")
+        raise StorageError(f"Cloudinary upload failed: {response.status_code}")
+
+    async def delete(self, ref: str) -> bool:
+        # Deleting needs the Admin API; stored images are left in place
+        return False
+
+    def iter_bytes(self, ref: str, chunk_size: int) -> AsyncIterator[bytes]:
+        return stream_url(ref, chunk_size)
+
+    def url(self, ref: str, expires_in: Optional[int] = None) -> str:
+        return ref
+
+    async def size(self, ref: str) -> Optional[int]:
+        response = await http_clients.request("storage", "HEAD", ref)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return int(response.headers.get("content-length", 0))
+
+def create_backend(storage_type: str, local: LocalBackend) -> StorageBackend:
+    """Backend for a STORAGE_TYPE setting"""
+    if storage_type == LocalBackend.name:
+        return local
+    if storage_type == S3Backend.name:
+        return S3Backend(
+            bucket=settings.S3_BUCKET_NAME,
+            region=settings.AWS_REGION,
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            access_key=settings.AWS_ACCESS_KEY_ID,
+            secret_key=settings.AWS_SECRET_ACCESS_KEY,
+            multipart_threshold=settings.S3_MULTIPART_THRESHOLD,
+            part_size=settings.S3_MULTIPART_PART_SIZE,
+            concurrency=settings.S3_MULTIPART_CONCURRENCY,
+            presign_expiry=settings.S3_PRESIGNED_URL_EXPIRY
+        )
+    if storage_type == CloudinaryBackend.name:
+        return CloudinaryBackend(local)
+    raise StorageError(f"Unsupported storage type: {storage_type}")
@@ -0,0 +1,216 @@
+import logging
+import uuid
+from datetime import datetime, date, timedelta
+from typing import Optional, Dict, Any, Tuple, Union
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from config import settings
+from database.mongodb import DatabaseOperations, get_collection
+from database.indexes import INDEX_REGISTRY
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_COLLECTION = "time_entry_daily_rollups"
+ROLLUP_KEY_FIELDS = ("organization_id", "user_id", "project_id", "day")
+DAY_FORMAT = "%Y-%m-%d"
+# One rebuild at a time across workers; a crashed holder's lock expires
+LOCK_COLLECTION = "time_rollup_locks"
+REBUILD_LOCK_ID = "rebuild"
+REBUILD_LOCK_SECONDS = 3600
+
+def _as_datetime(value: Any) -> Optional[datetime]:
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    return value if isinstance(value, datetime) else None
+
+def day_key(value: Union[datetime, date]) -> str:
+    """Rollup day for a datetime or date (UTC, same bucketing as $dateToString)"""
+    return value.strftime(DAY_FORMAT)
+
+def rollup_activity(row: Dict[str, Any]) -> float:
+    """Average activity level of a grouped rollup row (entries without activity are ignored)"""
+    count = row.get("activity_count") or 0
+    return row.get("activity_sum", 0) / count if count else 0.0
+
+def entry_contribution(entry: Optional[Dict[str, Any]]) -> Optional[Tuple[Tuple[str, ...], Dict[str, Any]]]:
+    """
+    Rollup key and counters contributed by one time entry
+
+    Only completed entries count; running entries are added when they stop.
+    Entries are bucketed by the UTC day of their start_time.
+    """
+    if not entry or entry.get("end_time") is None or entry.get("duration") is None:
+        return None
+    start_time = _as_datetime(entry.get("start_time"))
+    if start_time is None or not entry.get("organization_id"):
+        return None
+
+    key = (entry["organization_id"], entry["user_id"], entry.get("project_id"), day_key(start_time))
+    activity_level = entry.get("activity_level")
+    counters = {
+        "duration": entry["duration"],
+        "entries": 1,
+        "manual_entries": 1 if entry.get("is_manual") else 0,
+        "activity_sum": activity_level or 0,
+        "activity_count": 0 if activity_level is None else 1
+    }
+    return key, counters
+
+async def apply_entry_change(before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]):
+    """
+    Move a time entry's contribution from its old state to its new state
+
+    Pass ``before=None`` for a newly completed entry and ``after=None`` for a
+    deleted one. Failures are logged rather than raised so a rollup problem
+    never fails the time entry write; ``rebuild_rollups`` (POST
+    /analytics/rollups/rebuild) repairs drift.
+    """
+    increments: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+    for entry, sign in ((before, -1), (after, 1)):
+        contribution = entry_contribution(entry)
+        if contribution is None:
+            continue
+        key, counters = contribution
+        totals = increments.setdefault(key, {field: 0 for field in counters})
+        for field, value in counters.items():
+            totals[field] += sign * value
+
+    now = datetime.utcnow()
+    operations = []
+    for key, counters in increments.items():
+        if not any(counters.values()):
+            continue
+        operations.append(UpdateOne(
+            dict(zip(ROLLUP_KEY_FIELDS, key)),
+            {"$inc": counters, "$set": {"updated_at": now}},
+            upsert=True
+        ))
+
+    if not operations:
+        return
+    try:
+        result = await DatabaseOperations.bulk_write(ROLLUP_COLLECTION, operations)
+        if result["errors"]:
+            logger.error(f"Daily rollup update failed: {result['errors']}")
+    except Exception as e:
+        logger.error(f"Daily rollup update error: {e}")
+
+async def ensure_rollup_indexes():
+    """Create the unique rollup key index ($merge and upserts rely on it)"""
+    await get_collection(ROLLUP_COLLECTION).create_indexes(INDEX_REGISTRY[ROLLUP_COLLECTION])
+
+async def _acquire_rebuild_lock() -> Optional[str]:
+    """Owner token of the rebuild lock, or None while another worker holds it"""
+    owner = uuid.uuid4().hex
+    now = datetime.utcnow()
+    try:
+        # The upsert inserts a new lock unless an unexpired one exists, in which case the _id collides
+        await DatabaseOperations.find_one_and_update(
+            LOCK_COLLECTION,
+            {"_id": REBUILD_LOCK_ID, "expires_at": {"$lt": now}},
+            {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=REBUILD_LOCK_SECONDS)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return None
+    return owner
+
+async def _release_rebuild_lock(owner: str):
+    await get_collection(LOCK_COLLECTION).delete_one({"_id": REBUILD_LOCK_ID, "owner": owner})
+
+async def rebuild_rollups(organization_id: Optional[str] = None) -> bool:
+    """
+    Recompute rollups from time_entries (all organizations, or one); False if another rebuild is running
+
+    Rows are replaced in place by ``$merge`` and rows the rebuild did not
+    produce are deleted afterwards, so dashboards never see the rollups
+    missing. Not atomic with concurrent writes: an entry stopped or edited
+    while the aggregation runs may be counted twice (read by the aggregation
+    and also ``$inc``-ed into a row the merge then replaces) or lost. Run it
+    during quiet hours or run it again.
+    """
+    owner = await _acquire_rebuild_lock()
+    if owner is None:
+        logger.info("Daily rollup rebuild already running on another worker")
+        return False
+    try:
+        await _rebuild(organization_id)
+    finally:
+        await _release_rebuild_lock(owner)
+    return True
+
+async def _rebuild(organization_id: Optional[str]):
+    await ensure_rollup_indexes()
+    started = datetime.utcnow()
+    rebuild_id = uuid.uuid4().hex
+
+    match: Dict[str, Any] = {"end_time": {"$ne": None}, "duration": {"$ne": None}}
+    scope: Dict[str, Any] = {}
+    if organization_id:
+        match["organization_id"] = organization_id
+        scope["organization_id"] = organization_id
+
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "organization_id": "$organization_id",
+                "user_id": "$user_id",
+                "project_id": "$project_id",
+                "day": {"$dateToString": {"format": DAY_FORMAT, "date": "$start_time"}}
+            },
+            "duration": {"$sum": "$duration"},
+            "entries": {"$sum": 1},
+            "manual_entries": {"$sum": {"$cond": ["$is_manual", 1, 0]}},
+            "activity_sum": {"$sum": {"$ifNull": ["$activity_level", 0]}},
+            "activity_count": {"$sum": {"$cond": [{"$eq": [{"$ifNull": ["$activity_level", None]}, None]}, 0, 1]}}
+        }},
+        {"$replaceWith": {"$mergeObjects": ["$_id", {
+            "duration": "$duration",
+            "entries": "$entries",
+            "manual_entries": "$manual_entries",
+            "activity_sum": "$activity_sum",
+            "activity_count": "$activity_count",
+            "rebuild_id": rebuild_id,
+            "updated_at": started
+        }]}},
+        {"$merge": {
+            "into": ROLLUP_COLLECTION,
+            "on": list(ROLLUP_KEY_FIELDS),
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }}
+    ]
+
+    # $merge writes, so this aggregation always runs on the primary
+    await get_collection("time_entries", "primary").aggregate(pipeline).to_list(None)
+    # Keys without completed entries any more; rows created by an $inc since the start are kept
+    await get_collection(ROLLUP_COLLECTION).delete_many(
+        {**scope, "rebuild_id": {"$ne": rebuild_id}, "updated_at": {"$lt": started}}
+    )
+    logger.info(f"Rebuilt daily rollups for {organization_id or 'all organizations'}")
+
+async def backfill_rollups_if_empty():
+    """Build rollups from history the first time the collection is used"""
+    if not settings.TIME_ROLLUPS_BACKFILL:
+        return
+    try:
+        owner = await _acquire_rebuild_lock()
+        if owner is None:
+            # Another worker is starting up too and does the backfill
+            return
+        try:
+            # Checked under the lock so a worker starting after a finished backfill does not redo it
+            if await get_collection(ROLLUP_COLLECTION).estimated_document_count() == 0:
+                if await get_collection("time_entries").estimated_document_count() > 0:
+                    await _rebuild(None)
+            else:
+                await ensure_rollup_indexes()
+        finally:
+            await _release_rebuild_lock(owner)
+    except Exception as e:
+        logger.error(f"Daily rollup backfill failed: {e}")
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+from typing import Dict, List, Any, Iterable, Optional
+
+from config import settings
+from database.mongodb import DatabaseOperations
+
+logger = logging.getLogger(__name__)
+
+# Append-only telemetry collections that are safe to write behind (application_usage and
+# website_visits are not: their routes read the previous row back on the next event)
+TELEMETRY_COLLECTIONS = (
+    "keyboard_activity",
+    "mouse_activity",
+    "keystroke_data",
+)
+
+class WriteBehindBuffer:
+    """
+    In-process write-behind buffer for high-frequency telemetry inserts
+
+    Documents are queued per collection and written with unordered insert_many
+    when a collection reaches ``max_batch_size`` documents or every
+    ``flush_interval`` seconds, whichever comes first. When Mongo falls behind
+    and a collection holds ``max_pending`` documents, callers flush inline
+    instead of queueing more, which applies backpressure to the request path.
+
+    Buffered documents become visible to queries at most ``flush_interval``
+    seconds after they are added. Collections that need read-your-writes
+    (sessions, time entries, screenshots) must keep using DatabaseOperations.
+    """
+
+    def __init__(
+        self,
+        collections: Iterable[str] = TELEMETRY_COLLECTIONS,
+        max_batch_size: int = 500,
+        flush_interval: float = 1.0,
+        max_pending: int = 5000
+    ):
+        self.collections = set(collections)
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max(max_pending, max_batch_size)
+        self._pending: Dict[str, List[Dict[str, Any]]] = {c: [] for c in self.collections}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._background_flushes: set = set()
+        self.stats = {"buffered": 0, "flushed": 0, "failed": 0, "backpressure_waits": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._flusher is not None and not self._flusher.done()
+
+    def handles(self, collection: str) -> bool:
+        """Whether inserts into this collection are written behind"""
+        return self.running and collection in self.collections
+
+    def pending_count(self, collection: Optional[str] = None) -> int:
+        """Number of documents waiting to be flushed"""
+        if collection:
+            return len(self._pending.get(collection, []))
+        return sum(len(docs) for docs in self._pending.values())
+
+    async def start(self):
+        """Start the periodic flusher (called from the application lifespan)"""
+        if self.running:
+            return
+        self._flusher = asyncio.create_task(self._flush_periodically())
+        logger.info(
+            f"Write-behind buffer started for {sorted(self.collections)} "
+            f"(batch={self.max_batch_size}, interval={self.flush_interval}s)"
+        )
+
+    async def stop(self):
+        """Stop the periodic flusher and drain every queued document, logging any that could not be written"""
+        if self._flusher:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+
+        if self._background_flushes:
+            await asyncio.gather(*self._background_flushes, return_exceptions=True)
+        # A failed flush requeues its documents; retry once before giving them up
+        for _ in range(2):
+            try:
+                await self.flush_all()
+            except Exception as e:
+                logger.error(f"Write-behind final flush error: {e}")
+            if not self.pending_count():
+                break
+
+        lost = {collection: len(documents) for collection, documents in self._pending.items() if documents}
+        if lost:
+            self.stats["failed"] += sum(lost.values())
+            self._pending = {collection: [] for collection in self.collections}
+            logger.error(f"Write-behind buffer stopped with {sum(lost.values())} documents lost: {lost}")
+        logger.info(f"Write-behind buffer stopped: {self.stats}")
+
+    async def add(self, collection: str, document: Dict[str, Any]):
+        """Queue a single document for insertion"""
+        await self.add_many(collection, [document])
+
+    async def add_many(self, collection: str, documents: List[Dict[str, Any]]):
+        """Queue documents for insertion, falling back to a direct write when not running"""
+        if not documents:
+            return
+
+        if not self.handles(collection):
+            result = await DatabaseOperations.insert_many(collection, documents)
+            if result["errors"]:
+                logger.error(f"Direct insert into {collection} dropped {len(result['errors'])} documents: {result['errors'][:3]}")
+            return
+
+        # Backpressure: Mongo is behind, so make this caller wait for a flush
+        while self.pending_count(collection) >= self.max_pending:
+            self.stats["backpressure_waits"] += 1
+            if not await self.flush(collection):
+                raise RuntimeError(f"Write-behind buffer for {collection} is full and Mongo is unavailable")
+
+        self._pending[collection].extend(documents)
+        self.stats["buffered"] += len(documents)
+
+        if self.pending_count(collection) >= self.max_batch_size:
+            self._schedule_flush(collection)
+
+    async def flush(self, collection: str) -> bool:
+        """Write every queued document of one collection, returning False if any were requeued"""
+        lock = self._locks.setdefault(collection, asyncio.Lock())
+        async with lock:
+            documents = self._pending.get(collection)
+            if not documents:
+                return True
+            self._pending[collection] = []
+
+            for start in range(0, len(documents), self.max_batch_size):
+                chunk = documents[start:start + self.max_batch_size]
+                try:
+                    result = await DatabaseOperations.insert_many(collection, chunk, chunk_size=len(chunk))
+                    # Unordered insert: everything but the failed documents was written
+                    write_errors = result["errors"]
+                    self.stats["flushed"] += len(chunk) - len(write_errors)
+                    if write_errors:
+                        self.stats["failed"] += len(write_errors)
+                        logger.error(f"Write-behind flush to {collection} dropped {len(write_errors)} documents: {write_errors[:3]}")
+                except Exception as e:
+                    # Transient failure: requeue the unwritten documents for the next flush
+                    remaining = documents[start:]
+                    self._pending[collection] = remaining + self._pending[collection]
+                    logger.error(f"Write-behind flush to {collection} failed, {len(remaining)} documents requeued: {e}")
+                    return False
+            return True
+
+    async def flush_all(self):
+        """Write every queued document of every collection"""
+        await asyncio.gather(*(self.flush(collection) for collection in self.collections))
+
+    def _schedule_flush(self, collection: str):
+        task = asyncio.create_task(self.flush(collection))
+        self._background_flushes.add(task)
+        task.add_done_callback(self._background_flushes.discard)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush_all()
+            except Exception as e:
+                logger.error(f"Write-behind periodic flush error: {e}")
+
+# Global write-behind buffer instance
+write_buffer = WriteBehindBuffer(
+    max_batch_size=settings.WRITE_BUFFER_MAX_BATCH,
+    flush_interval=settings.WRITE_BUFFER_FLUSH_INTERVAL,
+    max_pending=settings.WRITE_BUFFER_MAX_PENDING
+)
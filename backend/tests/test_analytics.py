@@ -87,7 +87,73 @@ class TestAnalyticsEndpoints:
         assert response.status_code == 200
         data = response.json()
         # Should contain custom report data
-    
+
+    async def test_export_custom_report_csv(self, http_client: httpx.AsyncClient, admin_auth_headers: Dict[str, str]):
+        """Test streaming a custom report as CSV"""
+        end_date = datetime.utcnow().date()
+        start_date = end_date - timedelta(days=30)
+
+        params = {
+            "start_date": start_date.isoformat(),
+            "end_date": end_date.isoformat(),
+            "format": "csv"
+        }
+
+        response = await http_client.get("/analytics/reports/custom", headers=admin_auth_headers, params=params)
+        print(f"Export custom report response: {response.status_code} - {response.text[:200]}")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        assert response.text.splitlines()[0] == "date,user_name,project_name,hours,activity_level,entries"
+
+        params["format"] = "xml"
+        response = await http_client.get("/analytics/reports/custom", headers=admin_auth_headers, params=params)
+        print(f"Unknown report format response: {response.status_code}")
+        assert response.status_code == 422
+
+    async def test_rebuild_rollups(self, http_client: httpx.AsyncClient, admin_auth_headers: Dict[str, str], user_auth_headers: Dict[str, str]):
+        """Test that an admin can rebuild the organization's daily rollups and other users cannot"""
+        response = await http_client.post("/analytics/rollups/rebuild", headers=admin_auth_headers)
+        print(f"Rebuild rollups response: {response.status_code} - {response.text}")
+        assert response.status_code in (200, 409)
+
+        dashboard = await http_client.get("/analytics/dashboard", headers=admin_auth_headers)
+        assert dashboard.status_code == 200
+
+        response = await http_client.post("/analytics/rollups/rebuild", headers=user_auth_headers)
+        assert response.status_code == 403
+
+    async def test_report_job_deduplication(self, http_client: httpx.AsyncClient, admin_auth_headers: Dict[str, str]):
+        """Test that identical report requests share one background job"""
+        end_date = datetime.utcnow().date()
+        report_request = {
+            "report_type": "weekly",
+            "start_date": (end_date - timedelta(days=28)).isoformat(),
+            "end_date": end_date.isoformat(),
+            "format": "csv"
+        }
+
+        first = await http_client.post("/advanced-analytics/reports/generate", headers=admin_auth_headers, json=report_request)
+        second = await http_client.post("/advanced-analytics/reports/generate", headers=admin_auth_headers, json=report_request)
+        print(f"Report job responses: {first.status_code} - {first.text} / {second.status_code} - {second.text}")
+
+        assert first.status_code == 202
+        assert second.status_code == 202
+        assert second.json()["report_id"] == first.json()["report_id"]
+        assert second.json()["deduplicated"] is True
+
+        # Presentation flags do not change the report rows, so they share the job too
+        third = await http_client.post(
+            "/advanced-analytics/reports/generate", headers=admin_auth_headers,
+            json={**report_request, "include_charts": False, "include_insights": False}
+        )
+        assert third.status_code == 202
+        assert third.json()["report_id"] == first.json()["report_id"]
+
+        response = await http_client.get(f"/advanced-analytics/reports/{first.json()['report_id']}", headers=admin_auth_headers)
+        assert response.status_code == 200
+        assert response.json()["status"] in ["queued", "running", "completed"]
+
     async def test_analytics_unauthorized(self, http_client: httpx.AsyncClient):
         """Test analytics endpoints without authorization"""
         endpoints = [
@@ -200,4 +266,4 @@ class TestProductivityEndpoints:
         print(f"Record consent response: {response.status_code} - {response.text}")
         
         if response.status_code not in [200, 201]:
-            print(f"Record consent failed: {response.text}")
\ No newline at end of file
+            print(f"Record consent failed: {response.text}")
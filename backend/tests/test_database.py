@@ -0,0 +1,51 @@
+"""
+Tests for the bulk DatabaseOperations helpers
+"""
+import pytest
+import uuid
+from database.mongodb import DatabaseOperations, db
+
+@pytest.mark.asyncio
+class TestBulkOperations:
+    """Test insert_many and upsert_many against a scratch collection"""
+
+    async def _scratch_collection(self) -> str:
+        collection = f"test_bulk_{uuid.uuid4().hex[:8]}"
+        await db.database[collection].create_index("id", unique=True)
+        return collection
+
+    async def test_unordered_insert_many_reports_duplicates(self, setup_database):
+        """Test that an unordered insert writes every document but the duplicates and reports their indexes"""
+        collection = await self._scratch_collection()
+        try:
+            documents = [{"id": "a"}, {"id": "b"}, {"id": "a"}, {"id": "c"}, {"id": "b"}]
+            result = await DatabaseOperations.insert_many(collection, documents, chunk_size=2)
+            print(f"insert_many result: {result}")
+
+            assert result["inserted_count"] == 3
+            assert [error["index"] for error in result["errors"]] == [2, 4]
+            assert all(error["code"] == 11000 for error in result["errors"])
+            assert await DatabaseOperations.count_documents(collection) == 3
+        finally:
+            await db.database[collection].drop()
+
+    async def test_upsert_many_inserts_then_updates(self, setup_database):
+        """Test that upsert_many inserts new keys and $sets fields on existing ones"""
+        collection = await self._scratch_collection()
+        try:
+            result = await DatabaseOperations.upsert_many(collection, [{"id": "a", "value": 1}, {"id": "b", "value": 2}])
+            assert result["upserted_count"] == 2
+            assert set(result["upserted_ids"]) == {0, 1}
+
+            result = await DatabaseOperations.upsert_many(collection, [{"id": "b", "value": 3}, {"id": "c", "value": 4}])
+            print(f"upsert_many result: {result}")
+            assert result["matched_count"] == 1
+            assert result["modified_count"] == 1
+            assert list(result["upserted_ids"]) == [1]
+            assert not result["errors"]
+
+            documents = await DatabaseOperations.find_by_ids(collection, ["a", "b", "c"])
+            assert {key: document["value"] for key, document in documents.items()} == {"a": 1, "b": 3, "c": 4}
+            assert all(document["updated_at"] for document in documents.values())
+        finally:
+            await db.database[collection].drop()
@@ -0,0 +1,105 @@
+"""
+Tests for the outbound HTTP client registry against a local stub server
+"""
+import pytest
+import asyncio
+from services.http_clients import OutboundClients, CircuitOpen, breaker_name
+
+async def _start_stub(statuses):
+    """
+    Minimal HTTP/1.1 server answering each request with the next status in ``statuses``
+    (the last one repeats). Returns the server, its base URL and the list of seen requests.
+    """
+    seen = []
+
+    async def handle(reader, writer):
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode().partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            if length:
+                await reader.readexactly(length)
+            seen.append(request_line.decode().split()[0])
+            code = statuses[min(len(seen), len(statuses)) - 1]
+            writer.write(f"HTTP/1.1 {code} Stub\r\nContent-Length: 2\r\nRetry-After: 0\r\n\r\nok".encode())
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"http://127.0.0.1:{port}", seen
+
+@pytest.mark.asyncio
+class TestOutboundClients:
+    """Test retries and circuit breaking of outbound requests"""
+
+    async def test_retries_then_opens_circuit(self):
+        """Test idempotent retries, no retries for POST, and the breaker opening"""
+        server, base_url, seen = await _start_stub([503, 503, 200, 500])
+        clients = OutboundClients(retries=2, backoff_base=0.01, failure_threshold=2, reset_timeout=60, http2=False)
+        try:
+            response = await clients.request("stub", "GET", f"{base_url}/boards")
+            print(f"Retried GET: {response.status_code} after {len(seen)} attempts")
+            assert response.status_code == 200
+            assert seen == ["GET", "GET", "GET"]
+
+            # 5xx on a POST is returned as-is: the server may have acted on it
+            for _ in range(2):
+                response = await clients.request("stub", "POST", f"{base_url}/cards", json={"name": "x"})
+                assert response.status_code == 500
+            assert seen.count("POST") == 2
+            assert clients.snapshot()[breaker_name("stub", base_url)]["state"] == "open"
+
+            with pytest.raises(CircuitOpen):
+                await clients.request("stub", "GET", f"{base_url}/boards")
+            assert len(seen) == 5
+        finally:
+            await clients.stop()
+            server.close()
+            await server.wait_closed()
+
+    async def test_breakers_are_per_host_and_scope(self):
+        """Test that a failing host or webhook does not open the circuit for the integration's others"""
+        failing, failing_url, _ = await _start_stub([500])
+        healthy, healthy_url, _ = await _start_stub([200])
+        clients = OutboundClients(retries=0, failure_threshold=1, reset_timeout=60, http2=False)
+        try:
+            await clients.request("stub", "POST", f"{failing_url}/hook", breaker_scope="tenant-a")
+            with pytest.raises(CircuitOpen):
+                await clients.request("stub", "POST", f"{failing_url}/hook", breaker_scope="tenant-a")
+
+            # Same host, another tenant's webhook
+            response = await clients.request("stub", "POST", f"{failing_url}/hook", breaker_scope="tenant-b")
+            assert response.status_code == 500
+
+            response = await clients.request("stub", "POST", f"{healthy_url}/hook")
+            assert response.status_code == 200
+            print(f"Breakers: {clients.snapshot()}")
+        finally:
+            await clients.stop()
+            for server in (failing, healthy):
+                server.close()
+                await server.wait_closed()
+
+    async def test_stream_is_retried_before_the_body(self):
+        """Test that a streamed GET is retried on 503 and then read in chunks"""
+        server, base_url, seen = await _start_stub([503, 200])
+        clients = OutboundClients(retries=2, backoff_base=0.01, http2=False)
+        try:
+            async with clients.stream("stub", "GET", f"{base_url}/file") as response:
+                body = b"".join([chunk async for chunk in response.aiter_bytes(1)])
+            assert response.status_code == 200
+            assert body == b"ok"
+            assert seen == ["GET", "GET"]
+        finally:
+            await clients.stop()
+            server.close()
+            await server.wait_closed()
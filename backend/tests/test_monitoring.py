@@ -0,0 +1,431 @@
+"""
+Monitoring endpoints tests
+"""
+import pytest
+import httpx
+import gzip
+import json
+import uuid
+from typing import Dict, Any
+from datetime import datetime, timedelta
+
+@pytest.mark.asyncio
+class TestMonitoringEndpoints:
+    """Test monitoring endpoints"""
+
+    async def _create_time_entry(self, user: Dict[str, Any], project: Dict[str, Any]) -> str:
+        from database.mongodb import DatabaseOperations
+
+        entry_id = str(uuid.uuid4())
+        await DatabaseOperations.create_document("time_entries", {
+            "id": entry_id,
+            "user_id": user["id"],
+            "project_id": project["id"],
+            "organization_id": user["organization_id"],
+            "start_time": datetime.utcnow() - timedelta(minutes=10),
+            "end_time": None,
+            "description": "Batch ingest test entry"
+        })
+        return entry_id
+
+    async def test_activity_batch_gzip(self, http_client: httpx.AsyncClient, admin_auth_headers: Dict[str, str], test_admin_user: Dict[str, Any], test_project: Dict[str, Any]):
+        """Test ingesting a gzip-compressed activity batch"""
+        entry_id = await self._create_time_entry(test_admin_user, test_project)
+        now = datetime.utcnow()
+
+        samples = [
+            {
+                "time_entry_id": entry_id,
+                "timestamp": (now - timedelta(seconds=60 - i)).isoformat(),
+                "keystroke_count": 5,
+                "mouse_clicks": 1,
+                "mouse_movements": 20,
+                "active_application": "Visual Studio Code"
+            }
+            for i in range(60)
+        ]
+        body = gzip.compress(json.dumps({"samples": samples}).encode())
+        headers = {**admin_auth_headers, "Content-Type": "application/json", "Content-Encoding": "gzip"}
+
+        response = await http_client.post("/monitoring/activity/batch", headers=headers, content=body)
+        print(f"Activity batch response: {response.status_code} - {response.text}")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["accepted"] == 60
+        assert data["time_entries"] == 1
+
+    async def test_activity_batch_foreign_time_entry(self, http_client: httpx.AsyncClient, admin_auth_headers: Dict[str, str]):
+        """Test that a batch referencing an unknown time entry is rejected as a whole"""
+        batch = {
+            "samples": [
+                {
+                    "time_entry_id": str(uuid.uuid4()),
+                    "timestamp": datetime.utcnow().isoformat(),
+                    "keystroke_count": 3
+                }
+            ]
+        }
+
+        response = await http_client.post("/monitoring/activity/batch", headers=admin_auth_headers, json=batch)
+        print(f"Foreign activity batch response: {response.status_code} - {response.text}")
+
+        assert response.status_code == 404
+
+    async def test_activity_batch_invalid_body(self, http_client: httpx.AsyncClient, admin_auth_headers: Dict[str, str]):
+        """Test that a malformed batch is rejected"""
+        response = await http_client.post("/monitoring/activity/batch", headers=admin_auth_headers, json={"samples": "nope"})
+        print(f"Invalid activity batch response: {response.status_code} - {response.text}")
+
+        assert response.status_code == 422
+
+    async def test_activity_batch_truncated_gzip(self, http_client: httpx.AsyncClient, admin_auth_headers: Dict[str, str]):
+        """Test that a gzip body cut off before its end is rejected, even when the JSON inside is complete"""
+        body = gzip.compress(json.dumps({"samples": []}).encode())[:-8]
+        headers = {**admin_auth_headers, "Content-Encoding": "gzip", "Content-Type": "application/json"}
+        response = await http_client.post("/monitoring/activity/batch", headers=headers, content=body)
+        print(f"Truncated activity batch response: {response.status_code} - {response.text}")
+
+        assert response.status_code == 400
+
+    async def test_rapid_application_switches_leave_one_open_row(self, setup_database, http_client: httpx.AsyncClient, admin_auth_headers: Dict[str, str], test_admin_user: Dict[str, Any], test_project: Dict[str, Any]):
+        """Test that a switch right after another closes the previous usage row instead of leaving it open"""
+        from database.mongodb import DatabaseOperations
+
+        entry_id = await self._create_time_entry(test_admin_user, test_project)
+        for application in ("Editor", "Browser"):
+            response = await http_client.post(
+                "/monitoring/application/switch",
+                headers=admin_auth_headers,
+                json={"time_entry_id": entry_id, "application_name": application}
+            )
+            print(f"Application switch response: {response.status_code} - {response.text}")
+            assert response.status_code == 200
+
+        rows = await DatabaseOperations.get_documents("application_usage", {"time_entry_id": entry_id})
+        open_rows = [row for row in rows if row["end_time"] is None]
+        assert len(rows) == 2
+        assert [row["application_name"] for row in open_rows] == ["Browser"]
+
+    async def _upload_screenshot(self, http_client: httpx.AsyncClient, headers: Dict[str, str], user: Dict[str, Any], entry_id: str, content: bytes, filename: str = "screen.png") -> httpx.Response:
+        return await http_client.post(
+            "/monitoring/screenshot/upload",
+            headers=headers,
+            files={"file": (filename, content, "image/png")},
+            data={
+                "time_entry_id": entry_id,
+                "user_id": user["id"],
+                "activity_level": "80",
+                "timestamp": datetime.utcnow().isoformat()
+            }
+        )
+
+    async def _wait_for_screenshot(self, http_client: httpx.AsyncClient, headers: Dict[str, str], screenshot_id: str) -> Dict[str, Any]:
+        import asyncio
+
+        status_data = {}
+        for _ in range(30):
+            response = await http_client.get(f"/monitoring/screenshots/{screenshot_id}/status", headers=headers)
+            assert response.status_code == 200
+            status_data = response.json()
+            if status_data["status"] in ["ready", "failed"]:
+                break
+            await asyncio.sleep(0.5)
+        print(f"Screenshot status: {status_data}")
+        return status_data
+
+    def _screenshot_png(self, color=(40, 90, 160)) -> bytes:
+        import io
+        from PIL import Image
+
+        image = io.BytesIO()
+        Image.new("RGB", (1920, 1080), color).save(image, format="PNG")
+        return image.getvalue()
+
+    async def test_screenshot_upload_is_processed_in_background(self, http_client: httpx.AsyncClient, admin_auth_headers: Dict[str, str], test_admin_user: Dict[str, Any], test_project: Dict[str, Any]):
+        """Test that an accepted screenshot is thumbnailed and stored by the pipeline"""
+        entry_id = await self._create_time_entry(test_admin_user, test_project)
+        response = await self._upload_screenshot(http_client, admin_auth_headers, test_admin_user, entry_id, self._screenshot_png())
+        print(f"Screenshot upload response: {response.status_code} - {response.text}")
+
+        assert response.status_code == 202
+        status_data = await self._wait_for_screenshot(http_client, admin_auth_headers, response.json()["screenshot_id"])
+
+        assert status_data["status"] == "ready"
+        assert status_data["screenshot_url"]
+        assert status_data["thumbnail_url"]
+        assert set(status_data["derivatives"]["webp"]) == {"200", "640", "1280"}
+
+    async def test_duplicate_screenshot_reuses_stored_file(self, http_client: httpx.AsyncClient, admin_auth_headers: Dict[str, str], test_admin_user: Dict[str, Any], test_project: Dict[str, Any]):
+        """Test that an identical frame references the stored original instead of new bytes"""
+        entry_id = await self._create_time_entry(test_admin_user, test_project)
+        content = self._screenshot_png(color=(12, 34, 56))
+
+        first = await self._upload_screenshot(http_client, admin_auth_headers, test_admin_user, entry_id, content)
+        assert first.status_code == 202
+        original = await self._wait_for_screenshot(http_client, admin_auth_headers, first.json()["screenshot_id"])
+        assert original["status"] == "ready"
+
+        second = await self._upload_screenshot(http_client, admin_auth_headers, test_admin_user, entry_id, content)
+        assert second.status_code == 202
+        duplicate = await self._wait_for_screenshot(http_client, admin_auth_headers, second.json()["screenshot_id"])
+
+        assert duplicate["status"] == "ready"
+        assert duplicate["duplicate_of"] == (original["duplicate_of"] or original["screenshot_id"])
+        assert duplicate["screenshot_url"] == original["screenshot_url"]
+        assert duplicate["similarity_to_previous"] == 1.0
+
+    async def test_screenshot_spool_extension_ignores_client_filename(self, http_client: httpx.AsyncClient, admin_auth_headers: Dict[str, str], test_admin_user: Dict[str, Any], test_project: Dict[str, Any]):
+        """Test that the spool file extension comes from an allowlisted content type, not the uploaded filename"""
+        from services.screenshot_pipeline import spool_extension
+
+        assert spool_extension("image/jpeg") in ("jpg", "jpeg")
+        assert spool_extension("image/webp") == "webp"
+        assert spool_extension("image/svg+xml") == "png"
+        assert spool_extension("png/../../escape") == "png"
+        assert spool_extension(None) == "png"
+
+        entry_id = await self._create_time_entry(test_admin_user, test_project)
+        response = await self._upload_screenshot(http_client, admin_auth_headers, test_admin_user, entry_id, self._screenshot_png(), filename="screen.png/../../escape")
+        print(f"Screenshot upload response: {response.status_code} - {response.text}")
+        assert response.status_code == 202
+        status_data = await self._wait_for_screenshot(http_client, admin_auth_headers, response.json()["screenshot_id"])
+        assert status_data["status"] == "ready"
+
+    async def test_screenshot_upload_too_large(self, http_client: httpx.AsyncClient, admin_auth_headers: Dict[str, str], test_admin_user: Dict[str, Any], test_project: Dict[str, Any]):
+        """Test that the upload size limit is enforced while streaming"""
+        from config import settings
+
+        entry_id = await self._create_time_entry(test_admin_user, test_project)
+        content = b"\0" * (settings.MAX_FILE_SIZE + 1)
+
+        response = await self._upload_screenshot(http_client, admin_auth_headers, test_admin_user, entry_id, content)
+        print(f"Oversized screenshot upload response: {response.status_code} - {response.text[:200]}")
+
+        assert response.status_code == 413
+
+    async def test_direct_screenshot_upload(self, http_client: httpx.AsyncClient, admin_auth_headers: Dict[str, str], test_admin_user: Dict[str, Any], test_project: Dict[str, Any]):
+        """Test the upload-url / PUT / complete protocol"""
+        entry_id = await self._create_time_entry(test_admin_user, test_project)
+        content = self._screenshot_png(color=(200, 30, 60))
+
+        response = await http_client.post(
+            "/monitoring/screenshot/upload-url",
+            headers=admin_auth_headers,
+            json={"time_entry_id": entry_id, "content_type": "image/png", "size_bytes": len(content)}
+        )
+        print(f"Upload URL response: {response.status_code} - {response.text}")
+        assert response.status_code == 201
+        upload = response.json()
+
+        # Completing before the bytes arrived is rejected
+        early = await http_client.post(upload["complete_url"].removeprefix("/api"), headers=admin_auth_headers)
+        assert early.status_code == 409
+
+        # Presigned S3 URLs are absolute; signed local upload URLs are relative to the API
+        upload_url = upload["upload_url"]
+        if upload_url.startswith("http"):
+            async with httpx.AsyncClient() as client:
+                put = await client.put(upload_url, content=content, headers=upload["headers"])
+        else:
+            put = await http_client.put(upload_url.removeprefix("/api"), content=content, headers=upload["headers"])
+        print(f"Direct upload response: {put.status_code}")
+        assert put.status_code == 200
+
+        complete = await http_client.post(upload["complete_url"].removeprefix("/api"), headers=admin_auth_headers)
+        assert complete.status_code == 202
+
+        status_data = await self._wait_for_screenshot(http_client, admin_auth_headers, upload["screenshot_id"])
+        assert status_data["status"] == "ready"
+        assert status_data["thumbnail_url"]
+
+    async def test_screenshot_files_are_signed_and_cacheable(self, http_client: httpx.AsyncClient, admin_auth_headers: Dict[str, str], test_admin_user: Dict[str, Any], test_project: Dict[str, Any]):
+        """Test signed /uploads URLs with immutable caching, conditional and range requests"""
+        from config import settings
+
+        if settings.STORAGE_TYPE != "local":
+            pytest.skip("Only local storage is served from /uploads")
+
+        entry_id = await self._create_time_entry(test_admin_user, test_project)
+        response = await self._upload_screenshot(http_client, admin_auth_headers, test_admin_user, entry_id, self._screenshot_png(color=(90, 10, 200)))
+        status_data = await self._wait_for_screenshot(http_client, admin_auth_headers, response.json()["screenshot_id"])
+        assert status_data["status"] == "ready"
+
+        signed_url = status_data["screenshot_url"]
+        async with httpx.AsyncClient(base_url=str(http_client.base_url).removesuffix("/api")) as client:
+            unsigned = await client.get(signed_url.split("?")[0])
+            assert unsigned.status_code == 403
+
+            full = await client.get(signed_url)
+            print(f"Upload headers: {dict(full.headers)}")
+            assert full.status_code == 200
+            assert "immutable" in full.headers["cache-control"]
+
+            cached = await client.get(signed_url, headers={"If-None-Match": full.headers["etag"]})
+            assert cached.status_code == 304
+
+            partial = await client.get(signed_url, headers={"Range": "bytes=0-99"})
+            assert partial.status_code == 206
+            assert partial.content == full.content[:100]
+
+    async def test_retention_tiers_and_purges_screenshots(self, setup_database, http_client: httpx.AsyncClient, admin_auth_headers: Dict[str, str], test_admin_user: Dict[str, Any], test_project: Dict[str, Any]):
+        """Test that retention drops originals, then every file, and updates storage usage"""
+        from database.mongodb import DatabaseOperations
+        from services.retention import retention_sweeper
+
+        async def storage_used() -> int:
+            organization = await DatabaseOperations.get_document("organizations", {"id": org_id})
+            return organization.get("storage_used_bytes", 0)
+
+        org_id = test_admin_user["organization_id"]
+
+        entry_id = await self._create_time_entry(test_admin_user, test_project)
+        response = await self._upload_screenshot(http_client, admin_auth_headers, test_admin_user, entry_id, self._screenshot_png(color=(5, 150, 75)))
+        screenshot_id = response.json()["screenshot_id"]
+        ready = await self._wait_for_screenshot(http_client, admin_auth_headers, screenshot_id)
+        assert ready["status"] == "ready"
+
+        used_before = await storage_used()
+        print(f"Storage used: {used_before}")
+        assert used_before > 0
+
+        result = await retention_sweeper.sweep(now=datetime.utcnow() + timedelta(days=8), organization_id=org_id)
+        print(f"Tiering sweep: {result}")
+        tiered = (await http_client.get(f"/monitoring/screenshots/{screenshot_id}/status", headers=admin_auth_headers)).json()
+        assert tiered["screenshot_url"] != ready["screenshot_url"]
+        assert tiered["thumbnail_url"]
+
+        result = await retention_sweeper.sweep(now=datetime.utcnow() + timedelta(days=31), organization_id=org_id)
+        print(f"Purge sweep: {result}")
+        purged = (await http_client.get(f"/monitoring/screenshots/{screenshot_id}/status", headers=admin_auth_headers)).json()
+        assert purged["screenshot_url"] is None
+        assert purged["derivatives"] == {}
+
+        assert await storage_used() < used_before
+
+    async def _store_screenshot_files(self, org_id: str, stored_hash: str) -> Dict[str, str]:
+        from services.retention import record_stored_object
+        from services.storage import storage_service
+
+        refs = {}
+        for name, filename in (("original", f"{stored_hash}.png"), ("derivative", f"{stored_hash}-1280.webp"), ("thumbnail", f"{stored_hash}-thumb.webp")):
+            content = f"{name} {stored_hash}".encode()
+            refs[name] = await storage_service.upload_file(f"screenshots/{org_id}/{filename}", content, "image/png")
+            await record_stored_object(org_id, refs[name], len(content))
+        return refs
+
+    async def test_retention_keeps_files_shared_by_stored_hash(self, setup_database, test_admin_user: Dict[str, Any]):
+        """Test that tiering and purging only delete a shared file once no screenshot still needs it"""
+        from database.mongodb import DatabaseOperations
+        from services.retention import retention_sweeper
+        from services.storage import storage_service
+
+        org_id = test_admin_user["organization_id"]
+        stored_hash = uuid.uuid4().hex
+        refs = await self._store_screenshot_files(org_id, stored_hash)
+        start = datetime.utcnow()
+
+        older, newer = str(uuid.uuid4()), str(uuid.uuid4())
+        for screenshot_id, timestamp in ((older, start), (newer, start + timedelta(days=20))):
+            await DatabaseOperations.create_document("screenshots", {
+                "id": screenshot_id,
+                "user_id": test_admin_user["id"],
+                "organization_id": org_id,
+                "timestamp": timestamp,
+                "status": "ready",
+                "storage_tier": "original",
+                "stored_hash": stored_hash,
+                "screenshot_url": refs["original"],
+                "thumbnail_url": refs["thumbnail"],
+                "derivatives": {"webp": {"1280": refs["derivative"]}}
+            })
+
+        async def exists(ref: str) -> bool:
+            stored = await DatabaseOperations.get_document("storage_objects", {"ref": ref})
+            return stored is not None and await storage_service.file_size(ref) is not None
+
+        # Only the older screenshot is tiered; the newer one still serves the original
+        await retention_sweeper.sweep(now=start + timedelta(days=8), organization_id=org_id)
+        assert all([await exists(ref) for ref in refs.values()])
+
+        # The newer one is tiered (dropping the original), the older one purged; the derivatives are still needed
+        result = await retention_sweeper.sweep(now=start + timedelta(days=31), organization_id=org_id)
+        print(f"Sweep with one screenshot left: {result}")
+        assert not await exists(refs["original"])
+        assert await exists(refs["derivative"])
+        assert await exists(refs["thumbnail"])
+
+        await retention_sweeper.sweep(now=start + timedelta(days=51), organization_id=org_id)
+        for ref in refs.values():
+            assert not await exists(ref)
+
+    async def test_purging_a_failed_screenshot_removes_its_upload_and_spool(self, setup_database, test_admin_user: Dict[str, Any], tmp_path):
+        """Test that a failed screenshot's direct upload and spool copy are deleted when it is purged"""
+        from database.mongodb import DatabaseOperations
+        from services.retention import retention_sweeper
+        from services.storage import storage_service
+
+        org_id = test_admin_user["organization_id"]
+        screenshot_id = str(uuid.uuid4())
+        source_ref = await storage_service.upload_file(f"uploads/{org_id}/{screenshot_id}.png", b"never processed", "image/png")
+        spool_path = tmp_path / f"{screenshot_id}.png"
+        spool_path.write_bytes(b"never processed")
+        start = datetime.utcnow()
+        await DatabaseOperations.create_document("screenshots", {
+            "id": screenshot_id,
+            "user_id": test_admin_user["id"],
+            "organization_id": org_id,
+            "timestamp": start,
+            "status": "failed",
+            "storage_tier": "original",
+            "source_ref": source_ref,
+            "spool_path": str(spool_path)
+        })
+
+        await retention_sweeper.sweep(now=start + timedelta(days=31), organization_id=org_id)
+
+        purged = await DatabaseOperations.get_document("screenshots", {"id": screenshot_id})
+        assert purged["storage_tier"] == "purged"
+        assert purged["source_ref"] is None
+        assert not spool_path.exists()
+        assert await storage_service.file_size(source_ref) is None
+
+    async def test_near_identical_frames_keep_their_own_files(self, http_client: httpx.AsyncClient, admin_auth_headers: Dict[str, str], test_admin_user: Dict[str, Any], test_project: Dict[str, Any]):
+        """Test that a frame differing only by a line of text is stored, not replaced by the previous one"""
+        import io
+        from PIL import Image, ImageDraw
+
+        def frame(lines) -> bytes:
+            image = Image.new("RGB", (1920, 1080), (30, 30, 30))
+            draw = ImageDraw.Draw(image)
+            for number, text in enumerate(lines):
+                draw.text((40, 40 + number * 18), text, fill=(220, 220, 220))
+            data = io.BytesIO()
+            image.save(data, format="PNG")
+            return data.getvalue()
+
+        code = [f"    value_{i} = compute(value_{i - 1})" for i in range(40)]
+        entry_id = await self._create_time_entry(test_admin_user, test_project)
+        first = await self._upload_screenshot(http_client, admin_auth_headers, test_admin_user, entry_id, frame(code))
+        first_status = await self._wait_for_screenshot(http_client, admin_auth_headers, first.json()["screenshot_id"])
+        second = await self._upload_screenshot(http_client, admin_auth_headers, test_admin_user, entry_id, frame(code + ["password: hunter2 -- new chat message"]))
+        second_status = await self._wait_for_screenshot(http_client, admin_auth_headers, second.json()["screenshot_id"])
+
+        assert first_status["status"] == second_status["status"] == "ready"
+        assert second_status["duplicate_of"] is None
+        assert second_status["screenshot_url"] != first_status["screenshot_url"]
+
+    async def test_screenshot_listing_hides_pipeline_fields(self, http_client: httpx.AsyncClient, admin_auth_headers: Dict[str, str], test_admin_user: Dict[str, Any], test_project: Dict[str, Any]):
+        """Test that galleries only list processed screenshots and only client-facing fields"""
+        entry_id = await self._create_time_entry(test_admin_user, test_project)
+        response = await self._upload_screenshot(http_client, admin_auth_headers, test_admin_user, entry_id, self._screenshot_png(color=(90, 20, 140)))
+        await self._wait_for_screenshot(http_client, admin_auth_headers, response.json()["screenshot_id"])
+
+        for path in (f"/monitoring/screenshots/{entry_id}", "/monitoring/admin/screenshots"):
+            listing = await http_client.get(path, headers=admin_auth_headers)
+            print(f"Listing {path}: {listing.status_code}")
+            assert listing.status_code == 200
+            for screenshot in listing.json()["screenshots"]:
+                assert screenshot["status"] not in ["awaiting_upload", "pending", "processing"]
+                for field in ("spool_path", "spool_host", "lease_until", "stage_attempts", "processing_error", "source_ref", "content_hash", "_id"):
+                    assert field not in screenshot
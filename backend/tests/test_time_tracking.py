@@ -120,7 +120,35 @@ class TestTimeTrackingEndpoints:
             return data["id"]
         else:
             print(f"Manual entry creation failed: {response.text}")
-    
+
+    async def test_manual_entry_updates_daily_rollup(self, http_client: httpx.AsyncClient, admin_auth_headers: Dict[str, str], test_admin_user: Dict[str, Any], test_project: Dict[str, Any]):
+        """Test that a manual entry is added to the daily rollup"""
+        from database.mongodb import DatabaseOperations
+
+        start_time = (datetime.utcnow() - timedelta(days=3)).replace(hour=9, minute=0, second=0, microsecond=0)
+        end_time = start_time + timedelta(minutes=90)
+        rollup_query = {
+            "organization_id": test_admin_user["organization_id"],
+            "user_id": test_admin_user["id"],
+            "project_id": test_project["id"],
+            "day": start_time.strftime("%Y-%m-%d")
+        }
+        before = await DatabaseOperations.get_document("time_entry_daily_rollups", rollup_query)
+
+        response = await http_client.post("/time-tracking/manual", headers=admin_auth_headers, json={
+            "project_id": test_project["id"],
+            "start_time": start_time.isoformat(),
+            "end_time": end_time.isoformat(),
+            "description": "Rollup test entry"
+        })
+        print(f"Create manual entry response: {response.status_code} - {response.text}")
+        assert response.status_code == 200
+
+        rollup = await DatabaseOperations.get_document("time_entry_daily_rollups", rollup_query)
+        assert rollup is not None
+        assert rollup["duration"] - (before["duration"] if before else 0) == 90 * 60
+        assert rollup["entries"] - (before["entries"] if before else 0) == 1
+
     async def test_stop_tracking(self, http_client: httpx.AsyncClient, admin_auth_headers: Dict[str, str], setup_database):
         """Test stopping time tracking"""
         # First create a time entry to stop
@@ -104,7 +104,22 @@ class TestUserEndpoints:
         data = response.json()
         assert data["name"] == "Updated Admin Name"
         assert data["timezone"] == "America/New_York"
-    
+
+    async def test_update_current_user_invalidates_cache(self, http_client: httpx.AsyncClient, admin_auth_headers: Dict[str, str]):
+        """Test that the cached principal is refreshed after a profile update"""
+        # Warm the principal cache
+        response = await http_client.get("/users/me", headers=admin_auth_headers)
+        assert response.status_code == 200
+
+        response = await http_client.put("/users/me", headers=admin_auth_headers, json={"timezone": "Europe/Berlin"})
+        assert response.status_code == 200
+
+        response = await http_client.get("/users/me", headers=admin_auth_headers)
+        print(f"Get profile after update response: {response.status_code} - {response.text}")
+
+        assert response.status_code == 200
+        assert response.json()["timezone"] == "Europe/Berlin"
+
     async def test_update_current_user_forbidden_fields(self, http_client: httpx.AsyncClient, user_auth_headers: Dict[str, str]):
         """Test updating forbidden fields (role, organization_id)"""
         update_data = {
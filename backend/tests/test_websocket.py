@@ -128,4 +128,22 @@ class TestWebSocketEndpoints:
         assert response.status_code == 200
         data = response.json()
         assert "online_users" in data
-        assert isinstance(data["online_users"], list)
\ No newline at end of file
+        assert isinstance(data["online_users"], list)
+
+    async def test_websocket_room_subscription(self, test_admin_user: Dict[str, Any], test_project: Dict[str, Any]):
+        """Test that rooms are limited to projects of the user's organization"""
+        token = test_admin_user["access_token"]
+        uri = f"ws://localhost:8001/ws/{token}"
+        
+        async with websockets.connect(uri, timeout=5) as websocket:
+            await asyncio.wait_for(websocket.recv(), timeout=5)
+            
+            await websocket.send(json.dumps({"type": "subscribe", "data": {"room": f"project:{test_project['id']}"}}))
+            reply = json.loads(await asyncio.wait_for(websocket.recv(), timeout=5))
+            print(f"Subscribe reply: {reply}")
+            assert reply["type"] == "subscribed"
+            
+            await websocket.send(json.dumps({"type": "subscribe", "data": {"room": "project:not-a-project"}}))
+            reply = json.loads(await asyncio.wait_for(websocket.recv(), timeout=5))
+            print(f"Subscribe reply: {reply}")
+            assert reply["type"] == "subscribe_rejected"
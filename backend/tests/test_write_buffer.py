@@ -0,0 +1,78 @@
+"""
+Tests for the write-behind telemetry buffer
+"""
+import pytest
+import asyncio
+import uuid
+from database.mongodb import DatabaseOperations, db
+from services.write_buffer import WriteBehindBuffer
+
+@pytest.mark.asyncio
+class TestWriteBehindBuffer:
+    """Test when buffered documents are flushed to a scratch collection"""
+
+    def _buffer(self, **kwargs) -> WriteBehindBuffer:
+        self.collection = f"test_write_buffer_{uuid.uuid4().hex[:8]}"
+        return WriteBehindBuffer(collections=[self.collection], **kwargs)
+
+    async def _stored(self) -> int:
+        return await DatabaseOperations.count_documents(self.collection)
+
+    async def test_flushes_at_batch_size(self, setup_database):
+        """Test that reaching max_batch_size flushes without waiting for the interval"""
+        buffer = self._buffer(max_batch_size=3, flush_interval=60)
+        await buffer.start()
+        try:
+            await buffer.add_many(self.collection, [{"n": i} for i in range(2)])
+            await asyncio.sleep(0.1)
+            assert await self._stored() == 0
+
+            await buffer.add(self.collection, {"n": 2})
+            await asyncio.sleep(0.1)
+            assert await self._stored() == 3
+            assert buffer.pending_count() == 0
+        finally:
+            await buffer.stop()
+            await db.database[self.collection].drop()
+
+    async def test_flushes_at_interval(self, setup_database):
+        """Test that a partial batch is written after flush_interval"""
+        buffer = self._buffer(max_batch_size=100, flush_interval=0.2)
+        await buffer.start()
+        try:
+            await buffer.add_many(self.collection, [{"n": i} for i in range(5)])
+            assert await self._stored() == 0
+
+            await asyncio.sleep(0.5)
+            assert await self._stored() == 5
+            assert buffer.stats["flushed"] == 5
+        finally:
+            await buffer.stop()
+            await db.database[self.collection].drop()
+
+    async def test_stop_drains_the_buffer(self, setup_database):
+        """Test that stop() writes documents still waiting for their interval"""
+        buffer = self._buffer(max_batch_size=100, flush_interval=60)
+        await buffer.start()
+        try:
+            await buffer.add_many(self.collection, [{"n": i} for i in range(7)])
+            await buffer.stop()
+            assert await self._stored() == 7
+            assert buffer.pending_count() == 0
+        finally:
+            await db.database[self.collection].drop()
+
+    async def test_stop_counts_documents_it_could_not_write(self, setup_database, monkeypatch):
+        """Test that documents still failing on stop() are counted as lost instead of silently dropped"""
+        buffer = self._buffer(max_batch_size=100, flush_interval=60)
+        await buffer.start()
+        await buffer.add_many(self.collection, [{"n": i} for i in range(4)])
+
+        async def unavailable(*args, **kwargs):
+            raise ConnectionError("Mongo is down")
+
+        monkeypatch.setattr(DatabaseOperations, "insert_many", unavailable)
+        await buffer.stop()
+        print(f"Buffer stats: {buffer.stats}")
+        assert buffer.stats["failed"] == 4
+        assert buffer.pending_count() == 0
@@ -0,0 +1,208 @@
+"""
+Tests for cross-worker WebSocket fan-out, with several managers sharing an in-memory backplane hub
+"""
+import pytest
+import asyncio
+import json
+import msgpack
+from websocket.manager import ConnectionManager
+from websocket.backplane import InMemoryHub, InMemoryBackplane
+from websocket.activity import ActivityAggregator
+from websocket.protocol import MSGPACK_CODEC, negotiate
+
+class FakeWebSocket:
+    """Records what the manager sends"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self, subprotocol=None):
+        self.subprotocol = subprotocol
+
+    async def send_text(self, text: str):
+        self.sent.append(json.loads(text))
+
+    async def send_bytes(self, data: bytes):
+        # Kept as on the wire: short field codes and integer types
+        self.sent.append(msgpack.unpackb(data, raw=False))
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        pass
+
+async def _workers(hub: InMemoryHub, count: int):
+    workers = [ConnectionManager(backplane=InMemoryBackplane(hub), heartbeat_interval=0.2) for _ in range(count)]
+    for worker in workers:
+        await worker.start()
+    return workers
+
+@pytest.mark.asyncio
+class TestWebSocketBackplane:
+    """Test broadcasts and presence across workers"""
+
+    async def test_broadcast_reaches_other_workers_of_the_organization_only(self):
+        """Test that a broadcast on one worker reaches the organization's clients on another"""
+        first, second = await _workers(InMemoryHub(), 2)
+        try:
+            sender, colleague, outsider = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+            await first.connect(sender, "user-a", "org-1")
+            await second.connect(colleague, "user-b", "org-1")
+            await second.connect(outsider, "user-c", "org-2")
+
+            await first.broadcast_time_entry_update("user-a", "org-1", {"id": "entry-1"})
+            await asyncio.sleep(0.05)
+
+            print(f"Colleague received: {colleague.sent}")
+            assert [m["type"] for m in colleague.sent] == ["time_entry_update"]
+            assert outsider.sent == []
+        finally:
+            await first.stop()
+            await second.stop()
+
+    async def test_presence_is_shared_and_expires_with_the_worker(self):
+        """Test that online users include other workers' users until that worker stops"""
+        hub = InMemoryHub()
+        first, second = await _workers(hub, 2)
+        try:
+            await first.connect(FakeWebSocket(), "user-a", "org-1")
+            await second.connect(FakeWebSocket(), "user-b", "org-1")
+            await asyncio.sleep(0.05)
+            assert sorted(first.get_online_users("org-1")) == ["user-a", "user-b"]
+
+            # A worker started later learns the existing users without waiting for a heartbeat
+            (late,) = await _workers(hub, 1)
+            await asyncio.sleep(0.05)
+            assert sorted(late.get_online_users("org-1")) == ["user-a", "user-b"]
+            await late.stop()
+
+            await second.stop()
+            await asyncio.sleep(0.05)
+            assert first.get_online_users("org-1") == ["user-a"]
+        finally:
+            await first.stop()
+
+    async def test_users_of_a_dead_worker_go_offline(self):
+        """Test that a worker that stops heartbeating has its users announced offline after three missed heartbeats"""
+        first, second = await _workers(InMemoryHub(), 2)
+        try:
+            watcher = FakeWebSocket()
+            await first.connect(watcher, "user-a", "org-1")
+            await second.connect(FakeWebSocket(), "user-b", "org-1")
+            await asyncio.sleep(0.05)
+            assert sorted(first.get_online_users("org-1")) == ["user-a", "user-b"]
+
+            # Crash: no disconnects and no final snapshot
+            second._heartbeat.cancel()
+            await second.backplane.stop()
+            watcher.sent.clear()
+            await asyncio.sleep(1.0)
+
+            statuses = [(m["data"]["user_id"], m["data"]["status"]) for m in watcher.sent if m["type"] == "user_status_update"]
+            print(f"Status updates after the crash: {statuses}")
+            assert statuses == [("user-b", "offline")]
+            assert first.get_online_users("org-1") == ["user-a"]
+        finally:
+            await first.stop()
+
+    async def test_user_stays_online_until_the_last_socket_closes(self):
+        """Test that several sockets per user all receive user messages and share one presence"""
+        first, second = await _workers(InMemoryHub(), 2)
+        try:
+            watcher = FakeWebSocket()
+            await first.connect(watcher, "user-w", "org-1")
+            tabs = [FakeWebSocket() for _ in range(3)]
+            connections = [
+                await first.connect(tabs[0], "user-a", "org-1"),
+                await first.connect(tabs[1], "user-a", "org-1"),
+                await second.connect(tabs[2], "user-a", "org-1"),
+            ]
+            await asyncio.sleep(0.05)
+
+            await first.send_personal_message({"type": "notice"}, "user-a", "org-1")
+            await asyncio.sleep(0.05)
+            assert all([m["type"] for m in tab.sent] == ["notice"] for tab in tabs)
+
+            for connection in connections[:2]:
+                await first.disconnect(connection)
+            await asyncio.sleep(0.05)
+            assert "user-a" in first.get_online_users("org-1")
+
+            await second.disconnect(connections[2])
+            await asyncio.sleep(0.05)
+            statuses = [m["data"]["status"] for m in watcher.sent if m["type"] == "user_status_update"]
+            print(f"Status updates: {statuses}")
+            assert statuses == ["online", "offline"]
+            assert first.get_online_users("org-1") == ["user-w"]
+        finally:
+            await first.stop()
+            await second.stop()
+
+    async def test_activity_is_coalesced_into_deltas_per_tick(self):
+        """Test that many agent updates reach a manager on another worker as one delta per tick"""
+        first, second = await _workers(InMemoryHub(), 2)
+        agents, dashboards = ActivityAggregator(first, stale_after=60), ActivityAggregator(second, stale_after=60)
+        try:
+            await first.connect(FakeWebSocket(), "agent-1", "org-1")
+            screen = FakeWebSocket()
+            await dashboards.subscribe(await second.connect(screen, "manager-1", "org-1"))
+
+            for i in range(100):
+                agents.record("org-1", f"agent-{i % 10}", {"keystrokes": i})
+            await agents.tick()
+            await asyncio.sleep(0.05)
+            await dashboards.tick()
+            await asyncio.sleep(0.05)
+
+            frames = [m for m in screen.sent if m["type"].startswith("team_activity")]
+            print(f"Frames: {[(m['type'], len(m['data']['users'])) for m in frames]}")
+            assert [m["type"] for m in frames] == ["team_activity_snapshot", "team_activity_delta"]
+            delta = frames[1]["data"]
+            assert len(delta["users"]) == 10
+            assert {u["user_id"]: u["activity"]["keystrokes"] for u in delta["users"]}["agent-9"] == 99
+
+            # Users without updates expire and are reported as removed
+            await dashboards.tick(now=delta["users"][0]["updated_at"] + 61)
+            await asyncio.sleep(0.05)
+            assert len(screen.sent[-1]["data"]["removed"]) == 10
+            assert dashboards.snapshots == {}
+        finally:
+            await first.stop()
+            await second.stop()
+
+    async def test_msgpack_clients_share_broadcasts_with_json_clients(self):
+        """Test that a negotiated MessagePack client gets the same messages with short codes and epoch timestamps"""
+        (worker,) = await _workers(InMemoryHub(), 1)
+        try:
+            binary, text = FakeWebSocket(), FakeWebSocket()
+            codec = negotiate(["hubstaff.msgpack.v1"])
+            await worker.connect(binary, "user-a", "org-1", codec=codec)
+            await worker.connect(text, "user-b", "org-1")
+            assert binary.subprotocol == "hubstaff.msgpack.v1"
+
+            binary.sent.clear()
+            await worker.broadcast_time_entry_update("user-b", "org-1", {"id": "entry-1", "t": "opaque"})
+            await asyncio.sleep(0.05)
+
+            raw = codec.encode({"type": "time_entry_update", "data": {"timestamp": "2026-01-01T00:00:00"}})
+            print(f"Encoded frame: {raw!r}")
+            assert msgpack.unpackb(raw) == {"t": 5, "d": {"ts": 1767225600000}}
+
+            message = binary.sent[-1]
+            assert message["t"] == 5
+            assert isinstance(message["d"]["ts"], int)
+            assert message["d"]["te"] == {"id": "entry-1", "t": "opaque"}
+            assert text.sent[-1]["data"]["time_entry"] == message["d"]["te"]
+        finally:
+            await worker.stop()
+
+    async def test_msgpack_client_payloads_are_not_renamed(self):
+        """Test that decoding a client message only restores the envelope, never keys inside its payload"""
+        activity = {"app": "x", "s": 3, "u": "other-user", "st": "idle"}
+        message = MSGPACK_CODEC.decode(msgpack.packb({"t": 7, "d": activity}))
+        assert message == {"type": "activity_update", "data": activity}
+
+        message = MSGPACK_CODEC.decode(msgpack.packb({"t": 10, "d": {"r": "project:p1"}}))
+        assert message == {"type": "subscribe", "data": {"room": "project:p1"}}
+
+        # Unhashable type values are passed through instead of raising
+        assert MSGPACK_CODEC.decode(msgpack.packb({"t": [1], "d": {}}))["type"] == [1]
+        assert MSGPACK_CODEC.encode({"type": {"nested": 1}, "data": {}})
@@ -0,0 +1,169 @@
+"""
+CPU-bound PIL operations on screenshot bytes
+
+These are plain module-level functions so they can be pickled and run in
+the image processing pool (services/image_pool.py). They must not touch the
+database or the event loop; callers await them through ``image_pool.run``.
+"""
+import io
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image, ImageDraw, ImageFilter, features
+
+# Screenshot compression presets
+COMPRESSION_QUALITY = {
+    "low": {"quality": 60, "optimize": True},
+    "medium": {"quality": 80, "optimize": True},
+    "high": {"quality": 95, "optimize": False},
+}
+
+# Widths of the gallery derivatives generated for every screenshot
+DERIVATIVE_WIDTHS = (200, 640, 1280)
+
+# Encoder options per derivative format; AVIF is only produced when Pillow was built with it
+DERIVATIVE_FORMATS = {
+    "webp": {"format": "WEBP", "quality": 75, "method": 4},
+    "avif": {"format": "AVIF", "quality": 55, "speed": 8},
+}
+
+def _format_supported(name: str) -> bool:
+    try:
+        return bool(features.check(name))
+    except ValueError:
+        return False
+
+AVAILABLE_DERIVATIVE_FORMATS = tuple(name for name in DERIVATIVE_FORMATS if _format_supported(name))
+
+def _area_box(image: Image.Image, area: Dict[str, float]) -> Tuple[int, int, int, int]:
+    """Pixel box of an area given as fractions of the image size"""
+    x1 = int(area['x'] * image.width)
+    y1 = int(area['y'] * image.height)
+    x2 = int((area['x'] + area['width']) * image.width)
+    y2 = int((area['y'] + area['height']) * image.height)
+    return x1, y1, x2, y2
+
+def _to_rgb(image: Image.Image) -> Image.Image:
+    """Flatten transparency onto white so the image can be saved as JPEG"""
+    if image.mode in ('RGBA', 'LA'):
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        return background
+    if image.mode != 'RGB':
+        return image.convert('RGB')
+    return image
+
+def make_thumbnail(data: bytes, size: Tuple[int, int] = (200, 150), image_format: str = "JPEG",
+                   quality: int = 85) -> bytes:
+    """Downscale an image to fit ``size`` and encode it"""
+    with Image.open(io.BytesIO(data)) as image:
+        # draft() lets JPEG decode at a reduced scale instead of full resolution
+        image.draft('RGB', size)
+        image.thumbnail(size, Image.Resampling.LANCZOS)
+        if image_format == "JPEG":
+            image = _to_rgb(image)
+        output = io.BytesIO()
+        if image_format == "JPEG":
+            image.save(output, format=image_format, quality=quality)
+        else:
+            image.save(output, format=image_format, optimize=True)
+        return output.getvalue()
+
+def _downscale(image: Image.Image, width: int) -> Image.Image:
+    """Resize to ``width`` keeping the aspect ratio, using a fast integer reduce first"""
+    if image.width <= width:
+        return image
+    factor = image.width // width
+    if factor >= 2:
+        image = image.reduce(factor)
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.Resampling.LANCZOS)
+
+def make_derivatives(data: bytes, widths: Sequence[int] = DERIVATIVE_WIDTHS,
+                     formats: Sequence[str] = AVAILABLE_DERIVATIVE_FORMATS) -> Dict[str, Dict[int, bytes]]:
+    """
+    Encode downscaled copies of an image in every requested width and format
+
+    The source is decoded once: draft() lets the JPEG decoder scale by up to
+    1/8 while decoding, and each smaller width is resized from the previous
+    one. Widths larger than the source are clamped to the source width.
+    Returns {format: {width: bytes}}.
+    """
+    largest = max(widths)
+    derivatives: Dict[str, Dict[int, bytes]] = {name: {} for name in formats}
+    with Image.open(io.BytesIO(data)) as source:
+        source.draft('RGB', (largest, largest * source.height // max(source.width, 1)))
+        image = _to_rgb(source)
+        for width in sorted(set(widths), reverse=True):
+            image = _downscale(image, width)
+            for name in formats:
+                options = dict(DERIVATIVE_FORMATS[name])
+                output = io.BytesIO()
+                image.save(output, **options)
+                derivatives[name][width] = output.getvalue()
+    return derivatives
+
+def perceptual_hash(data: bytes, hash_size: int = 16) -> str:
+    """
+    Difference hash (dHash) of an image as a hex string of hash_size**2 bits
+
+    Each bit says whether a pixel of the grayscale (hash_size+1) x hash_size
+    downscale is brighter than its right neighbour, so the hash survives
+    re-encoding and tiny changes but not layout changes.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft('L', ((hash_size + 1) * 8, hash_size * 8))
+        small = image.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{value:0{hash_size * hash_size // 4}x}"
+
+def hash_similarity(first: str, second: str) -> float:
+    """Share of equal bits between two perceptual hashes of the same size (0-1)"""
+    bits = len(first) * 4
+    distance = bin(int(first, 16) ^ int(second, 16)).count("1")
+    return 1 - distance / bits
+
+def save_thumbnail(data: bytes, path: str, size: Tuple[int, int] = (200, 150)) -> bool:
+    """Write a PNG thumbnail of an image to ``path``"""
+    thumbnail = make_thumbnail(data, size, image_format="PNG")
+    with open(path, "wb") as f:
+        f.write(thumbnail)
+    return True
+
+def blur(data: bytes, blur_level: int = 3, sensitive_areas: Optional[List[Dict[str, float]]] = None) -> bytes:
+    """Gaussian-blur the given areas, or the whole image when no areas are given"""
+    with Image.open(io.BytesIO(data)) as image:
+        if sensitive_areas:
+            image.load()
+            for area in sensitive_areas:
+                box = _area_box(image, area)
+                region = image.crop(box).filter(ImageFilter.GaussianBlur(radius=blur_level))
+                image.paste(region, box[:2])
+        else:
+            image = image.filter(ImageFilter.GaussianBlur(radius=blur_level))
+        output = io.BytesIO()
+        image.save(output, format='PNG')
+        return output.getvalue()
+
+def redact(data: bytes, sensitive_areas: List[Dict[str, float]]) -> bytes:
+    """Cover the given areas with black boxes"""
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        draw = ImageDraw.Draw(image)
+        for area in sensitive_areas:
+            draw.rectangle(list(_area_box(image, area)), fill='black')
+        output = io.BytesIO()
+        image.save(output, format='PNG')
+        return output.getvalue()
+
+def compress(data: bytes, quality: str = "medium") -> bytes:
+    """Re-encode an image as JPEG using one of the COMPRESSION_QUALITY presets"""
+    with Image.open(io.BytesIO(data)) as image:
+        options = COMPRESSION_QUALITY.get(quality, COMPRESSION_QUALITY["medium"])
+        output = io.BytesIO()
+        _to_rgb(image).save(output, format='JPEG', **options)
+        return output.getvalue()
@@ -54,15 +54,16 @@ class NotificationService:
                 return {"success": False, "message": "No admins found for organization"}
             
             # Store alerts in database
-            stored_alerts = []
-            for alert in alerts:
-                alert_data = alert.dict()
-                alert_id = await DatabaseOperations.create_document(
-                    "productivity_alerts",
-                    alert_data
-                )
-                if alert_id:
-                    stored_alerts.append(alert_data)
+            alert_documents = [alert.dict() for alert in alerts]
+            insert_result = await DatabaseOperations.insert_many(
+                "productivity_alerts",
+                alert_documents
+            )
+            failed_indexes = {error["index"] for error in insert_result["errors"]}
+            stored_alerts = [
+                alert_data for index, alert_data in enumerate(alert_documents)
+                if index not in failed_indexes
+            ]
             
             # Send real-time notifications to admins
             notification_results = []
@@ -2,13 +2,13 @@ import os
 import asyncio
 from typing import Optional, Dict, List, Any
 from datetime import datetime
-from PIL import Image, ImageFilter, ImageDraw
-import io
 import base64
 import uuid
 
 from models.productivity import ScreenshotAnalysis
 from database.mongodb import DatabaseOperations
+from services.image_pool import image_pool, ImagePoolBusy
+from utils import image_ops
 
 class ScreenshotProcessor:
     """Advanced screenshot processing and analysis"""
@@ -81,17 +81,9 @@ class ScreenshotProcessor:
     ) -> bool:
         """Create thumbnail from screenshot"""
         try:
-            # Open image from bytes
-            image = Image.open(io.BytesIO(screenshot_data))
-            
-            # Create thumbnail
-            image.thumbnail(size, Image.Resampling.LANCZOS)
-            
-            # Save thumbnail
-            image.save(thumbnail_path, "PNG", optimize=True)
-            
-            return True
-            
+            return await image_pool.run(image_ops.save_thumbnail, screenshot_data, thumbnail_path, size)
+        except ImagePoolBusy:
+            raise
         except Exception as e:
             print(f"Error creating thumbnail: {e}")
             return False
@@ -105,29 +97,9 @@ class ScreenshotProcessor:
     ) -> bytes:
         """Apply privacy blur to screenshot"""
         try:
-            image = Image.open(io.BytesIO(screenshot_data))
-            
-            if sensitive_areas:
-                # Blur only specific areas
-                for area in sensitive_areas:
-                    x1 = int(area['x'] * image.width)
-                    y1 = int(area['y'] * image.height)
-                    x2 = int((area['x'] + area['width']) * image.width)
-                    y2 = int((area['y'] + area['height']) * image.height)
-                    
-                    # Extract region, blur it, and paste back
-                    region = image.crop((x1, y1, x2, y2))
-                    blurred_region = region.filter(ImageFilter.GaussianBlur(radius=blur_level))
-                    image.paste(blurred_region, (x1, y1))
-            else:
-                # Blur entire image
-                image = image.filter(ImageFilter.GaussianBlur(radius=blur_level))
-            
-            # Convert back to bytes
-            output = io.BytesIO()
-            image.save(output, format='PNG')
-            return output.getvalue()
-            
+            return await image_pool.run(image_ops.blur, screenshot_data, blur_level, sensitive_areas)
+        except ImagePoolBusy:
+            raise
         except Exception as e:
             print(f"Error applying privacy blur: {e}")
             return screenshot_data
@@ -367,23 +339,9 @@ class ScreenshotProcessor:
     ) -> bytes:
         """Redact sensitive areas with black boxes"""
         try:
-            image = Image.open(io.BytesIO(screenshot_data))
-            draw = ImageDraw.Draw(image)
-            
-            for area in sensitive_areas:
-                x1 = int(area['x'] * image.width)
-                y1 = int(area['y'] * image.height)
-                x2 = int((area['x'] + area['width']) * image.width)
-                y2 = int((area['y'] + area['height']) * image.height)
-                
-                # Draw black rectangle
-                draw.rectangle([x1, y1, x2, y2], fill='black')
-            
-            # Convert back to bytes
-            output = io.BytesIO()
-            image.save(output, format='PNG')
-            return output.getvalue()
-            
+            return await image_pool.run(image_ops.redact, screenshot_data, sensitive_areas)
+        except ImagePoolBusy:
+            raise
         except Exception as e:
             print(f"Error redacting sensitive areas: {e}")
             return screenshot_data
@@ -396,28 +354,9 @@ class ScreenshotProcessor:
     ) -> bytes:
         """Compress screenshot based on quality setting"""
         try:
-            image = Image.open(io.BytesIO(screenshot_data))
-            
-            # Quality settings
-            quality_settings = {
-                "low": {"quality": 60, "optimize": True},
-                "medium": {"quality": 80, "optimize": True},
-                "high": {"quality": 95, "optimize": False}
-            }
-            
-            settings = quality_settings.get(quality, quality_settings["medium"])
-            
-            # Compress and save
-            output = io.BytesIO()
-            if image.mode in ('RGBA', 'LA'):
-                # Convert to RGB for JPEG compression
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-                image = background
-            
-            image.save(output, format='JPEG', **settings)
-            return output.getvalue()
-            
+            return await image_pool.run(image_ops.compress, screenshot_data, quality)
+        except ImagePoolBusy:
+            raise
         except Exception as e:
             print(f"Error compressing screenshot: {e}")
             return screenshot_data
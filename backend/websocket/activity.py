@@ -0,0 +1,153 @@
+"""
+Server-side coalescing of live agent activity for manager dashboards
+
+Agents send ``activity_update`` messages as often as they like; the
+aggregator merges them into a per-organization snapshot (latest activity per
+user) and, once per tick, sends subscribers of the organization's
+``activity`` room one delta frame with the users that changed or went stale.
+A new subscriber first receives the whole snapshot.
+
+Frames carry a per-organization ``seq``; a client that sees a gap (its send
+queue dropped a frame) resubscribes to get a fresh snapshot. Changes are
+exchanged between workers once per tick through the manager's backplane, so
+every worker holds the full snapshot and serves its own subscribers.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional, Set
+
+from config import settings
+from websocket.manager import ConnectionManager, Connection, manager
+
+logger = logging.getLogger(__name__)
+
+ACTIVITY_ROOM = "activity"
+ENVELOPE_KIND = "activity"
+
+class ActivityAggregator:
+    """Per-organization activity snapshots pushed to the ``activity`` room as deltas at a fixed tick"""
+
+    def __init__(self, connections: ConnectionManager, tick_interval: float = 0.5, stale_after: float = 300):
+        self.connections = connections
+        self.tick_interval = tick_interval
+        self.stale_after = stale_after
+        # organization_id -> user_id -> {"user_id", "activity", "updated_at"}
+        self.snapshots: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # Users changed since the last tick, per organization; local ones are also sent to the other workers
+        self._changed: Dict[str, Set[str]] = {}
+        self._changed_here: Dict[str, Set[str]] = {}
+        self._seq: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.frames_sent = 0
+        self.updates_received = 0
+        connections.on_envelope(ENVELOPE_KIND, self._receive)
+
+    async def start(self):
+        """Start the tick loop (called from the application lifespan)"""
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def record(self, organization_id: str, user_id: str, activity: Dict[str, Any]):
+        """Merge an agent's activity update; it is sent with the next tick"""
+        self.updates_received += 1
+        self._merge(organization_id, user_id, activity, time.time())
+        self._changed_here.setdefault(organization_id, set()).add(user_id)
+
+    def _merge(self, organization_id: str, user_id: str, activity: Dict[str, Any], updated_at: float):
+        users = self.snapshots.setdefault(organization_id, {})
+        entry = users.get(user_id)
+        if entry and entry["updated_at"] > updated_at:
+            # An older update relayed late by another worker
+            return
+        merged = dict(entry["activity"]) if entry else {}
+        merged.update(activity)
+        users[user_id] = {"user_id": user_id, "activity": merged, "updated_at": updated_at}
+        self._changed.setdefault(organization_id, set()).add(user_id)
+
+    async def _receive(self, envelope: Dict[str, Any]):
+        """Changes recorded by another worker during its last tick"""
+        organization_id = envelope["organization_id"]
+        for entry in envelope["users"]:
+            self._merge(organization_id, entry["user_id"], entry["activity"], entry["updated_at"])
+
+    async def subscribe(self, connection: Connection):
+        """Add a connection to its organization's activity room and send it the snapshot"""
+        self.connections.join_room(connection, ACTIVITY_ROOM)
+        organization_id = connection.organization_id
+        await self.connections.send_to_connection({
+            "type": "team_activity_snapshot",
+            "data": {
+                "seq": self._seq.get(organization_id, 0),
+                "users": list(self.snapshots.get(organization_id, {}).values())
+            }
+        }, connection)
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.tick_interval)
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.error(f"Activity tick failed: {e}")
+
+    async def tick(self, now: Optional[float] = None):
+        """Share this tick's local changes, expire stale users and send one delta frame per organization"""
+        now = now if now is not None else time.time()
+        changed_here, self._changed_here = self._changed_here, {}
+        for organization_id, user_ids in changed_here.items():
+            users = self.snapshots.get(organization_id, {})
+            await self.connections.publish_to_workers(organization_id, {
+                "kind": ENVELOPE_KIND,
+                "organization_id": organization_id,
+                "users": [users[user_id] for user_id in user_ids if user_id in users]
+            })
+
+        removed: Dict[str, list] = {}
+        for organization_id, users in list(self.snapshots.items()):
+            stale = [user_id for user_id, entry in users.items() if now - entry["updated_at"] > self.stale_after]
+            for user_id in stale:
+                del users[user_id]
+            if stale:
+                removed[organization_id] = stale
+            if not users:
+                del self.snapshots[organization_id]
+
+        changed, self._changed = self._changed, {}
+        for organization_id in set(changed) | set(removed):
+            seq = self._seq.get(organization_id, 0) + 1
+            self._seq[organization_id] = seq
+            if not self.connections.room_size(organization_id, ACTIVITY_ROOM):
+                continue
+            users = self.snapshots.get(organization_id, {})
+            self.frames_sent += self.connections.deliver_to_room(organization_id, ACTIVITY_ROOM, {
+                "type": "team_activity_delta",
+                "data": {
+                    "seq": seq,
+                    "users": [users[user_id] for user_id in changed.get(organization_id, ()) if user_id in users],
+                    "removed": removed.get(organization_id, [])
+                }
+            })
+
+    def snapshot(self) -> Dict[str, int]:
+        """Counters for the health endpoint"""
+        return {
+            "organizations": len(self.snapshots),
+            "users": sum(len(users) for users in self.snapshots.values()),
+            "updates_received": self.updates_received,
+            "frames_sent": self.frames_sent
+        }
+
+# Global activity aggregator instance
+activity_aggregator = ActivityAggregator(
+    manager,
+    tick_interval=settings.WS_ACTIVITY_TICK_SECONDS,
+    stale_after=settings.WS_ACTIVITY_STALE_SECONDS
+)
@@ -0,0 +1,259 @@
+"""
+Pub/sub backplanes that carry WebSocket broadcasts and presence between workers
+
+Every worker publishes what it broadcasts and receives what the others
+publish, then fans the message out to its own connections. Messages are
+JSON envelopes on named channels (one per organization, plus a presence
+channel). A worker only subscribes to the organization channels it has
+connections for.
+
+- ``memory``: in-process; workers sharing an ``InMemoryHub`` see each
+  other, which is how tests run several managers in one process
+- ``redis``: Redis pub/sub (REDIS_URL); needs the ``redis`` package
+- ``mongo``: inserts into a TTL collection read through a change stream;
+  needs a replica set (change streams are unavailable on a standalone server)
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from pymongo.errors import OperationFailure
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+# Delay before a dropped subscription is re-established, doubled up to the maximum
+RECONNECT_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30.0
+
+# Server error (ChangeStreamHistoryLost) when a resume token has already left the oplog
+CHANGE_STREAM_HISTORY_LOST = 286
+
+class BackplaneError(Exception):
+    """Raised when a backplane cannot be configured"""
+
+class Backplane:
+    """Interface of a backplane: publish to channels and deliver subscribed ones to a handler"""
+
+    def __init__(self):
+        self.channels: Set[str] = set()
+        self._handler: Optional[Handler] = None
+
+    async def start(self, handler: Handler):
+        self._handler = handler
+
+    async def stop(self):
+        self._handler = None
+
+    async def publish(self, channel: str, envelope: Dict[str, Any]):
+        raise NotImplementedError
+
+    async def subscribe(self, channel: str):
+        self.channels.add(channel)
+
+    async def unsubscribe(self, channel: str):
+        self.channels.discard(channel)
+
+    async def _dispatch(self, channel: str, data: Any):
+        """Hand a received message to the handler; a bad message never stops the reader"""
+        if self._handler is None or channel not in self.channels:
+            return
+        try:
+            envelope = json.loads(data) if isinstance(data, (str, bytes)) else data
+            await self._handler(channel, envelope)
+        except Exception as e:
+            logger.error(f"Backplane message on {channel} failed: {e}")
+
+class InMemoryHub:
+    """Local stand-in for a broker: routes messages between the backplanes attached to it"""
+
+    def __init__(self):
+        self.subscribers: Dict[str, Set["InMemoryBackplane"]] = {}
+
+    def deliver(self, channel: str, data: str):
+        for backplane in list(self.subscribers.get(channel, ())):
+            backplane._inbox.put_nowait((channel, data))
+
+class InMemoryBackplane(Backplane):
+    """In-process backplane; messages go through JSON like on a real broker"""
+
+    def __init__(self, hub: Optional[InMemoryHub] = None):
+        super().__init__()
+        self.hub = hub or InMemoryHub()
+        self._inbox: asyncio.Queue = asyncio.Queue()
+        self._reader: Optional[asyncio.Task] = None
+
+    async def start(self, handler: Handler):
+        await super().start(handler)
+        self._reader = asyncio.create_task(self._read_loop())
+
+    async def stop(self):
+        for channel in list(self.channels):
+            await self.unsubscribe(channel)
+        if self._reader:
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+            self._reader = None
+        await super().stop()
+
+    async def publish(self, channel: str, envelope: Dict[str, Any]):
+        self.hub.deliver(channel, json.dumps(envelope))
+
+    async def subscribe(self, channel: str):
+        await super().subscribe(channel)
+        self.hub.subscribers.setdefault(channel, set()).add(self)
+
+    async def unsubscribe(self, channel: str):
+        await super().unsubscribe(channel)
+        members = self.hub.subscribers.get(channel)
+        if members is not None:
+            members.discard(self)
+            if not members:
+                del self.hub.subscribers[channel]
+
+    async def _read_loop(self):
+        while True:
+            channel, data = await self._inbox.get()
+            await self._dispatch(channel, data)
+
+class RedisBackplane(Backplane):
+    """Redis pub/sub; the subscription is re-established (with every channel) after a connection loss"""
+
+    def __init__(self, url: str):
+        super().__init__()
+        try:
+            # redis is only imported when the Redis backplane is configured
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise BackplaneError("The redis package is required for WS_BACKPLANE=redis") from e
+        self.redis = redis.from_url(url)
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+
+    async def start(self, handler: Handler):
+        await super().start(handler)
+        self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        self._reader = asyncio.create_task(self._read_loop())
+
+    async def stop(self):
+        if self._reader:
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+            self._reader = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+        await self.redis.aclose()
+        await super().stop()
+
+    async def publish(self, channel: str, envelope: Dict[str, Any]):
+        await self.redis.publish(channel, json.dumps(envelope))
+
+    async def subscribe(self, channel: str):
+        await super().subscribe(channel)
+        await self._pubsub.subscribe(channel)
+
+    async def unsubscribe(self, channel: str):
+        await super().unsubscribe(channel)
+        await self._pubsub.unsubscribe(channel)
+
+    async def _read_loop(self):
+        delay = RECONNECT_DELAY
+        while True:
+            try:
+                if not self._pubsub.subscribed:
+                    await asyncio.sleep(0.1)
+                    continue
+                message = await self._pubsub.get_message(timeout=1.0)
+                if message and message["type"] == "message":
+                    channel = message["channel"]
+                    await self._dispatch(channel.decode() if isinstance(channel, bytes) else channel, message["data"])
+                delay = RECONNECT_DELAY
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Redis backplane connection lost ({e}); resubscribing in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                try:
+                    await self._pubsub.reset()
+                    if self.channels:
+                        await self._pubsub.subscribe(*self.channels)
+                except Exception as retry_error:
+                    logger.warning(f"Redis backplane resubscribe failed: {retry_error}")
+
+class MongoBackplane(Backplane):
+    """
+    MongoDB change-stream backplane
+
+    Messages are inserted into ``collection`` (expired by a TTL index) and
+    every worker watches the inserts. The change stream covers all channels
+    and is filtered locally; it resumes from the last seen event after an
+    error, or from now when that event has left the oplog.
+    """
+
+    def __init__(self, collection: str = "ws_backplane"):
+        super().__init__()
+        self.collection = collection
+        self._reader: Optional[asyncio.Task] = None
+
+    def _collection(self):
+        from database.mongodb import db
+        return db.database[self.collection]
+
+    async def start(self, handler: Handler):
+        await super().start(handler)
+        self._reader = asyncio.create_task(self._read_loop())
+
+    async def stop(self):
+        if self._reader:
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+            self._reader = None
+        await super().stop()
+
+    async def publish(self, channel: str, envelope: Dict[str, Any]):
+        await self._collection().insert_one({
+            "channel": channel,
+            "data": json.dumps(envelope),
+            "created_at": datetime.utcnow()
+        })
+
+    async def _read_loop(self):
+        resume_token = None
+        delay = RECONNECT_DELAY
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        while True:
+            try:
+                async with self._collection().watch(pipeline, resume_after=resume_token) as stream:
+                    delay = RECONNECT_DELAY
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        document = change["fullDocument"]
+                        await self._dispatch(document["channel"], document["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if isinstance(e, OperationFailure) and e.code == CHANGE_STREAM_HISTORY_LOST:
+                    # The resume point is gone; messages published since then are lost either way
+                    logger.warning(f"Mongo backplane resume token expired ({e}); watching from now")
+                    resume_token = None
+                    continue
+                logger.warning(f"Mongo backplane change stream failed ({e}); resuming in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+def create_backplane(kind: str) -> Backplane:
+    """Backplane for the WS_BACKPLANE setting"""
+    kind = (kind or "memory").lower()
+    if kind == "memory":
+        return InMemoryBackplane()
+    if kind == "redis":
+        return RedisBackplane(settings.REDIS_URL)
+    if kind == "mongo":
+        return MongoBackplane()
+    raise BackplaneError(f"Unknown WebSocket backplane: {kind}")
@@ -1,124 +1,528 @@
-from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, List
-import json
+from fastapi import WebSocket
+from collections import OrderedDict
+from itertools import count
+from typing import Any, Dict, List, Optional, Set, Tuple
+import asyncio
 import logging
+import os
+import socket
+import time
+import uuid
 from datetime import datetime
 
+from config import settings
+from websocket.backplane import Backplane, InMemoryBackplane, create_backplane
+from websocket.protocol import Codec, Frame, Payload, JSON_CODEC
+
 logger = logging.getLogger(__name__)
 
+class Connection:
+    """
+    A WebSocket with a bounded send queue drained by its own writer task
+
+    Broadcasts only enqueue, so one slow client never delays the others.
+    When the queue is full the oldest queued message is dropped; messages
+    with a ``coalesce_key`` replace a still-queued message with the same key
+    (a newer state supersedes an unsent one). A client that stops reading
+    altogether is disconnected once a send exceeds ``send_timeout``.
+    """
+
+    def __init__(self, websocket: WebSocket, user_id: str, organization_id: str, queue_size: int, send_timeout: float, codec: Codec = JSON_CODEC):
+        self.id = uuid.uuid4().hex
+        self.websocket = websocket
+        self.codec = codec
+        self.user_id = user_id
+        self.organization_id = organization_id
+        self.rooms: Set[str] = set()
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.dropped = 0
+        self.closed = False
+        self._pending: "OrderedDict[Any, Payload]" = OrderedDict()
+        self._sequence = count()
+        self._ready = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+
+    def start(self, on_error):
+        self._writer = asyncio.create_task(self._write_loop(on_error))
+
+    @property
+    def queued(self) -> int:
+        return len(self._pending)
+
+    def enqueue(self, payload: Payload, coalesce_key: Optional[str] = None) -> bool:
+        """Queue an encoded message; returns False if the connection is closed"""
+        if self.closed:
+            return False
+        if coalesce_key is not None and coalesce_key in self._pending:
+            self._pending[coalesce_key] = payload
+            return True
+        if len(self._pending) >= self.queue_size:
+            self._pending.popitem(last=False)
+            self.dropped += 1
+        self._pending[coalesce_key if coalesce_key is not None else next(self._sequence)] = payload
+        self._ready.set()
+        return True
+
+    async def _write_loop(self, on_error):
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                while self._pending:
+                    _, payload = self._pending.popitem(last=False)
+                    send = self.websocket.send_bytes(payload) if isinstance(payload, bytes) else self.websocket.send_text(payload)
+                    await asyncio.wait_for(send, self.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Dropping WebSocket {self.id} of user {self.user_id}: {e!r}")
+            await on_error(self)
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        """Stop the writer and close the socket (unsent messages are discarded)"""
+        if self.closed:
+            return
+        self.closed = True
+        self._pending.clear()
+        if self._writer and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception:
+            # Already closed by the client
+            pass
+
 class ConnectionManager:
-    def __init__(self):
-        # Store active connections by user_id
-        self.active_connections: Dict[str, WebSocket] = {}
+    """
+    Local WebSocket connections of this worker, joined to the other workers through a backplane
+
+    A user may have any number of sockets (tabs, devices); presence is
+    reference-counted, so a user goes offline only when their last socket
+    on the last worker closes, and user-level sends reach every socket.
+    Broadcasts are delivered to local connections directly and published on
+    the organization's backplane channel for the other workers. Presence is
+    shared on one presence channel: join/leave events plus a periodic
+    snapshot of each worker's online users, so remote users of a worker that
+    died expire after three missed heartbeats; each worker then tells its own
+    connections they went offline and records the status.
+    """
+
+    def __init__(
+        self,
+        queue_size: int = 256,
+        send_timeout: float = 10,
+        backplane: Optional[Backplane] = None,
+        channel_prefix: str = "hubstaff:ws",
+        heartbeat_interval: float = 15
+    ):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.backplane = backplane or InMemoryBackplane()
+        self.channel_prefix = channel_prefix
+        self.heartbeat_interval = heartbeat_interval
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # Users online on other workers: organization_id -> user_id -> instance_id -> last seen (monotonic)
+        self.remote_presence: Dict[str, Dict[str, Dict[str, float]]] = {}
+        self._heartbeat: Optional[asyncio.Task] = None
+        # Handlers for other kinds of backplane messages (see on_envelope)
+        self._envelope_handlers: Dict[str, Any] = {}
+        # Store active connections by user_id, then connection id
+        self.active_connections: Dict[str, Dict[str, Connection]] = {}
         # Store user sessions
         self.user_sessions: Dict[str, dict] = {}
+        # Fan-out indexes: connections per organization and per (organization, room)
+        self.organizations: Dict[str, Set[Connection]] = {}
+        self.rooms: Dict[Tuple[str, str], Set[Connection]] = {}
 
-    async def connect(self, websocket: WebSocket, user_id: str):
-        """Connect a user to WebSocket"""
-        await websocket.accept()
-        self.active_connections[user_id] = websocket
-        self.user_sessions[user_id] = {
-            "connected_at": datetime.utcnow(),
-            "status": "online"
-        }
-        logger.info(f"User {user_id} connected to WebSocket")
-        
-        # Notify others about user coming online
-        await self.broadcast_user_status(user_id, "online")
+    @property
+    def presence_channel(self) -> str:
+        return f"{self.channel_prefix}:presence"
 
-    async def disconnect(self, user_id: str):
-        """Disconnect a user from WebSocket"""
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-        if user_id in self.user_sessions:
-            del self.user_sessions[user_id]
-        logger.info(f"User {user_id} disconnected from WebSocket")
-        
-        # Notify others about user going offline
-        await self.broadcast_user_status(user_id, "offline")
-
-    async def send_personal_message(self, message: dict, user_id: str):
-        """Send message to specific user"""
-        if user_id in self.active_connections:
+    def organization_channel(self, organization_id: str) -> str:
+        return f"{self.channel_prefix}:org:{organization_id}"
+
+    async def start(self):
+        """Attach to the backplane (called from the application lifespan)"""
+        await self.backplane.start(self._receive)
+        await self.backplane.subscribe(self.presence_channel)
+        # Ask the other workers for their online users instead of waiting for their next heartbeat
+        await self._publish(self.presence_channel, {"kind": "sync"})
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+        logger.info(f"WebSocket manager {self.instance_id} started")
+
+    async def stop(self):
+        await self.close_all()
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            await asyncio.gather(self._heartbeat, return_exceptions=True)
+            self._heartbeat = None
+        # An empty snapshot takes this worker's users off the others' presence right away
+        await self._publish(self.presence_channel, {"kind": "snapshot", "users": {}})
+        await self.backplane.stop()
+
+    async def _publish(self, channel: str, envelope: Dict[str, Any]):
+        """Publish to the other workers; a backplane outage only degrades to local delivery"""
+        envelope["origin"] = self.instance_id
+        try:
+            await self.backplane.publish(channel, envelope)
+        except Exception as e:
+            logger.error(f"WebSocket backplane publish to {channel} failed: {e}")
+
+    async def _subscribe(self, channel: str, subscribe: bool):
+        try:
+            if subscribe:
+                await self.backplane.subscribe(channel)
+            else:
+                await self.backplane.unsubscribe(channel)
+        except Exception as e:
+            logger.error(f"WebSocket backplane subscription change on {channel} failed: {e}")
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
             try:
-                websocket = self.active_connections[user_id]
-                await websocket.send_text(json.dumps(message))
+                await self._publish_snapshot()
+                await self._mark_offline(self._expire_remote_presence())
             except Exception as e:
-                logger.error(f"Error sending message to user {user_id}: {e}")
-                # Remove dead connection
-                await self.disconnect(user_id)
-
-    async def broadcast_message(self, message: dict, exclude_user: str = None):
-        """Broadcast message to all connected users"""
-        disconnected_users = []
-        
-        for user_id, websocket in self.active_connections.items():
-            if exclude_user and user_id == exclude_user:
-                continue
-                
+                logger.error(f"WebSocket presence heartbeat failed: {e}")
+
+    async def _publish_snapshot(self):
+        await self._publish(self.presence_channel, {
+            "kind": "snapshot",
+            "users": {org_id: sorted({c.user_id for c in members}) for org_id, members in self.organizations.items()}
+        })
+
+    def _presence_cutoff(self) -> float:
+        return time.monotonic() - 3 * self.heartbeat_interval
+
+    def _expire_remote_presence(self) -> List[Tuple[str, str]]:
+        """Forget workers not heard from for three heartbeats; returns the (organization, user) now offline"""
+        cutoff = self._presence_cutoff()
+        offline = []
+        for org_id in list(self.remote_presence):
+            users = self.remote_presence[org_id]
+            for user_id in list(users):
+                users[user_id] = {instance: seen for instance, seen in users[user_id].items() if seen >= cutoff}
+                if not users[user_id]:
+                    del users[user_id]
+                    if not self.is_user_connected_here(user_id):
+                        offline.append((org_id, user_id))
+            if not users:
+                del self.remote_presence[org_id]
+        return offline
+
+    async def _mark_offline(self, users: List[Tuple[str, str]]):
+        """Users lost with a dead worker: notify local connections and record the status"""
+        # Only sent locally: every worker expires the dead worker's users itself
+        from auth.user_cache import principal_cache
+        from database.mongodb import DatabaseOperations
+        for org_id, user_id in users:
+            self._fan_out(
+                self.organizations.get(org_id), Frame(self._user_status_message(user_id, "offline")),
+                exclude_user=user_id, coalesce_key=f"user_status:{user_id}"
+            )
             try:
-                await websocket.send_text(json.dumps(message))
+                await DatabaseOperations.update_document("users", {"id": user_id}, {"status": "offline"})
+                principal_cache.invalidate(user_id)
             except Exception as e:
-                logger.error(f"Error broadcasting to user {user_id}: {e}")
-                disconnected_users.append(user_id)
-        
-        # Clean up disconnected users
-        for user_id in disconnected_users:
-            await self.disconnect(user_id)
-
-    async def broadcast_user_status(self, user_id: str, status: str):
-        """Broadcast user status change to all connected users"""
-        message = {
+                logger.error(f"Failed to mark user {user_id} offline: {e}")
+
+    def _set_remote_presence(self, instance_id: str, organization_id: str, user_id: str, online: bool):
+        users = self.remote_presence.setdefault(organization_id, {})
+        instances = users.setdefault(user_id, {})
+        if online:
+            instances[instance_id] = time.monotonic()
+        else:
+            instances.pop(instance_id, None)
+        if not instances:
+            del users[user_id]
+        if not users:
+            del self.remote_presence[organization_id]
+
+    async def _receive(self, channel: str, envelope: Dict[str, Any]):
+        """Handle a backplane message from another worker"""
+        origin = envelope.get("origin")
+        if origin == self.instance_id:
+            return
+        kind = envelope.get("kind")
+        if kind == "broadcast":
+            organization_id = envelope["organization_id"]
+            room = envelope.get("room")
+            if envelope.get("user_id"):
+                connections = [c for c in self.active_connections.get(envelope["user_id"], {}).values()
+                               if c.organization_id == organization_id]
+            elif room:
+                connections = self.rooms.get((organization_id, room))
+            else:
+                connections = self.organizations.get(organization_id)
+            frame = Frame(json_payload=envelope["payload"])
+            self._fan_out(connections, frame, envelope.get("exclude_user"), envelope.get("coalesce_key"))
+        elif kind == "presence":
+            self._set_remote_presence(origin, envelope["organization_id"], envelope["user_id"], envelope["online"])
+        elif kind == "snapshot":
+            # A snapshot replaces everything known about the sending worker
+            for org_id in list(self.remote_presence):
+                for user_id in list(self.remote_presence.get(org_id, {})):
+                    self._set_remote_presence(origin, org_id, user_id, False)
+            for org_id, user_ids in (envelope.get("users") or {}).items():
+                for user_id in user_ids:
+                    self._set_remote_presence(origin, org_id, user_id, True)
+        elif kind == "sync":
+            await self._publish_snapshot()
+        elif kind in self._envelope_handlers:
+            await self._envelope_handlers[kind](envelope)
+
+    def on_envelope(self, kind: str, handler):
+        """Register ``handler(envelope)`` for backplane messages of ``kind`` from other workers"""
+        self._envelope_handlers[kind] = handler
+
+    async def publish_to_workers(self, organization_id: str, envelope: Dict[str, Any]):
+        """Send an envelope to the other workers with connections in the organization"""
+        await self._publish(self.organization_channel(organization_id), envelope)
+
+    async def _publish_presence(self, organization_id: str, user_id: str, online: bool):
+        await self._publish(self.presence_channel, {
+            "kind": "presence", "organization_id": organization_id, "user_id": user_id, "online": online
+        })
+
+    async def connect(self, websocket: WebSocket, user_id: str, organization_id: str, codec: Codec = JSON_CODEC) -> Connection:
+        """Connect a user to WebSocket, speaking the wire format negotiated for it"""
+        await websocket.accept(subprotocol=codec.subprotocol)
+        connection = Connection(websocket, user_id, organization_id, self.queue_size, self.send_timeout, codec)
+        was_online = self.is_user_online(user_id)
+        first_here = user_id not in self.active_connections
+
+        self.active_connections.setdefault(user_id, {})[connection.id] = connection
+        if organization_id not in self.organizations:
+            await self._subscribe(self.organization_channel(organization_id), True)
+        self.organizations.setdefault(organization_id, set()).add(connection)
+        session = self.user_sessions.setdefault(user_id, {
+            "connected_at": datetime.utcnow(),
+            "status": "online",
+            "connections": 0
+        })
+        session["connections"] += 1
+        connection.start(self.disconnect)
+        logger.info(f"User {user_id} connected to WebSocket ({connection.id}, {session['connections']} here)")
+
+        if first_here:
+            await self._publish_presence(organization_id, user_id, True)
+        # Notify others about user coming online
+        if not was_online:
+            await self.broadcast_user_status(user_id, organization_id, "online")
+        return connection
+
+    def _unindex(self, connection: Connection) -> bool:
+        """Remove a connection from every index; False if it was no longer registered"""
+        user_connections = self.active_connections.get(connection.user_id, {})
+        if user_connections.get(connection.id) is not connection:
+            return False
+        del user_connections[connection.id]
+        if user_connections:
+            self.user_sessions[connection.user_id]["connections"] -= 1
+        else:
+            del self.active_connections[connection.user_id]
+            self.user_sessions.pop(connection.user_id, None)
+        members = self.organizations.get(connection.organization_id)
+        if members is not None:
+            members.discard(connection)
+            if not members:
+                del self.organizations[connection.organization_id]
+        for room in list(connection.rooms):
+            self._leave(connection, room)
+        return True
+
+    async def disconnect(self, connection: Connection):
+        """Disconnect a user from WebSocket"""
+        registered = self._unindex(connection)
+        await connection.close()
+        if not registered:
+            return
+        logger.info(f"User {connection.user_id} disconnected from WebSocket ({connection.id})")
+        if connection.organization_id not in self.organizations:
+            await self._subscribe(self.organization_channel(connection.organization_id), False)
+        if self.is_user_connected_here(connection.user_id):
+            return
+        await self._publish_presence(connection.organization_id, connection.user_id, False)
+
+        # Notify others about user going offline (unless still connected through another worker)
+        if not self.is_user_online(connection.user_id):
+            await self.broadcast_user_status(connection.user_id, connection.organization_id, "offline")
+
+    def join_room(self, connection: Connection, room: str):
+        """Subscribe a connection to a room of its organization"""
+        connection.rooms.add(room)
+        self.rooms.setdefault((connection.organization_id, room), set()).add(connection)
+
+    def leave_room(self, connection: Connection, room: str):
+        if room in connection.rooms:
+            self._leave(connection, room)
+
+    def _leave(self, connection: Connection, room: str):
+        connection.rooms.discard(room)
+        key = (connection.organization_id, room)
+        members = self.rooms.get(key)
+        if members is not None:
+            members.discard(connection)
+            if not members:
+                del self.rooms[key]
+
+    def _fan_out(self, connections, frame: Frame, exclude_user: Optional[str] = None, coalesce_key: Optional[str] = None) -> int:
+        """Queue a frame on every connection, encoded once per wire format; returns the number of recipients"""
+        if not connections:
+            return 0
+        delivered = 0
+        for connection in list(connections):
+            if exclude_user and connection.user_id == exclude_user:
+                continue
+            if connection.enqueue(frame.encode(connection.codec), coalesce_key):
+                delivered += 1
+        return delivered
+
+    async def send_personal_message(self, message: dict, user_id: str, organization_id: Optional[str] = None) -> int:
+        """
+        Send message to every socket of a user
+
+        With ``organization_id`` the message also reaches the user's sockets on other workers.
+        """
+        frame = Frame(message)
+        delivered = self._fan_out(self.active_connections.get(user_id, {}).values(), frame)
+        if organization_id:
+            await self._publish(self.organization_channel(organization_id), {
+                "kind": "broadcast",
+                "organization_id": organization_id,
+                "user_id": user_id,
+                "payload": frame.encode(JSON_CODEC)
+            })
+        return delivered
+
+    async def send_to_connection(self, message: dict, connection: Connection) -> bool:
+        """Send message to one socket (replies to that socket's own requests)"""
+        return connection.enqueue(connection.codec.encode(message))
+
+    async def broadcast_to_organization(self, organization_id: str, message: dict, exclude_user: Optional[str] = None, coalesce_key: Optional[str] = None) -> int:
+        """Broadcast message to the connected users of an organization, on every worker"""
+        return await self._broadcast(organization_id, None, message, exclude_user, coalesce_key)
+
+    async def broadcast_to_room(self, organization_id: str, room: str, message: dict, exclude_user: Optional[str] = None, coalesce_key: Optional[str] = None) -> int:
+        """Broadcast message to the connections subscribed to a room of an organization, on every worker"""
+        return await self._broadcast(organization_id, room, message, exclude_user, coalesce_key)
+
+    async def _broadcast(self, organization_id: str, room: Optional[str], message: dict, exclude_user: Optional[str], coalesce_key: Optional[str]) -> int:
+        """Serialize once per wire format, deliver locally and publish the JSON encoding to the other workers"""
+        frame = Frame(message)
+        connections = self.rooms.get((organization_id, room)) if room else self.organizations.get(organization_id)
+        delivered = self._fan_out(connections, frame, exclude_user, coalesce_key)
+        await self._publish(self.organization_channel(organization_id), {
+            "kind": "broadcast",
+            "organization_id": organization_id,
+            "room": room,
+            "payload": frame.encode(JSON_CODEC),
+            "exclude_user": exclude_user,
+            "coalesce_key": coalesce_key
+        })
+        return delivered
+
+    def _user_status_message(self, user_id: str, status: str) -> dict:
+        return {
             "type": "user_status_update",
             "data": {
                 "user_id": user_id,
                 "status": status,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": datetime.utcnow()
             }
         }
-        await self.broadcast_message(message, exclude_user=user_id)
 
-    async def broadcast_time_entry_update(self, user_id: str, time_entry_data: dict):
+    async def broadcast_user_status(self, user_id: str, organization_id: str, status: str):
+        """Broadcast user status change to the user's organization"""
+        message = self._user_status_message(user_id, status)
+        await self.broadcast_to_organization(organization_id, message, exclude_user=user_id, coalesce_key=f"user_status:{user_id}")
+
+    async def broadcast_time_entry_update(self, user_id: str, organization_id: str, time_entry_data: dict):
         """Broadcast time entry updates"""
         message = {
             "type": "time_entry_update",
             "data": {
                 "user_id": user_id,
                 "time_entry": time_entry_data,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": datetime.utcnow()
             }
         }
-        await self.broadcast_message(message)
+        await self.broadcast_to_organization(organization_id, message)
 
     async def broadcast_project_update(self, project_data: dict):
-        """Broadcast project updates"""
+        """Broadcast project updates to the project's subscribers"""
         message = {
             "type": "project_update",
             "data": {
                 "project": project_data,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": datetime.utcnow()
             }
         }
-        await self.broadcast_message(message)
+        await self.broadcast_to_room(project_data["organization_id"], f"project:{project_data['id']}", message)
 
-    async def broadcast_team_activity(self, activity_data: dict):
-        """Broadcast team activity updates"""
-        message = {
-            "type": "team_activity",
-            "data": {
-                "activity": activity_data,
-                "timestamp": datetime.utcnow().isoformat()
-            }
-        }
-        await self.broadcast_message(message)
+    def room_size(self, organization_id: str, room: str) -> int:
+        """Number of local connections in a room"""
+        return len(self.rooms.get((organization_id, room), ()))
 
-    def get_online_users(self) -> List[str]:
-        """Get list of online user IDs"""
-        return list(self.active_connections.keys())
+    def deliver_to_room(self, organization_id: str, room: str, message: dict) -> int:
+        """Send message to the room's connections on this worker only"""
+        return self._fan_out(self.rooms.get((organization_id, room)), Frame(message))
+
+    def get_online_users(self, organization_id: Optional[str] = None) -> List[str]:
+        """Get list of online user IDs on every worker (of one organization, if given)"""
+        # Stale entries are skipped here and expired (with notifications) by the heartbeat
+        cutoff = self._presence_cutoff()
+        if organization_id is None:
+            users = list(self.active_connections.keys())
+            org_users = self.remote_presence.values()
+        else:
+            users = [connection.user_id for connection in self.organizations.get(organization_id, ())]
+            org_users = [self.remote_presence.get(organization_id, {})]
+        remote = [user_id for members in org_users for user_id, instances in members.items()
+                  if any(seen >= cutoff for seen in instances.values())]
+        return list(dict.fromkeys(users + remote))
 
     def is_user_online(self, user_id: str) -> bool:
-        """Check if user is online"""
+        """Check if user is online on any worker"""
+        return user_id in self.get_online_users()
+
+    def is_user_connected_here(self, user_id: str) -> bool:
+        """Check if user has a connection on this worker"""
         return user_id in self.active_connections
 
+    def _all_connections(self) -> List[Connection]:
+        return [connection for user_connections in self.active_connections.values() for connection in user_connections.values()]
+
+    def snapshot(self) -> Dict[str, int]:
+        """Connection and queue counters for the health endpoint"""
+        connections = self._all_connections()
+        return {
+            "connections": len(connections),
+            "users": len(self.active_connections),
+            "organizations": len(self.organizations),
+            "rooms": len(self.rooms),
+            "remote_users": sum(len(users) for users in self.remote_presence.values()),
+            "queued": sum(connection.queued for connection in connections),
+            "dropped": sum(connection.dropped for connection in connections)
+        }
+
+    async def close_all(self):
+        """Close every connection (called on shutdown)"""
+        connections = self._all_connections()
+        self.active_connections.clear()
+        self.user_sessions.clear()
+        self.organizations.clear()
+        self.rooms.clear()
+        await asyncio.gather(*(connection.close(code=1001, reason="Server shutting down") for connection in connections))
+
 # Create global instance
-manager = ConnectionManager()
\ No newline at end of file
+manager = ConnectionManager(
+    queue_size=settings.WS_SEND_QUEUE_SIZE,
+    send_timeout=settings.WS_SEND_TIMEOUT_SECONDS,
+    backplane=create_backplane(settings.WS_BACKPLANE),
+    channel_prefix=settings.WS_BACKPLANE_CHANNEL_PREFIX,
+    heartbeat_interval=settings.WS_PRESENCE_HEARTBEAT_SECONDS
+)
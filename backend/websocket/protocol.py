@@ -0,0 +1,191 @@
+"""
+WebSocket wire formats
+
+JSON text frames stay the default. A client may instead request the
+``hubstaff.msgpack.v1`` subprotocol (``Sec-WebSocket-Protocol``) and then
+exchanges MessagePack binary frames where:
+
+- protocol field names are replaced by the short codes in ``FIELD_CODES``
+  (payloads supplied by clients, such as ``activity``, are left untouched);
+  messages from clients only use codes for the envelope (``t``/``d``) and
+  the top-level keys of ``d``, and the ``d`` of ``activity_update`` and
+  ``time_entry_update`` is passed through as sent
+- known message types are replaced by the integers in ``TYPE_CODES``
+- timestamps are integer milliseconds since the epoch (UTC)
+
+A ``Frame`` is encoded at most once per wire format, however many
+connections it is sent to.
+"""
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional, Union
+
+import msgpack
+
+Payload = Union[str, bytes]
+
+FIELD_CODES = {
+    "type": "t",
+    "data": "d",
+    "user_id": "u",
+    "organization_id": "o",
+    "connection_id": "c",
+    "timestamp": "ts",
+    "updated_at": "at",
+    "status": "st",
+    "room": "r",
+    "seq": "s",
+    "users": "us",
+    "removed": "rm",
+    "online_users": "ou",
+    "activity": "a",
+    "time_entry": "te",
+    "project": "p",
+}
+FIELD_NAMES = {code: name for name, code in FIELD_CODES.items()}
+
+TYPE_CODES = {
+    "connection_established": 1,
+    "ping": 2,
+    "pong": 3,
+    "user_status_update": 4,
+    "time_entry_update": 5,
+    "project_update": 6,
+    "activity_update": 7,
+    "team_activity_snapshot": 8,
+    "team_activity_delta": 9,
+    "subscribe": 10,
+    "subscribed": 11,
+    "subscribe_rejected": 12,
+    "unsubscribe": 13,
+    "unsubscribed": 14,
+}
+TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+
+# Values sent as they were received, without renaming their keys
+OPAQUE_FIELDS = {"activity", "time_entry", "project"}
+# Client messages whose data is passed through as sent
+OPAQUE_TYPES = {"activity_update", "time_entry_update"}
+ENVELOPE_FIELDS = {"type", "data"}
+TIMESTAMP_FIELDS = {"timestamp", "updated_at"}
+
+def _json_default(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def epoch_ms(value: Any) -> Any:
+    """Milliseconds since the epoch for a datetime, ISO string or epoch seconds; other values unchanged"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            # Timestamps are built with utcnow()
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp() * 1000)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value * 1000)
+    return value
+
+def _compact(value: Any) -> Any:
+    if isinstance(value, dict):
+        compacted = {}
+        for key, item in value.items():
+            if key in TIMESTAMP_FIELDS:
+                item = epoch_ms(item)
+            elif key == "type" and isinstance(item, str) and item in TYPE_CODES:
+                item = TYPE_CODES[item]
+            elif key not in OPAQUE_FIELDS:
+                item = _compact(item)
+            compacted[FIELD_CODES.get(key, key)] = item
+        return compacted
+    if isinstance(value, list):
+        return [_compact(item) for item in value]
+    return value
+
+def _expand(message: Any) -> Any:
+    """Restore the envelope of a client message; the payload is never renamed below its top level"""
+    if not isinstance(message, dict):
+        return message
+    expanded = {}
+    for key, item in message.items():
+        name = FIELD_NAMES.get(key)
+        expanded[name if name in ENVELOPE_FIELDS else key] = item
+    message_type = expanded.get("type")
+    if isinstance(message_type, int) and message_type in TYPE_NAMES:
+        expanded["type"] = message_type = TYPE_NAMES[message_type]
+    data = expanded.get("data")
+    opaque = isinstance(message_type, str) and message_type in OPAQUE_TYPES
+    if isinstance(data, dict) and not opaque:
+        expanded["data"] = {FIELD_NAMES.get(key, key): item for key, item in data.items()}
+    return expanded
+
+class Codec:
+    """A wire format: ``subprotocol`` is what the client requests (None for the default)"""
+
+    name = ""
+    subprotocol: Optional[str] = None
+
+    def encode(self, message: Dict[str, Any]) -> Payload:
+        raise NotImplementedError
+
+    def decode(self, data: Payload) -> Dict[str, Any]:
+        raise NotImplementedError
+
+class JsonCodec(Codec):
+    name = "json"
+
+    def encode(self, message: Dict[str, Any]) -> str:
+        return json.dumps(message, default=_json_default)
+
+    def decode(self, data: Payload) -> Dict[str, Any]:
+        return json.loads(data)
+
+class MsgpackCodec(Codec):
+    name = "msgpack"
+    subprotocol = "hubstaff.msgpack.v1"
+
+    def encode(self, message: Dict[str, Any]) -> bytes:
+        return msgpack.packb(_compact(message), use_bin_type=True, default=_json_default)
+
+    def decode(self, data: Payload) -> Dict[str, Any]:
+        if isinstance(data, str):
+            # Text frames are always JSON
+            return json.loads(data)
+        return _expand(msgpack.unpackb(data, raw=False))
+
+JSON_CODEC = JsonCodec()
+MSGPACK_CODEC = MsgpackCodec()
+CODECS = {codec.subprotocol: codec for codec in (MSGPACK_CODEC,)}
+
+def negotiate(requested: Iterable[str]) -> Codec:
+    """First supported subprotocol in the client's order of preference, else JSON"""
+    for subprotocol in requested or ():
+        codec = CODECS.get(subprotocol.strip())
+        if codec:
+            return codec
+    return JSON_CODEC
+
+class Frame:
+    """A message with its encodings, computed once per codec"""
+
+    def __init__(self, message: Optional[Dict[str, Any]] = None, json_payload: Optional[str] = None):
+        self._message = message
+        self._encoded: Dict[str, Payload] = {}
+        if json_payload is not None:
+            self._encoded[JSON_CODEC.name] = json_payload
+
+    @property
+    def message(self) -> Dict[str, Any]:
+        if self._message is None:
+            self._message = json.loads(self._encoded[JSON_CODEC.name])
+        return self._message
+
+    def encode(self, codec: Codec) -> Payload:
+        payload = self._encoded.get(codec.name)
+        if payload is None:
+            payload = self._encoded[codec.name] = codec.encode(self.message)
+        return payload
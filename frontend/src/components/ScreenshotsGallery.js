@@ -114,6 +114,12 @@ export const ScreenshotsGallery = ({ user }) => {
     return date.toLocaleString();
   };
 
+  // derivatives: { "200": url, "640": url, ... } -> "url 200w, url 640w, ..."
+  const buildSrcSet = (derivatives) => Object.entries(derivatives)
+    .sort(([a], [b]) => Number(a) - Number(b))
+    .map(([width, url]) => `${url} ${width}w`)
+    .join(', ');
+
   const getActivityLevelColor = (level) => {
     if (level >= 80) return 'text-green-600 bg-green-100';
     if (level >= 60) return 'text-yellow-600 bg-yellow-100';
@@ -233,15 +239,26 @@ export const ScreenshotsGallery = ({ user }) => {
                   {/* Screenshot Preview */}
                   <div className="aspect-video bg-gray-100 relative overflow-hidden">
                     {screenshot.thumbnail_url ? (
-                      <img
-                        src={screenshot.thumbnail_url}
-                        alt={`Screenshot by ${screenshot.user_name}`}
-                        className="w-full h-full object-cover group-hover:scale-105 transition-transform duration-200"
-                        onError={(e) => {
-                          e.target.style.display = 'none';
-                          e.target.nextElementSibling.style.display = 'flex';
-                        }}
-                      />
+                      <picture className="contents">
+                        {['avif', 'webp'].filter((format) => screenshot.derivatives?.[format]).map((format) => (
+                          <source
+                            key={format}
+                            type={`image/${format}`}
+                            srcSet={buildSrcSet(screenshot.derivatives[format])}
+                            sizes="(min-width: 1280px) 25vw, (min-width: 1024px) 33vw, (min-width: 640px) 50vw, 100vw"
+                          />
+                        ))}
+                        <img
+                          src={screenshot.thumbnail_url}
+                          alt={`Screenshot by ${screenshot.user_name}`}
+                          loading="lazy"
+                          className="w-full h-full object-cover group-hover:scale-105 transition-transform duration-200"
+                          onError={(e) => {
+                            e.target.style.display = 'none';
+                            e.target.closest('picture').nextElementSibling.style.display = 'flex';
+                          }}
+                        />
+                      </picture>
                     ) : null}
                     <div className="w-full h-full flex items-center justify-center text-gray-400" style={{ display: screenshot.thumbnail_url ? 'none' : 'flex' }}>
                       <div className="text-center">